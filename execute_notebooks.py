@@ -0,0 +1,511 @@
+"""
+Command-line tool that executes the notebooks of the book with a cell-level
+cache of the outputs, running the notebooks on a pool of processes.
+(c) 2022 Minireferece Co. - MIT License
+
+The book build doesn't need this tool: `jupyter-book build .` executes the
+notebooks itself (see `execute_notebooks: cache` in `_config.yml`). Use it to
+refresh the outputs stored in the notebooks quickly while editing them.
+
+Usage:
+    python execute_notebooks.py                       # execute the notebooks in _toc.yml
+    python execute_notebooks.py --jobs 4 --timings 20 # show the 20 slowest cells
+    python execute_notebooks.py notebooks/28_random_samples.ipynb --force
+
+Each code cell is keyed on the hash of its source, the keys of the upstream
+cells it depends on, and the environment of the notebook: the kernel, the source
+code of the local modules it imports (`plot_helpers.py`, `data_helpers.py`, ...),
+and the contents of the data files it mentions. The upstream cells of a cell are
+  - for each name it uses, the last earlier cell that assigned or used that name
+    (names bound by imports, `def`, and `class` are treated as read-only, and
+    using a function also uses the global names that the function reads),
+  - the previous cell that uses random numbers (the global random state), and
+  - the previous cell with effects that can't be analyzed (shell commands, most
+    magics including `%pip` and `%run`, changes of settings like `os.chdir` or
+    `plt.rc`, assignments to attributes of modules, functions, and classes like
+    `ph.EXPORT_DPI = 150`, and calls to the module functions that change
+    settings like `ph.set_render_backend(...)`), which itself depends on all
+    the cells above it and invalidates all the cells below it.
+The cells whose key is not in the cache are executed together with the upstream
+cells they need to rebuild the kernel state, and the other cells get their
+cached outputs, so editing one cell only re-runs the cells affected by the edit.
+Notebooks that are fully cached are written without starting a kernel.
+Use `--no-deps` to key each cell on all the cells above it instead.
+The executed notebooks are written in place (or to `--output-dir`), with their
+cells numbered consecutively, and the outputs are stored in CACHE_DIR.
+"""
+import argparse
+import ast
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TOC = os.path.join(HERE, "_toc.yml")
+CACHE_DIR = os.environ.get("EXECUTE_NOTEBOOKS_CACHE_DIR", os.path.join(HERE, ".nbcache"))
+CACHE_FORMAT_VERSION = 1
+DEFAULT_TIMEOUT = 600     # seconds per cell
+
+# magics that don't change the state used by other cells
+SAFE_MAGICS = {"matplotlib", "config", "time", "timeit", "precision"}
+# cells that use or reset the global random state
+RANDOM_PATTERN = re.compile(r"\.rvs\(|\brandom\b|\bseed\(|\bshuffle\(|\bchoice\(|\.sample\(")
+# calls that change settings used by all later cells
+GLOBAL_PATTERN = re.compile(r"\bos\.chdir\(|\bsys\.path\b|\bwarnings\.|\bsns\.set|\bplt\.rc|"
+                            r"\bplt\.style\.|\bmatplotlib\.rc|\bpd\.set_option\(|\bnp\.set_printoptions\(")
+# names of the module functions that change the state of the module
+MUTATING_CALL_PATTERN = re.compile(r"^(set_\w*|use|seed|reset\w*|\w*clear\w*|enable\w*|disable\w*|register\w*|reload)$")
+
+
+# Notebook analysis
+################################################################################
+
+def toc_notebooks(toc_path=DEFAULT_TOC):
+    """
+    Returns the paths of the notebooks listed in the Jupyter Book `toc_path`.
+    """
+    with open(toc_path) as tocfile:
+        files = re.findall(r"^\s*-?\s*(?:file|root):\s*(\S+)", tocfile.read(), re.MULTILINE)
+    tocdir = os.path.dirname(os.path.abspath(toc_path))
+    paths = [os.path.join(tocdir, f) for f in files]
+    return [path for path in paths if path.endswith(".ipynb") and os.path.exists(path)]
+
+
+def _strip_magics(source):
+    """
+    Returns the Python code of the cell `source` without the IPython magics and
+    shell commands, and whether it contains any unsafe ones (see SAFE_MAGICS).
+    """
+    lines, unsafe = [], False
+    for line in source.splitlines():
+        stripped = line.lstrip()
+        if stripped.startswith(("%", "!")):
+            magic = stripped.lstrip("%!").split(" ")[0]
+            if stripped.startswith("!") or magic not in SAFE_MAGICS:
+                unsafe = True
+            line = line[:len(line)-len(stripped)] + "pass"
+        elif stripped.endswith("?") and not stripped.startswith("#"):
+            line = line[:len(line)-len(stripped)] + "pass"    # help?
+        elif re.match(r"^\w+\s*=\s*[%!]", stripped):
+            unsafe = True                                     # files = !ls
+            line = line[:len(line)-len(stripped)] + "pass"
+        lines.append(line)
+    return "\n".join(lines), unsafe
+
+
+def _global_reads(node):
+    """
+    Returns the names that the function or class definition `node` reads but
+    doesn't bind, i.e., the global names it uses when it is called.
+    """
+    loads, bound = set(), {node.name}
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name):
+            (loads if isinstance(child.ctx, ast.Load) else bound).add(child.id)
+        elif isinstance(child, ast.arg):
+            bound.add(child.arg)
+        elif isinstance(child, (ast.Import, ast.ImportFrom)):
+            bound.update((alias.asname or alias.name).split(".")[0] for alias in child.names)
+        elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and child is not node:
+            bound.add(child.name)
+    return loads - bound
+
+
+def _root_name(node):
+    """
+    Returns the name at the root of the attribute chain `node` (e.g. "np" for
+    `np.random.seed`), or None.
+    """
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def analyze_cell(source):
+    """
+    Returns a dict with the sets of names that the cell `source` `binds` (by
+    assignment, import, def, or class), `reads`, `readonly` (bound by import,
+    def, or class), and `mutates` (the names whose attributes it assigns or
+    whose state-changing functions it calls, see MUTATING_CALL_PATTERN), the
+    dict `functions` {name: global names read} of the functions and classes it
+    defines, the set of string literals it contains, and the flags `random`
+    and `barrier` (the cell has effects that can't be analyzed).
+    """
+    code, unsafe = _strip_magics(source)
+    info = {"binds": set(), "reads": set(), "readonly": set(), "mutates": set(), "functions": {},
+            "strings": set(), "random": bool(RANDOM_PATTERN.search(code)),
+            "barrier": unsafe or bool(GLOBAL_PATTERN.search(code))}
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        info["barrier"] = True
+        info["strings"] = set(re.findall(r"[\"']([^\"'\n]+)[\"']", source))
+        return info
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                info["reads"].add(node.id)
+            else:
+                info["binds"].add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                name = (alias.asname or alias.name).split(".")[0]
+                info["binds"].add(name)
+                info["readonly"].add(name)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            info["binds"].add(node.name)
+            info["readonly"].add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            info["barrier"] = True
+        elif isinstance(node, ast.Attribute) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            info["mutates"].add(_root_name(node))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) \
+                and MUTATING_CALL_PATTERN.match(node.func.attr):
+            info["mutates"].add(_root_name(node.func))
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            info["strings"].add(node.value)
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            info["functions"][node.name] = _global_reads(node)
+    return info
+
+
+def _with_function_globals(names, function_reads):
+    """
+    Returns the `names` together with the global names read by the functions
+    among them (and by the functions those read, recursively).
+    """
+    names, todo = set(names), list(names)
+    while todo:
+        for name in function_reads.get(todo.pop(), ()):
+            if name not in names:
+                names.add(name)
+                todo.append(name)
+    return names
+
+
+def cell_dependencies(infos, dependencies=True):
+    """
+    Returns the list of the indices of the upstream cells of each code cell,
+    given the `analyze_cell` infos of the code cells in order.
+    With `dependencies=False`, each cell depends on the previous cell.
+    """
+    if not dependencies:
+        return [[i-1] if i > 0 else [] for i in range(len(infos))]
+    deps = []
+    last_writer = {}     # name --> index of the last cell that bound or used it
+    readonly = set()     # names bound by the last import/def/class
+    function_reads = {}  # function or class name --> global names it reads
+    last_random = last_barrier = None
+    for i, info in enumerate(infos):
+        reads = _with_function_globals(info["reads"], function_reads)
+        names = info["binds"] | reads
+        # changing a module, function, or class affects all the cells that use it
+        barrier = info["barrier"] or bool(info.get("mutates", set()) & (readonly | info["readonly"]))
+        if barrier:
+            upstream = set(range(0, i))
+        else:
+            upstream = {last_writer[name] for name in names if name in last_writer}
+            if last_barrier is not None:
+                upstream.add(last_barrier)
+        if info["random"] and last_random is not None:
+            upstream.add(last_random)
+        deps.append(sorted(upstream))
+        # update the writers: binding a name, or using a name that isn't read-only
+        readonly -= info["binds"] - info["readonly"]
+        readonly |= info["readonly"]
+        for name in info["binds"]:
+            last_writer[name] = i
+            if name in info.get("functions", {}):
+                function_reads[name] = info["functions"][name]
+            else:
+                function_reads.pop(name, None)
+        for name in reads - readonly:
+            last_writer[name] = i
+        if info["random"]:
+            last_random = i
+        if barrier:
+            last_barrier = i
+    return deps
+
+
+def _file_digest(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _local_modules(names, nbdir, found=None):
+    """
+    Returns the dict {module name: path} of the local modules in `nbdir`
+    imported by the cells (the module `names`), and recursively by those modules.
+    """
+    found = {} if found is None else found
+    for name in sorted(names):
+        path = os.path.join(nbdir, name + ".py")
+        if name in found or not os.path.isfile(path):
+            continue
+        found[name] = path
+        with open(path) as modfile:
+            imported = re.findall(r"^\s*(?:from|import)\s+(\w+)", modfile.read(), re.MULTILINE)
+        _local_modules(imported, nbdir, found)
+    return found
+
+
+def _dataset_files(strings, nbdir, modules):
+    """
+    Returns the paths of the data files mentioned in the string literals `strings`:
+    paths relative to `nbdir`, and dataset names when `data_helpers` is imported.
+    """
+    resolve = None
+    if "data_helpers" in modules:
+        try:
+            spec = importlib.util.spec_from_file_location("_nb_data_helpers", modules["data_helpers"])
+            data_helpers = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(data_helpers)
+            resolve = data_helpers._resolve
+        except Exception:
+            pass
+    paths = set()
+    for string in strings:
+        if len(string) > 200 or "\n" in string or string.startswith(("http:", "https:")):
+            continue
+        path = os.path.join(nbdir, string)
+        if os.path.isfile(path):
+            paths.add(os.path.abspath(path))
+        elif resolve is not None:
+            try:
+                paths.add(resolve(string)[0])
+            except Exception:
+                pass
+    return sorted(paths)
+
+
+def environment_fingerprint(nb, infos, nbdir):
+    """
+    Hash of the kernel of the notebook `nb`, and the local modules and data files its cells use.
+    """
+    names = set().union(*[info["binds"] | info["reads"] for info in infos]) if infos else set()
+    strings = set().union(*[info["strings"] for info in infos]) if infos else set()
+    modules = _local_modules(names, nbdir)
+    parts = [str(CACHE_FORMAT_VERSION), nb.metadata.get("kernelspec", {}).get("name", "python3")]
+    for name, path in sorted(modules.items()):
+        parts.append(name + ":" + _file_digest(path))
+    for path in _dataset_files(strings, nbdir, modules):
+        parts.append(os.path.relpath(path, nbdir) + ":" + _file_digest(path))
+    return hashlib.sha256("|".join(parts).encode("utf8")).hexdigest()
+
+
+def cell_keys(sources, deps, env):
+    """
+    Returns the cache key of each cell, given their `sources`, the indices of
+    their upstream cells `deps`, and the `env` fingerprint.
+    """
+    keys = []
+    for source, upstream in zip(sources, deps):
+        chain = "|".join([env, source] + [keys[j] for j in upstream])
+        keys.append(hashlib.sha256(chain.encode("utf8")).hexdigest())
+    return keys
+
+
+
+# Cell cache
+################################################################################
+
+def _cache_path(key, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, key[:2], key + ".json")
+
+
+def cache_get(key, cache_dir=CACHE_DIR):
+    """
+    Returns the cached outputs of the cell with the given `key`, or None.
+    """
+    try:
+        with open(_cache_path(key, cache_dir)) as cachefile:
+            return json.load(cachefile)["outputs"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def cache_put(key, outputs, elapsed, cache_dir=CACHE_DIR):
+    """
+    Store the `outputs` of a cell (written atomically, so concurrent builds can share the cache).
+    """
+    path = _cache_path(key, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmppath = path + "." + str(os.getpid()) + ".tmp"
+    with open(tmppath, "w") as cachefile:
+        json.dump({"outputs": outputs, "elapsed": elapsed}, cachefile)
+    os.replace(tmppath, path)
+
+
+
+# Execution
+################################################################################
+
+def _has_error(outputs):
+    return any(output.get("output_type") == "error" for output in outputs)
+
+
+def _upstream_closure(stale, deps):
+    """
+    Returns the sorted indices of the `stale` cells and all their upstream cells.
+    """
+    needed, todo = set(), list(stale)
+    while todo:
+        i = todo.pop()
+        if i not in needed:
+            needed.add(i)
+            todo.extend(deps[i])
+    return sorted(needed)
+
+
+def execute_notebook(path, output_path=None, force=False, timeout=DEFAULT_TIMEOUT,
+                     allow_errors=False, dependencies=True, cache_dir=CACHE_DIR):
+    """
+    Execute the stale cells of the notebook `path` (see the module docstring)
+    and write the result to `output_path` (defaults to `path`).
+    Returns a dict with the `path`, the `elapsed` seconds, the number of cells
+    `executed` and `cached`, the list `cells` of (index, seconds) for the
+    executed cells, and the traceback `error` (None if successful).
+    """
+    import nbformat
+    from nbclient import NotebookClient
+
+    start = time.perf_counter()
+    report = {"path": path, "elapsed": 0.0, "executed": 0, "cached": 0, "cells": [], "error": None}
+    try:
+        nb = nbformat.read(path, as_version=4)
+        nbdir = os.path.dirname(os.path.abspath(path))
+        code_cells = [cell for cell in nb.cells if cell.cell_type == "code"]
+        sources = [cell.source for cell in code_cells]
+        infos = [analyze_cell(source) for source in sources]
+        deps = cell_dependencies(infos, dependencies=dependencies)
+        keys = cell_keys(sources, deps, environment_fingerprint(nb, infos, nbdir))
+
+        # 1. fill in the cached outputs and find the cells to execute
+        cached = [None if force else cache_get(key, cache_dir) for key in keys]
+        stale = [i for i, outputs in enumerate(cached) if outputs is None]
+        to_run = _upstream_closure(stale, deps)
+        for i, cell in enumerate(code_cells):
+            if i not in to_run:
+                cell.outputs = [nbformat.from_dict(output) for output in cached[i]]
+
+        # 2. execute the stale cells and their upstream cells in a new kernel
+        if to_run:
+            # record_timing=False: executed and cached cells are written the same way
+            client = NotebookClient(nb, timeout=timeout, allow_errors=allow_errors, record_timing=False,
+                                    kernel_name=nb.metadata.get("kernelspec", {}).get("name", "python3"),
+                                    resources={"metadata": {"path": nbdir}})
+            cell_indices = {id(cell): index for index, cell in enumerate(nb.cells)}
+            with client.setup_kernel():
+                for i in to_run:
+                    cell = code_cells[i]
+                    cell_start = time.perf_counter()
+                    client.execute_cell(cell, cell_indices[id(cell)])
+                    elapsed = time.perf_counter() - cell_start
+                    report["cells"].append((i, elapsed))
+                    outputs = [dict(output) for output in cell.outputs]
+                    if allow_errors or not _has_error(outputs):
+                        cache_put(keys[i], json.loads(json.dumps(outputs)), elapsed, cache_dir)
+        report["executed"] = len(to_run)
+        report["cached"] = len(code_cells) - len(to_run)
+
+        # 3. number the cells consecutively and save the notebook
+        for count, cell in enumerate(code_cells, start=1):
+            cell.execution_count = count
+            for output in cell.outputs:
+                if output.get("output_type") == "execute_result":
+                    output["execution_count"] = count
+        nbformat.write(nb, output_path or path)
+    except Exception:
+        report["error"] = traceback.format_exc()
+    report["elapsed"] = time.perf_counter() - start
+    return report
+
+
+def _execute_notebook_kwargs(kwargs):
+    return execute_notebook(**kwargs)
+
+
+def execute_notebooks(paths, jobs=None, output_dir=None, **kwargs):
+    """
+    Execute the notebooks `paths` on `jobs` processes (see `execute_notebook`)
+    and print the time and number of executed and cached cells of each.
+    Returns the list of reports in the same order as `paths`.
+    """
+    tasks = []
+    for path in paths:
+        output_path = None
+        if output_dir:
+            output_path = os.path.join(output_dir, os.path.relpath(os.path.abspath(path), HERE))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tasks.append(dict(kwargs, path=path, output_path=output_path))
+
+    print(f"{'notebook':<60} {'time':>9} {'executed':>9} {'cached':>7}")
+    reports = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for report in executor.map(_execute_notebook_kwargs, tasks):
+            status = "FAILED" if report["error"] else ""
+            name = os.path.relpath(os.path.abspath(report["path"]), HERE)
+            print(f"{name:<60} {report['elapsed']:8.2f}s {report['executed']:>9} {report['cached']:>7}  {status}")
+            reports.append(report)
+
+    failures = [report for report in reports if report["error"]]
+    for report in failures:
+        print("\n" + "="*80 + "\n" + report["path"] + " failed:\n" + report["error"])
+    total = sum(report["elapsed"] for report in reports)
+    executed = sum(report["executed"] for report in reports)
+    cached = sum(report["cached"] for report in reports)
+    print(f"Executed {len(reports)-len(failures)} notebooks ({len(failures)} failed), "
+          f"{executed} cells executed, {cached} cached, {total:.2f}s of total time")
+    return reports
+
+
+def print_cell_timings(reports, top=20):
+    """
+    Print the `top` slowest cells executed in the `reports`.
+    """
+    cells = [(elapsed, report["path"], i) for report in reports for i, elapsed in report["cells"]]
+    print(f"\n{'slowest cells':<60} {'cell':>5} {'time':>9}")
+    for elapsed, path, i in sorted(cells, reverse=True)[:top]:
+        name = os.path.relpath(os.path.abspath(path), HERE)
+        print(f"{name:<60} {i+1:>5} {elapsed:8.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Execute the notebooks of the book with a cell cache.")
+    parser.add_argument("notebooks", nargs="*", help="notebooks to execute (default: all notebooks in _toc.yml)")
+    parser.add_argument("--toc", default=DEFAULT_TOC, help="path to the Jupyter Book table of contents")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--force", action="store_true", help="execute all the cells, ignoring the cache")
+    parser.add_argument("--no-deps", action="store_true", help="key each cell on all the cells above it")
+    parser.add_argument("--allow-errors", action="store_true", help="keep going when a cell raises an error")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT, help="timeout per cell in seconds")
+    parser.add_argument("--output-dir", help="write the executed notebooks here instead of in place")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="directory of the cell cache")
+    parser.add_argument("--timings", type=int, default=0, metavar="N", help="show the N slowest cells")
+    parser.add_argument("--report", help="save the per-notebook and per-cell timings to this JSON file")
+    args = parser.parse_args(argv)
+    paths = args.notebooks or toc_notebooks(args.toc)
+    reports = execute_notebooks(paths, jobs=args.jobs, output_dir=args.output_dir, force=args.force,
+                                timeout=args.timeout, allow_errors=args.allow_errors,
+                                dependencies=not args.no_deps, cache_dir=args.cache_dir)
+    if args.timings:
+        print_cell_timings(reports, top=args.timings)
+    if args.report:
+        with open(args.report, "w") as reportfile:
+            json.dump(reports, reportfile, indent=2)
+    return 1 if any(report["error"] for report in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+"""
+Benchmarks for the helper functions in `plot_helpers.py`.
+(c) 2022 Minireferece Co. - MIT License
+
+Usage:
+    python benchmarks.py                          # run the import-time check and all benchmarks
+    python benchmarks.py --max-import-time 2.0    # fail if import takes longer
+    python benchmarks.py --quick --only qq_plot   # smallest sizes of the matching benchmarks
+    python benchmarks.py --save-baseline          # store the results as the baseline
+    python benchmarks.py --threshold 0.25         # fail if anything is 25% slower than the baseline
+
+Each benchmark runs at several problem sizes and reports the best time out of
+`--repeat` runs for each phase: "compute" is the numerical part called on its
+own, and "render" is the rest of the time of the plotting call (drawing with
+the Agg backend and saving the figure files). The figure cache and the rv
+evaluation cache are disabled while benchmarking.
+The results are written to `--output` as JSON, and compared with the results
+in `--baseline` (if the file exists): a phase is a regression if it is slower
+than the baseline by more than `--threshold` (relative) and `MIN_DIFFERENCE`
+seconds (absolute, to ignore timer noise).
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(HERE, "benchmark_results.json")
+DEFAULT_BASELINE = os.path.join(HERE, "benchmark_baseline.json")
+MIN_DIFFERENCE = 0.005    # seconds
+
+# The compute modules, and the modules that they must not load when imported
+COMPUTE_MODULES = ["core_helpers", "prob_helpers", "sampling_helpers", "inference_helpers"]
+LAZY_MODULES = ["matplotlib", "seaborn", "pandas"]
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {modules}
+elapsed = time.perf_counter() - start
+loaded = [name for name in {lazy!r} if name in sys.modules]
+print(elapsed, ",".join(loaded))
+"""
+
+
+def bench_import(repeat=5):
+    """
+    Measure the time to import the `COMPUTE_MODULES` in a fresh interpreter.
+    Returns the best time out of `repeat` runs (in seconds) and the list of the
+    `LAZY_MODULES` that got loaded by the import.
+    """
+    script = IMPORT_SCRIPT.format(modules=", ".join(COMPUTE_MODULES), lazy=LAZY_MODULES)
+    times, loaded = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", script], cwd=HERE, check=True,
+                                capture_output=True, text=True).stdout.split()
+        times.append(float(output[0]))
+        loaded = output[1].split(",") if len(output) > 1 else []
+    return min(times), loaded
+
+
+def check_import(max_import_time=None, repeat=5):
+    """
+    Returns a list of problems with the import of the compute modules (empty
+    if none) and the best import time.
+    """
+    best, loaded = bench_import(repeat=repeat)
+    print(f"import compute modules: {best:.3f}s (best of {repeat})")
+    problems = []
+    if loaded:
+        problems.append("importing the compute modules loaded " + ", ".join(loaded))
+    if max_import_time is not None and best > max_import_time:
+        problems.append(f"importing the compute modules took {best:.3f}s > {max_import_time:.3f}s")
+    return problems, best
+
+
+# Benchmarks
+################################################################################
+# Each benchmark function takes the problem size as keyword arguments and the
+# directory `outdir` for the figure files, and returns a dict with the key
+# "compute" and (for plotting functions) the key "total", which are functions
+# without arguments that run the numerical part and the complete plotting call.
+
+def bench_gen_samples(outdir, n, N, seed=42):
+    import plot_helpers as ph
+    from scipy.stats import norm
+    compute = lambda: ph.gen_samples(norm(), n=n, N=N, seed=seed)
+    return {"compute": compute}
+
+
+def bench_gen_sampling_dist(outdir, n, N, seed=42):
+    import plot_helpers as ph
+    from scipy.stats import expon
+    compute = lambda: ph.gen_sampling_dist(expon(), n=n, N=N, seed=seed)
+    return {"compute": compute}
+
+
+def bench_generate_pdf_panel(outdir, M, K):
+    import numpy as np
+    import plot_helpers as ph
+    from scipy.stats import norm
+    xs = np.linspace(-10, 10, 1000)
+    params_matrix = [[{"loc": i, "scale": 1 + j} for j in range(K)] for i in range(M)]
+    fname = os.path.join(outdir, f"pdf_panel_{M}x{K}")
+    compute = lambda: ph.eval_params_grid(norm, params_matrix, xs, method="pdf")
+    total = lambda: ph.generate_pdf_panel(fname, xs, norm, params_matrix)
+    return {"compute": compute, "total": total}
+
+
+def bench_generate_pmf_panel(outdir, M, K):
+    import numpy as np
+    import plot_helpers as ph
+    from scipy.stats import binom
+    xs = np.arange(0, 41)
+    params_matrix = [[{"n": 10 + 10*i, "p": (j + 1) / (K + 1)} for j in range(K)] for i in range(M)]
+    fname = os.path.join(outdir, f"pmf_panel_{M}x{K}")
+    compute = lambda: ph.eval_params_grid(binom, params_matrix, xs, method="pmf")
+    total = lambda: ph.generate_pmf_panel(fname, xs, binom, params_matrix)
+    return {"compute": compute, "total": total}
+
+
+def bench_qq_plot(outdir, n, kind="scatter"):
+    import plot_helpers as ph
+    from scipy.stats import norm
+    data = norm().rvs(n, random_state=42)
+    fname = os.path.join(outdir, f"qq_plot_{n}")
+    compute = lambda: ph.calc_qq_points(data, norm(0, 1))
+    total = lambda: ph.qq_plot(data, norm(0, 1), filename=fname, kind=kind)
+    return {"compute": compute, "total": total}
+
+
+def bench_calc_prob_and_plot_tails(outdir, backend):
+    import plot_helpers as ph
+    from scipy.stats import norm
+    fname = os.path.join(outdir, f"tails_{backend}")
+
+    def total():
+        ph.set_render_backend(backend)
+        _, ax = ph.calc_prob_and_plot_tails(norm(), -1.96, 1.96)
+        ph.export_figure(ax.figure, fname)
+
+    compute = lambda: ph.calc_tail_probs(norm(), -1.96, 1.96)
+    return {"compute": compute, "total": total}
+
+
+def bench_plot_sampling_dists_panel(outdir, N):
+    import plot_helpers as ph
+    from scipy.stats import expon
+    fname = os.path.join(outdir, f"sampling_dists_panel_{N}")
+    compute = lambda: [ph.gen_sampling_dist(expon(), n=n, N=N, seed=42) for n in [10, 30, 100]]
+    total = lambda: ph.plot_sampling_dists_panel(expon(), xlims=[0, 2], N=N, binwidth=0.05,
+                                                 filename=fname, seed=42)
+    return {"compute": compute, "total": total}
+
+
+# (name, benchmark function, list of problem sizes from smallest to largest)
+# The sampling functions use a different code path without a seed (the global
+# random state), so they are benchmarked both with and without one. The unseeded
+# path loops over the samples in Python, so its sizes stop at N=10000.
+BENCHMARKS = [
+    ("gen_samples", bench_gen_samples,
+     [dict(n=30, N=10), dict(n=30, N=1000), dict(n=100, N=10000)]),
+    ("gen_samples_unseeded", bench_gen_samples,
+     [dict(n=30, N=10, seed=None), dict(n=30, N=1000, seed=None), dict(n=100, N=10000, seed=None)]),
+    ("gen_sampling_dist", bench_gen_sampling_dist,
+     [dict(n=30, N=1000), dict(n=30, N=100000), dict(n=100, N=1000000)]),
+    ("gen_sampling_dist_unseeded", bench_gen_sampling_dist,
+     [dict(n=30, N=100, seed=None), dict(n=30, N=1000, seed=None), dict(n=100, N=10000, seed=None)]),
+    ("generate_pdf_panel", bench_generate_pdf_panel,
+     [dict(M=1, K=3), dict(M=2, K=3), dict(M=3, K=4)]),
+    ("generate_pmf_panel", bench_generate_pmf_panel,
+     [dict(M=1, K=3), dict(M=2, K=3), dict(M=3, K=4)]),
+    ("qq_plot", bench_qq_plot,
+     [dict(n=100), dict(n=10000), dict(n=1000000, kind="hexbin")]),
+    ("calc_prob_and_plot_tails", bench_calc_prob_and_plot_tails,
+     [dict(backend="seaborn"), dict(backend="matplotlib")]),
+    ("plot_sampling_dists_panel", bench_plot_sampling_dists_panel,
+     [dict(N=1000), dict(N=10000)]),
+]
+
+
+def case_name(name, sizes):
+    return name + "[" + ",".join(f"{key}={value}" for key, value in sizes.items()) + "]"
+
+
+def _best_time(func, repeat):
+    import matplotlib.pyplot as plt
+    import plot_helpers as ph
+    times = []
+    for _ in range(repeat):
+        ph.rv_cache_clear()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        plt.close("all")
+    return min(times)
+
+
+def run_benchmarks(repeat=3, quick=False, only=None):
+    """
+    Run the BENCHMARKS (only the smallest size if `quick`, and only those whose
+    name contains one of the strings in `only`) and return a dict
+    {case_name: {"compute": seconds, "render": seconds}}.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    import core_helpers
+    import plot_helpers as ph
+    ph.FIGURE_CACHE_ENABLED = False
+    core_helpers.RV_CACHE_ENABLED = False
+    ph.EXPORT_IN_BACKGROUND = False
+    backend = ph.RENDER_BACKEND
+
+    results = {}
+    with tempfile.TemporaryDirectory() as outdir:
+        # warm up (load fonts, seaborn, pandas) so the first benchmark isn't penalized
+        ph.plot_samples(ph.gen_samples(ph.norm(), n=5, N=2), filename=os.path.join(outdir, "warmup"))
+        _best_time(lambda: None, 1)
+        for name, bench, all_sizes in BENCHMARKS:
+            if only and not any(pattern in name for pattern in only):
+                continue
+            for sizes in (all_sizes[:1] if quick else all_sizes):
+                funcs = bench(outdir, **sizes)
+                timings = {"compute": _best_time(funcs["compute"], repeat)}
+                if "total" in funcs:
+                    total = _best_time(funcs["total"], repeat)
+                    timings["render"] = max(0.0, total - timings["compute"])
+                ph.set_render_backend(backend)
+                results[case_name(name, sizes)] = timings
+                phases = "  ".join(f"{phase} {seconds:8.4f}s" for phase, seconds in timings.items())
+                print(f"{case_name(name, sizes):<50} {phases}")
+    return results
+
+
+def compare_results(results, baseline, threshold=0.2):
+    """
+    Returns the list of regressions of the `results` relative to the `baseline`.
+    """
+    problems = []
+    for case, timings in results.items():
+        for phase, seconds in timings.items():
+            base = baseline.get(case, {}).get(phase)
+            if base is None:
+                continue
+            if seconds > base * (1 + threshold) and seconds - base > MIN_DIFFERENCE:
+                problems.append(f"{case} {phase}: {seconds:.4f}s vs {base:.4f}s in the baseline "
+                                f"(+{100*(seconds/base - 1):.0f}%)")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the plot_helpers module.")
+    parser.add_argument("--max-import-time", type=float, default=None,
+                        help="maximum allowed import time in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="number of repetitions")
+    parser.add_argument("--quick", action="store_true", help="run only the smallest problem sizes")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="run only the matching benchmarks")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="path of the JSON results file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="path of the JSON baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="maximum allowed slowdown relative to the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    problems, import_time = check_import(max_import_time=args.max_import_time, repeat=args.repeat)
+    results = {"import": {"import": import_time}}
+    results.update(run_benchmarks(repeat=args.repeat, quick=args.quick, only=args.only))
+
+    import numpy, plot_helpers
+    report = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "python": platform.python_version(),
+                 "numpy": numpy.__version__,
+                 "plot_helpers": plot_helpers.__version__,
+                 "machine": platform.platform(),
+                 "repeat": args.repeat},
+        "results": results,
+    }
+    with open(args.output, "w") as outfile:
+        json.dump(report, outfile, indent=2, sort_keys=True)
+    print("Saved results to", args.output)
+    if args.save_baseline:
+        with open(args.baseline, "w") as outfile:
+            json.dump(report, outfile, indent=2, sort_keys=True)
+        print("Saved baseline to", args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)["results"]
+        problems += compare_results(results, baseline, threshold=args.threshold)
+
+    for problem in problems:
+        print("REGRESSION:", problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
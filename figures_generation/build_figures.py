@@ -0,0 +1,201 @@
+"""
+Command-line tool that renders the figures described in a declarative spec file
+using the panel functions in `plot_helpers.py`.
+(c) 2022 Minireferece Co. - MIT License
+
+Usage:
+    python build_figures.py                    # rebuild stale figures in figure_specs.json
+    python build_figures.py --jobs 8 --force   # rebuild all figures on 8 processes
+    python build_figures.py --only normal_panel chi2_panel
+
+The spec file contains a list of figures of the form
+    {"name": "normal_panel",
+     "function": "generate_pdf_panel",
+     "kwargs": {"fname": "figures/prob/probpanels/normal_panel.pdf", ...},
+     "theme": {"context": "paper", "style": "whitegrid", "rc": {...}},
+     "rc": {"figure.figsize": [7, 2.3]}}
+where the values in `kwargs` can use the following encodings:
+    {"$dist": "norm"}                                 -->  scipy.stats.norm
+    {"$rv": "expon", "args": [0, 5], "kwds": {}}      -->  scipy.stats.expon(0, 5)
+    {"$linspace": [0, 40, 1000]}                      -->  np.linspace(0, 40, 1000)
+    {"$arange": [0, 41, 5]}                           -->  np.arange(0, 41, 5)
+Figure paths are relative to the directory that contains the spec file.
+The optional `theme` holds the arguments of the `sns.set_theme` call of the
+notebook that draws the figure (the notebooks replace the serif theme of
+`plot_helpers.py` with their own), and the optional `rc` holds the settings of
+the `plt.rc_context` around the call, so the figures match the notebook output.
+The figures are rendered in worker processes (using the Agg backend), so the
+calling process keeps its working directory and matplotlib backend.
+
+Scope: `figure_specs.json` declares the figures drawn by the panel helpers of
+`plot_helpers.py`: the pdf and pmf panels of `continuous_dist_inventory.ipynb`
+and `discr_dist_inventory.ipynb`, and the CLT panels of `random_samples.ipynb`.
+The other figures in the `figures_generation` notebooks are drawn by
+matplotlib code written in the notebook cells, so they are still generated
+by running those notebooks.
+A figure is stale if one of its output files is missing, or if its spec or the
+source code of `plot_helpers.py` (or of the compute modules it imports)
+changed since the last time it was built.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SPECS = os.path.join(HERE, "figure_specs.json")
+STAMPS_FILENAME = ".figure_stamps.json"
+FILENAME_ARGS = ["fname", "filename"]
+
+
+def decode_value(value):
+    """
+    Convert the JSON encoding of a kwargs value into a Python object.
+    """
+    import numpy as np
+    import scipy.stats
+
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "$dist" in value:
+        return getattr(scipy.stats, value["$dist"])
+    if "$rv" in value:
+        model = getattr(scipy.stats, value["$rv"])
+        return model(*value.get("args", []), **value.get("kwds", {}))
+    if "$linspace" in value:
+        return np.linspace(*value["$linspace"])
+    if "$arange" in value:
+        return np.arange(*value["$arange"])
+    return {key: decode_value(item) for key, item in value.items()}
+
+
+def output_files(spec, workdir="."):
+    """
+    Returns the list of files that the figure `spec` writes, relative to `workdir`.
+    """
+    from plot_helpers import _output_files
+    for arg in FILENAME_ARGS:
+        if arg in spec["kwargs"]:
+            filename = os.path.join(workdir, spec["kwargs"][arg])
+            return _output_files(filename, spec["kwargs"].get("formats"))
+    return []
+
+
+def spec_fingerprint(spec):
+    """
+    Hash of the figure spec and the source code of the helper modules.
+    """
+    from plot_helpers import _module_fingerprint
+    spec_json = json.dumps(spec, sort_keys=True)
+    return hashlib.sha256((spec_json + "|" + _module_fingerprint()).encode("utf8")).hexdigest()
+
+
+def _init_worker(workdir, force=False):
+    """
+    Setup each worker process to render without a display in `workdir`.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    os.chdir(workdir)
+    if force:
+        os.environ["PLOT_HELPERS_REBUILD"] = "1"    # bypass the figure cache
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    import plot_helpers
+    plot_helpers.FIGURE_CACHE_ENABLED = True    # reuse the figures rendered by earlier builds
+
+
+def render_figure(spec):
+    """
+    Render the figure `spec` and return `(name, elapsed_seconds, error)`.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    import plot_helpers
+
+    start = time.perf_counter()
+    try:
+        func = getattr(plot_helpers, spec["function"])
+        kwargs = decode_value(spec["kwargs"])
+        with plt.rc_context():    # restores the theme of plot_helpers afterwards
+            if "theme" in spec:
+                sns.set_theme(**spec["theme"])
+            with plt.rc_context(spec.get("rc", {})):
+                func(**kwargs)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        plt.close("all")
+    return spec["name"], time.perf_counter() - start, error
+
+
+def build_figures(specs_path=DEFAULT_SPECS, jobs=None, force=False, only=None):
+    """
+    Render the stale figures in the spec file `specs_path` on `jobs` processes.
+    Returns the list of `(name, elapsed_seconds, error)` for the rendered figures.
+    """
+    workdir = os.path.dirname(os.path.abspath(specs_path))
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    with open(specs_path) as specsfile:
+        specs = json.load(specsfile)
+    if only:
+        specs = [spec for spec in specs if spec["name"] in only]
+
+    stamps_path = os.path.join(workdir, STAMPS_FILENAME)
+    stamps = {}
+    if os.path.exists(stamps_path):
+        with open(stamps_path) as stampsfile:
+            stamps = json.load(stampsfile)
+
+    stale = []
+    for spec in specs:
+        fingerprint = spec_fingerprint(spec)
+        outputs_exist = all(os.path.exists(path) for path in output_files(spec, workdir))
+        if force or not outputs_exist or stamps.get(spec["name"]) != fingerprint:
+            stale.append((spec, fingerprint))
+    print(f"{len(stale)} of {len(specs)} figures are stale")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(workdir, force)) as executor:
+        for (spec, fingerprint), result in zip(stale, executor.map(render_figure, [s for s, _ in stale])):
+            name, elapsed, error = result
+            status = "FAILED" if error else "ok"
+            print(f"{name:<50} {elapsed:8.2f}s  {status}")
+            if error is None:
+                stamps[name] = fingerprint
+            results.append(result)
+
+    with open(stamps_path, "w") as stampsfile:
+        json.dump(stamps, stampsfile, indent=2, sort_keys=True)
+
+    failures = [(name, error) for name, _, error in results if error]
+    for name, error in failures:
+        print("\n" + "="*80 + "\n" + name + " failed:\n" + error)
+    total = sum(elapsed for _, elapsed, _ in results)
+    print(f"Rendered {len(results)-len(failures)} figures ({len(failures)} failed), "
+          f"{total:.2f}s of total render time")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the figures described in a spec file.")
+    parser.add_argument("specs", nargs="?", default=DEFAULT_SPECS, help="path to the JSON spec file")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--force", action="store_true", help="rebuild all figures, even if not stale")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="build only the named figures")
+    args = parser.parse_args(argv)
+    results = build_figures(args.specs, jobs=args.jobs, force=args.force, only=args.only)
+    return 1 if any(error for _, _, error in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
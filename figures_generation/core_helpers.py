@@ -0,0 +1 @@
+../notebooks/core_helpers.py
\ No newline at end of file
@@ -0,0 +1 @@
+../notebooks/inference_helpers.py
\ No newline at end of file
@@ -0,0 +1 @@
+../notebooks/prob_helpers.py
\ No newline at end of file
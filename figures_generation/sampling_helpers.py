@@ -0,0 +1 @@
+../notebooks/sampling_helpers.py
\ No newline at end of file
@@ -0,0 +1,469 @@
+"""
+This file contains the computational core shared by the helper modules:
+profiling hooks, fingerprints of values and functions, the evaluation cache
+for random variables, and the chunked random sample generation.
+(c) 2022 Minireferece Co. - MIT License
+
+This module and the other compute modules (`prob_helpers`, `sampling_helpers`,
+and `inference_helpers`) only use NumPy and scipy, so processes that generate
+samples or compute probabilities start quickly. The plotting functions are in
+`plot_helpers`, which imports all of them.
+"""
+import atexit
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import sys
+import sysconfig
+import threading
+import time
+import types
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+
+
+# Profiling
+################################################################################
+# Opt-in instrumentation of the helper functions. Inside a `with profiling() as
+# prof:` block (or in the whole process when PLOT_HELPERS_PROFILE=1), each call
+# to a helper records its wall time, and the time spent in the phases "rvs"
+# (random variate generation), "eval" (pdf/cdf/ppf evaluation), "draw"
+# (seaborn/matplotlib drawing), "layout" (tight_layout), and "savefig", along
+# with the number of values processed. Call `prof.summary()` for a table of the
+# totals per helper and phase, and `prof.save_trace(path)` to export the events
+# as a JSON trace (view it in chrome://tracing or https://ui.perfetto.dev).
+# Set PLOT_HELPERS_PROFILE to a path ending in ".json" to save the trace of the
+# whole process at exit. The hooks do nothing when profiling is off.
+# The "call" rows of the summary include the time spent in nested helpers, and
+# the work done in worker processes (`workers=...`) is not recorded.
+
+class Profile:
+    """
+    The timing events recorded while profiling.
+    """
+
+    def __init__(self):
+        self.events = []      # dicts with keys helper, phase, start, duration, size, thread
+        self._t0 = time.perf_counter()
+
+    def record(self, helper, phase, start, duration, size=None):
+        self.events.append({"helper": helper, "phase": phase, "start": start - self._t0,
+                            "duration": duration, "size": size, "thread": threading.get_ident()})
+
+    def summary(self):
+        """
+        Returns a pd.DataFrame with the number of calls, the total and mean
+        duration in seconds, and the total size for each helper and phase.
+        """
+        totals = {}
+        for event in self.events:
+            key = (event["helper"], event["phase"])
+            calls, duration, size = totals.get(key, (0, 0.0, 0))
+            totals[key] = (calls+1, duration+event["duration"], size+(event["size"] or 0))
+        rows = [(helper, phase, calls, duration, duration/calls, size)
+                for (helper, phase), (calls, duration, size) in totals.items()]
+        columns = ["helper", "phase", "calls", "total_s", "mean_s", "size"]
+        import pandas as pd
+        summary_df = pd.DataFrame(rows, columns=columns)
+        return summary_df.sort_values("total_s", ascending=False, ignore_index=True)
+
+    def save_trace(self, path):
+        """
+        Save the events to `path` in the Chrome trace event JSON format.
+        """
+        trace = [{"name": event["phase"], "cat": event["helper"], "ph": "X",
+                  "ts": event["start"] * 1e6, "dur": event["duration"] * 1e6,
+                  "pid": os.getpid(), "tid": event["thread"],
+                  "args": {"helper": event["helper"], "size": event["size"]}}
+                 for event in self.events]
+        with open(path, "w") as tracefile:
+            json.dump({"traceEvents": trace}, tracefile)
+
+
+_active_profile = None
+_profile_local = threading.local()      # stack of the active helper calls in each thread
+_NULL_PHASE = contextlib.nullcontext()
+
+def _profile_size(obj):
+    """
+    Returns the number of values in `obj` (array, DataFrame, list, or shape tuple).
+    """
+    if obj is None:
+        return None
+    if isinstance(obj, tuple) and all(isinstance(dim, (int, np.integer)) for dim in obj):
+        return int(np.prod(obj))
+    if isinstance(obj, (list, tuple)):
+        return len(obj)
+    size = getattr(obj, "size", 1)
+    return size if isinstance(size, (int, np.integer)) else 1
+
+class _ProfilePhase:
+    def __init__(self, profile, phase, size, helper):
+        self.profile, self.phase, self.size, self.helper = profile, phase, size, helper
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start
+        helper = self.helper
+        if helper is None:
+            stack = getattr(_profile_local, "stack", None)
+            helper = stack[-1] if stack else "-"
+        self.profile.record(helper, self.phase, self.start, duration, _profile_size(self.size))
+        return False
+
+def _phase(phase, size=None, helper=None):
+    """
+    Context manager that records the time of the block as `phase` of the
+    current helper call (or of `helper`), when profiling is on.
+    The `size` is an array, list, or shape whose number of values is recorded.
+    """
+    if _active_profile is None:
+        return _NULL_PHASE
+    return _ProfilePhase(_active_profile, phase, size, helper)
+
+def profiled(func):
+    """
+    Decorator that records the calls to the helper `func` when profiling is on.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = _active_profile
+        if profile is None:
+            return func(*args, **kwargs)
+        stack = _profile_local.__dict__.setdefault("stack", [])
+        stack.append(func.__name__)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            sizes = [_profile_size(arg) for arg in args
+                     if isinstance(arg, (np.ndarray, list)) or hasattr(arg, "to_numpy")]
+            profile.record(func.__name__, "call", start, duration, sum(sizes) if sizes else None)
+    return wrapper
+
+@contextlib.contextmanager
+def profiling():
+    """
+    Context manager that records the helper calls in the block, e.g.
+        with profiling() as prof:
+            plot_sampling_dists_panel(rv, xlims=[0,2], N=10000)
+        prof.summary()
+    """
+    global _active_profile
+    previous = _active_profile
+    _active_profile = profile = Profile()
+    try:
+        yield profile
+    finally:
+        _active_profile = previous
+
+def _report_profile(profile, destination):
+    if not profile.events:
+        return
+    print(profile.summary().to_string(), file=sys.stderr)
+    if destination.endswith(".json"):
+        profile.save_trace(destination)
+
+PROFILE_ENV = os.environ.get("PLOT_HELPERS_PROFILE", "")
+if PROFILE_ENV not in ("", "0"):
+    _active_profile = Profile()
+    atexit.register(_report_profile, _active_profile, PROFILE_ENV)
+
+
+
+
+# Utils
+################################################################################
+
+def ensure_containing_dir_exists(filepath):
+    parent = os.path.join(filepath, os.pardir)
+    absparent = os.path.abspath(parent)
+    if not os.path.exists(absparent):
+        os.makedirs(absparent)
+
+# Maximum number of values drawn in each batch of the vectorized sampling functions
+DEFAULT_CHUNK_VALUES = 2**20
+
+def _chunk_bounds(N, n, chunksize=None):
+    """
+    Split `N` samples of size `n` into consecutive `(start, stop)` chunks
+    containing at most `chunksize` samples (by default about one million values).
+    """
+    if chunksize is None:
+        chunksize = max(1, DEFAULT_CHUNK_VALUES // max(n, 1))
+    return [(start, min(start+chunksize, N)) for start in range(0, N, chunksize)]
+
+def _apply_statfunc(statfunc, samples):
+    """
+    Compute `statfunc` for each row of the 2D array `samples`.
+    Uses `statfunc(samples, axis=1)` if supported, otherwise loops over the rows.
+    """
+    try:
+        stats = np.asarray(statfunc(samples, axis=1))
+    except TypeError:
+        stats = None
+    if stats is None or stats.shape != (samples.shape[0],):
+        stats = np.array([statfunc(sample) for sample in samples])
+    return stats
+
+def _spawn_seeds(seed, k):
+    """
+    Returns `k` independent child seeds of `seed`, or `k` times None if no seed.
+    """
+    if seed is None:
+        return [None] * k
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(k)
+
+def _draw_chunk(rv, shape, seedseq=None, statfunc=None):
+    """
+    Draw an array of values with the given `shape` from the random variable `rv`
+    using the random stream `seedseq` (or the global random state if `None`),
+    and optionally reduce each row of the array using `statfunc`.
+    """
+    random_state = np.random.default_rng(seedseq) if seedseq is not None else None
+    with _phase("rvs", shape):
+        samples = rv.rvs(size=shape, random_state=random_state)
+    if statfunc is None:
+        return samples
+    return _apply_statfunc(statfunc, samples)
+
+def _gen_chunks(rv, n, N, chunksize=None, seed=None, workers=None, statfunc=None):
+    """
+    Yield the chunks of `N` samples of size `n` from `rv` in order.
+    When `seed` or `workers` is given, each chunk gets its own random stream
+    spawned from `np.random.SeedSequence(seed)`, so the output depends only on
+    `seed` and `chunksize`, and not on the number of worker processes.
+    Use `workers=-1` to run the chunks on all the available CPU cores.
+    """
+    bounds = _chunk_bounds(N, n, chunksize)
+    if seed is not None or workers is not None:
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        seedseqs = seed.spawn(len(bounds))
+    else:
+        seedseqs = [None] * len(bounds)
+    shapes = [(stop-start, n) for start, stop in bounds]
+    if workers == -1:
+        workers = os.cpu_count()
+    if workers is None or workers == 1:
+        for shape, seedseq in zip(shapes, seedseqs):
+            yield _draw_chunk(rv, shape, seedseq, statfunc)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(_draw_chunk, [rv]*len(shapes), shapes,
+                                    seedseqs, [statfunc]*len(shapes))
+
+
+
+
+# Fingerprints
+################################################################################
+
+class _Unhashable(Exception):
+    pass
+
+def _fingerprint(obj):
+    """
+    Returns a deterministic string that identifies the value of `obj`.
+    Raises `_Unhashable` for objects without a stable representation.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, complex, str, bytes)):
+        return repr(obj)
+    if isinstance(obj, np.random.SeedSequence):
+        return "SeedSequence(" + repr(obj.entropy) + "," + repr(obj.spawn_key) + ")"
+    if isinstance(obj, np.generic):
+        return repr(obj.item())
+    if isinstance(obj, np.ndarray):
+        digest = hashlib.sha256(np.ascontiguousarray(obj).tobytes()).hexdigest()
+        return "array(" + str(obj.dtype) + "," + str(obj.shape) + "," + digest + ")"
+    pd = sys.modules.get("pandas")    # no need to import pandas if it isn't loaded
+    if pd is not None and isinstance(obj, (pd.Series, pd.DataFrame)):
+        return type(obj).__name__ + "(" + _fingerprint(obj.to_numpy()) + ","\
+            + _fingerprint(list(map(str, getattr(obj, "columns", [obj.name])))) + ")"
+    if isinstance(obj, (list, tuple, range)):
+        return type(obj).__name__ + "(" + ",".join(_fingerprint(item) for item in obj) + ")"
+    if isinstance(obj, dict):
+        items = sorted((_fingerprint(k), _fingerprint(v)) for k, v in obj.items())
+        return "dict(" + ",".join(k + ":" + v for k, v in items) + ")"
+    if hasattr(obj, "dist") and hasattr(obj, "args") and hasattr(obj, "kwds"):
+        # frozen scipy.stats random variable
+        return "rv(" + _fingerprint(obj.dist) + "," + _fingerprint(obj.args) + ","\
+            + _fingerprint(obj.kwds) + ")"
+    if hasattr(obj, "name") and hasattr(obj, "support") and hasattr(obj, "freeze"):
+        # scipy.stats distribution (model), custom subclasses also by the code of their methods
+        cls = type(obj)
+        parts = [cls.__module__ + "." + cls.__qualname__, obj.name]
+        for base in cls.__mro__:
+            if not _is_library_code(base):
+                parts += [_func_fingerprint(value) for _, value in sorted(vars(base).items())
+                          if isinstance(value, types.FunctionType)]
+        return "dist(" + ",".join(parts) + ")"
+    if isinstance(obj, types.FunctionType) and not _is_library_code(obj):
+        return _func_fingerprint(obj)
+    if callable(obj) and hasattr(obj, "__qualname__") and "<" not in obj.__qualname__:
+        return "func(" + str(getattr(obj, "__module__", "")) + "." + obj.__qualname__ + ")"
+    raise _Unhashable(type(obj).__name__)
+
+def _is_library_code(obj):
+    """
+    Returns True if `obj` is defined in the standard library or an installed package,
+    which don't change between calls, so they are identified by their names.
+    """
+    module = sys.modules.get(str(getattr(obj, "__module__", None)))
+    path = getattr(module, "__file__", None) or ""
+    return (path.startswith(sysconfig.get_paths()["stdlib"])
+            or "site-packages" in path or "dist-packages" in path)
+
+def _code_fingerprint(code):
+    """
+    Hash of the bytecode, constants, and names of the code object `code` (but
+    not its filename and line numbers, which change when a notebook cell is re-run).
+    """
+    consts = [_code_fingerprint(c) if isinstance(c, types.CodeType) else repr(c) for c in code.co_consts]
+    data = repr((consts, code.co_names, code.co_varnames, code.co_freevars)).encode("utf8")
+    return hashlib.sha256(code.co_code + data).hexdigest()
+
+def _code_names(code):
+    """
+    Returns the global names used by `code` and the code objects nested in it.
+    """
+    names = list(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names += _code_names(const)
+    return names
+
+def _func_fingerprint(func, depth=0):
+    """
+    Returns a string that identifies the Python function `func` by its code,
+    default arguments, and the values of the closure variables and global names
+    it uses (functions it calls are identified the same way).
+    Raises `_Unhashable` if one of these values has no stable representation.
+    """
+    name = "func(" + str(getattr(func, "__module__", "")) + "." + func.__qualname__ + ")"
+    if depth > 3:
+        return name    # stop at recursive functions
+    parts = [name, _code_fingerprint(func.__code__), _fingerprint(func.__defaults__),
+             _fingerprint(func.__kwdefaults__)]
+    values = [cell.cell_contents for cell in func.__closure__ or ()]
+    values += [func.__globals__[name] for name in dict.fromkeys(_code_names(func.__code__))
+               if name in func.__globals__]
+    for value in values:
+        if isinstance(value, (types.ModuleType, type)):
+            continue
+        if isinstance(value, types.FunctionType) and not _is_library_code(value):
+            parts.append(_func_fingerprint(value, depth+1))
+        else:
+            parts.append(_fingerprint(value))
+    return "code(" + ",".join(parts) + ")"
+
+
+
+
+# Evaluation cache
+################################################################################
+# The pdf, cdf, and ppf of the scipy.stats distributions with closed-form
+# formulas are fast to evaluate, but generic `rv_continuous` subclasses need a
+# numerical integral or root-find for every point. The helpers evaluate frozen
+# random variables through `rv_eval`, which memoizes the results in a bounded
+# LRU cache keyed on the distribution, its parameters, the method, and the
+# input values, so repeated plots of the same distribution cost nothing.
+# Custom subclasses are keyed on the code of their methods. Cached arrays are
+# read-only, and results larger than RV_CACHE_MAX_BYTES aren't cached.
+# Use `rv_cache_info()` to see the hit/miss counts, `rv_cache_clear()` to empty
+# the cache, and `core_helpers.RV_CACHE_ENABLED = False` to disable it.
+
+RV_CACHE_ENABLED = True
+RV_CACHE_MAX_ENTRIES = 512
+RV_CACHE_MAX_BYTES = 64 * 2**20
+
+RvCacheInfo = namedtuple("RvCacheInfo", ["hits", "misses", "entries", "nbytes"])
+
+_rv_cache = OrderedDict()     # key --> value, in least-recently-used order
+_rv_cache_stats = {"hits": 0, "misses": 0, "nbytes": 0}
+
+def _rv_cache_key(rv, method, x):
+    """
+    Returns the cache key for `rv.method(x)`, or None if `rv` is not a frozen
+    scipy.stats random variable or `x` can't be fingerprinted.
+    """
+    if not (hasattr(rv, "dist") and hasattr(rv, "args") and hasattr(rv, "kwds")):
+        return None
+    try:
+        # the support is included for instances of custom rv_continuous subclasses
+        support = (rv.dist.a, rv.dist.b)
+        return ("rv", _fingerprint(rv), repr(support), method, _fingerprint(x))
+    except (_Unhashable, AttributeError):
+        return None
+
+def _rv_cache_lookup(key, compute):
+    """
+    Returns the cached value for `key`, or stores and returns `compute()`.
+    """
+    if key in _rv_cache:
+        _rv_cache.move_to_end(key)
+        _rv_cache_stats["hits"] += 1
+        return _rv_cache[key]
+    _rv_cache_stats["misses"] += 1
+    value = compute()
+    if getattr(value, "nbytes", 0) > RV_CACHE_MAX_BYTES:
+        return value    # too large to cache
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    _rv_cache[key] = value
+    _rv_cache_stats["nbytes"] += getattr(value, "nbytes", 0)
+    while len(_rv_cache) > 1 and (len(_rv_cache) > RV_CACHE_MAX_ENTRIES
+                                  or _rv_cache_stats["nbytes"] > RV_CACHE_MAX_BYTES):
+        _, evicted = _rv_cache.popitem(last=False)
+        _rv_cache_stats["nbytes"] -= getattr(evicted, "nbytes", 0)
+    return value
+
+def rv_eval(rv, method, x):
+    """
+    Returns `rv.method(x)`, e.g. `rv_eval(rv, "pdf", xs)` for `rv.pdf(xs)`,
+    using the results of previous calls with the same arguments if possible.
+    """
+    with _phase("eval", x):
+        key = _rv_cache_key(rv, method, x) if RV_CACHE_ENABLED else None
+        if key is None:
+            return getattr(rv, method)(x)
+        return _rv_cache_lookup(key, lambda: getattr(rv, method)(x))
+
+def _rv_func(rv, method):
+    """
+    Returns the vectorized function `x --> rv_eval(rv, method, x)`.
+    """
+    return functools.partial(rv_eval, rv, method)
+
+def _default_xlims(rv, q_low=0.001, q_high=0.999):
+    """
+    Returns the quantiles `q_low` and `q_high` of `rv`, used as plot limits.
+    """
+    return rv_eval(rv, "ppf", q_low), rv_eval(rv, "ppf", q_high)
+
+def rv_cache_info():
+    """
+    Returns the hits, misses, number of entries, and size of the evaluation cache.
+    """
+    return RvCacheInfo(_rv_cache_stats["hits"], _rv_cache_stats["misses"],
+                       len(_rv_cache), _rv_cache_stats["nbytes"])
+
+def rv_cache_clear():
+    """
+    Remove all the entries from the evaluation cache and reset its counters.
+    """
+    _rv_cache.clear()
+    _rv_cache_stats.update(hits=0, misses=0, nbytes=0)
@@ -0,0 +1,327 @@
+"""
+This file contains helper functions for loading the datasets in `datasets/`.
+(c) 2022 Minireferece Co. - MIT License
+
+Usage:
+    from data_helpers import load
+    students = load("students", index_col="student_ID")
+    players = load("formats/minimal.xlsx", sheet_name="Sheet1")
+    visitors = load("visitors", columns=["version", "bought"])
+    for chunk in load_chunks("kprod", chunksize=100):
+        ...
+
+The first time a dataset is loaded, the source file is parsed using pandas
+and stored in a columnar cache: one `.npy` file per column (with the dtype
+fixed at conversion time, and categorical columns stored as integer codes)
+and a `meta.json` file that describes the columns. Later loads read or
+memory-map the `.npy` files directly (copy-on-write), without parsing the
+source again.
+A cache entry is rebuilt when the source file changes (detected using its
+size and modification time, confirmed by its SHA-256 hash) or when the
+reader options change.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+DATASETS_DIR = os.environ.get("DATA_HELPERS_DATASETS_DIR",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "datasets"))
+DATA_CACHE_DIR = os.environ.get("DATA_HELPERS_CACHE_DIR",
+                                os.path.join(os.path.expanduser("~"), ".cache", "data_helpers"))
+CACHE_FORMAT_VERSION = 1
+
+
+# Registry
+################################################################################
+# Short names for the datasets used in the notebooks, with the reader options
+# and the columns that should be stored as categorical variables. Any other
+# file in DATASETS_DIR can be loaded using its relative path, e.g. "raw/minimal.csv".
+
+DATASETS = {
+    "students": {"path": "students.csv", "categories": ["background", "curriculum"]},
+    "visitors": {"path": "visitors.csv", "categories": ["version"]},
+    "kprod": {"path": "kprod.csv"},
+    "eprices": {"path": "eprices.csv"},
+    "minimal": {"path": "minimal.csv"},
+    "exercises/grades": {"path": "exercises/grades.csv"},
+}
+
+READERS = {
+    ".csv": "csv",
+    ".tsv": "tsv",
+    ".tab": "tsv",
+    ".xlsx": "excel",
+    ".xls": "excel",
+    ".ods": "excel",
+    ".json": "json",
+    ".sqlite": "sqlite",
+    ".db": "sqlite",
+    ".html": "html",
+    ".htm": "html",
+    ".xml": "xml",
+}
+
+
+def list_datasets():
+    """
+    Returns the names of the registered datasets.
+    """
+    return sorted(DATASETS)
+
+
+def _resolve(name):
+    """
+    Returns the absolute path of the source file of dataset `name` and the
+    registry options (reader kwargs and categories) for it.
+    """
+    spec = dict(DATASETS.get(name, {"path": name}))
+    path = os.path.join(DATASETS_DIR, spec.pop("path"))
+    if not os.path.exists(path):
+        raise FileNotFoundError("No dataset " + repr(name) + " (looked for " + path + ")")
+    return os.path.abspath(path), spec
+
+
+def read_source(path, **read_kwargs):
+    """
+    Parse the data file `path` into a pd.DataFrame using the pandas reader for
+    its file extension. Use `table=` to select the table in SQLite and HTML files.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    reader = READERS.get(ext)
+    if reader == "csv":
+        return pd.read_csv(path, **read_kwargs)
+    if reader == "tsv":
+        return pd.read_csv(path, sep="\t", **read_kwargs)
+    if reader == "excel":
+        return pd.read_excel(path, **read_kwargs)
+    if reader == "json":
+        return pd.read_json(path, **read_kwargs)
+    if reader == "sqlite":
+        table = read_kwargs.pop("table", None)
+        with contextlib.closing(sqlite3.connect("file:" + path + "?mode=ro", uri=True)) as con:
+            if table is None:
+                tables = [row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+                if len(tables) != 1:
+                    raise ValueError("Pass table= to choose one of the tables " + str(tables))
+                table = tables[0]
+            return pd.read_sql_query('SELECT * FROM "' + table + '"', con, **read_kwargs)
+    if reader == "html":
+        table = read_kwargs.pop("table", 0)
+        return pd.read_html(path, **read_kwargs)[table]
+    if reader == "xml":
+        try:
+            import lxml
+        except ImportError:
+            read_kwargs.setdefault("parser", "etree")
+        return pd.read_xml(path, **read_kwargs)
+    raise ValueError("Unsupported file type " + repr(ext) + "; use one of " + str(sorted(READERS)))
+
+
+# Columnar cache
+################################################################################
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as srcfile:
+        for block in iter(lambda: srcfile.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _entry_dir(path, options):
+    """
+    Returns the cache directory for the source `path` read with `options`.
+    """
+    key = json.dumps({"path": path, "options": options, "version": CACHE_FORMAT_VERSION},
+                     sort_keys=True, default=str)
+    digest = hashlib.sha256(key.encode("utf8")).hexdigest()[:16]
+    basename = os.path.basename(path).replace(".", "_")
+    return os.path.join(DATA_CACHE_DIR, basename + "-" + digest)
+
+
+def _read_meta(entry, path):
+    """
+    Returns the metadata of the cache `entry` if it is up to date with `path`.
+    """
+    meta_path = os.path.join(entry, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as metafile:
+        meta = json.load(metafile)
+    stat = os.stat(path)
+    source = meta["source"]
+    if source["size"] == stat.st_size and source["mtime_ns"] == stat.st_mtime_ns:
+        return meta
+    if source["size"] == stat.st_size and source["sha256"] == _file_hash(path):
+        # same contents (e.g. after a git checkout), so only update the stat info
+        source["mtime_ns"] = stat.st_mtime_ns
+        with open(meta_path, "w") as metafile:
+            json.dump(meta, metafile, indent=2)
+        return meta
+    return None
+
+
+def _write_column(entry, i, series, categorical):
+    """
+    Save the values of `series` as the file(s) `entry/<i>.*.npy` and return the
+    metadata that describes the column.
+    """
+    column = {"name": series.name, "file": str(i) + ".npy"}
+    if categorical or isinstance(series.dtype, pd.CategoricalDtype):
+        cat = series.astype("category")
+        categories = cat.cat.categories
+        if categories.dtype.kind in "biuf":
+            categories = categories.to_numpy()
+        else:
+            categories = categories.to_numpy(dtype=str)
+        np.save(os.path.join(entry, str(i) + ".categories.npy"), categories)
+        np.save(os.path.join(entry, column["file"]), cat.cat.codes.to_numpy())
+        column.update(kind="categorical", ordered=bool(cat.cat.ordered))
+    elif series.dtype.kind in "biufcmM" and not isinstance(series.dtype, pd.DatetimeTZDtype):
+        values = series.to_numpy()
+        np.save(os.path.join(entry, column["file"]), values)
+        column.update(kind="numeric")
+    else:
+        # text and other values are stored as fixed-width unicode strings
+        missing = series.isna().to_numpy()
+        values = series.astype(object).where(~missing, "").to_numpy(dtype=str)
+        np.save(os.path.join(entry, column["file"]), values)
+        if missing.any():
+            np.save(os.path.join(entry, str(i) + ".mask.npy"), missing)
+        column.update(kind="string", missing=bool(missing.any()))
+    return column
+
+
+def _build_entry(entry, path, options):
+    """
+    Convert the source file `path` into the columnar cache directory `entry`.
+    """
+    read_kwargs = dict(options.get("read_kwargs", {}))
+    df = read_source(path, **read_kwargs)
+    index, index_names = None, None
+    if not isinstance(df.index, pd.RangeIndex) or df.index.name is not None:
+        index_names = list(df.index.names)
+        index = [name if name is not None else "level_" + str(i) for i, name in enumerate(index_names)]
+        df = df.reset_index(names=index)
+    categories = set(options.get("categories", []))
+
+    os.makedirs(DATA_CACHE_DIR, exist_ok=True)
+    tmpdir = tempfile.mkdtemp(dir=DATA_CACHE_DIR, prefix=".tmp-")
+    try:
+        columns = [_write_column(tmpdir, i, df.iloc[:,i], df.columns[i] in categories)
+                   for i in range(df.shape[1])]
+        stat = os.stat(path)
+        meta = {"version": CACHE_FORMAT_VERSION,
+                "source": {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                           "sha256": _file_hash(path)},
+                "options": options, "nrows": len(df), "index": index, "index_names": index_names,
+                "columns": columns}
+        with open(os.path.join(tmpdir, "meta.json"), "w") as metafile:
+            json.dump(meta, metafile, indent=2, default=str)
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        os.rename(tmpdir, entry)
+    except BaseException:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+    return meta
+
+
+def _load_column(entry, column, mmap, rows=slice(None)):
+    """
+    Returns the values of the cached `column` in the range `rows`.
+    """
+    mmap_mode = "c" if mmap else None    # copy-on-write: changes stay in memory
+    values = np.load(os.path.join(entry, column["file"]), mmap_mode=mmap_mode)[rows]
+    if column["kind"] == "categorical":
+        stem = column["file"].replace(".npy", "")
+        categories = np.load(os.path.join(entry, stem + ".categories.npy"))
+        dtype = pd.CategoricalDtype(categories, ordered=column["ordered"])
+        return pd.Categorical.from_codes(np.asarray(values), dtype=dtype)
+    if column["kind"] == "string":
+        # pandas infers the same text dtype as its readers from the object array
+        values = np.asarray(values).astype(object)
+        if column["missing"]:
+            stem = column["file"].replace(".npy", "")
+            mask = np.load(os.path.join(entry, stem + ".mask.npy"))[rows]
+            values[mask] = np.nan
+    return values
+
+
+def _open(name, categories=None, rebuild=False, **read_kwargs):
+    """
+    Returns the cache directory and metadata of dataset `name`, building the
+    cache entry if it is missing or out of date.
+    """
+    path, spec = _resolve(name)
+    options = {"read_kwargs": {**spec.get("read_kwargs", {}), **read_kwargs},
+               "categories": sorted(categories if categories is not None else spec.get("categories", []))}
+    entry = _entry_dir(path, options)
+    meta = None if rebuild else _read_meta(entry, path)
+    if meta is None:
+        meta = _build_entry(entry, path, options)
+    return entry, meta
+
+
+def _select_columns(meta, columns):
+    if columns is None:
+        return meta["columns"]
+    by_name = {column["name"]: column for column in meta["columns"]}
+    missing = [name for name in columns if name not in by_name]
+    if missing:
+        raise KeyError("No columns " + str(missing) + "; the columns are " + str(list(by_name)))
+    index = [by_name[name] for name in (meta["index"] or []) if name not in columns]
+    return index + [by_name[name] for name in columns]
+
+
+def _to_dataframe(entry, meta, selected, mmap, rows=slice(None)):
+    data = {column["name"]: _load_column(entry, column, mmap, rows) for column in selected}
+    df = pd.DataFrame(data, copy=False)
+    if meta["index"]:
+        df = df.set_index(meta["index"])
+        df.index.names = meta["index_names"]
+    elif rows.start:
+        df.index = pd.RangeIndex(rows.start, rows.start + len(df))
+    return df
+
+
+def load(name, columns=None, mmap=True, categories=None, rebuild=False, **read_kwargs):
+    """
+    Load the dataset `name` (a name in DATASETS or a path relative to the
+    datasets folder) as a pd.DataFrame, from the columnar cache if possible.
+    Use `columns` to load only some of the columns, `categories` to choose the
+    columns stored as categorical variables, and `mmap=False` to read the
+    numeric columns into memory instead of memory-mapping them. The memory maps
+    are copy-on-write, so the DataFrame can be modified without changing the cache.
+    The `read_kwargs` are passed to the pandas reader (e.g. `index_col="student_ID"`),
+    and `rebuild=True` forces the conversion of the source file.
+    """
+    entry, meta = _open(name, categories=categories, rebuild=rebuild, **read_kwargs)
+    return _to_dataframe(entry, meta, _select_columns(meta, columns), mmap)
+
+
+def load_chunks(name, chunksize=100000, columns=None, categories=None, **read_kwargs):
+    """
+    Yield the rows of the dataset `name` in pd.DataFrames of `chunksize` rows,
+    reading only the requested `columns` of each chunk from the cache.
+    """
+    entry, meta = _open(name, categories=categories, **read_kwargs)
+    selected = _select_columns(meta, columns)
+    for start in range(0, meta["nrows"], chunksize):
+        yield _to_dataframe(entry, meta, selected, True, slice(start, start+chunksize))
+
+
+def clear_cache():
+    """
+    Remove all the cached datasets.
+    """
+    if os.path.exists(DATA_CACHE_DIR):
+        shutil.rmtree(DATA_CACHE_DIR)
@@ -0,0 +1,413 @@
+"""
+This file contains helper functions for statistical inference: bootstrap
+confidence intervals, permutation tests, and simulation studies of t-tests.
+(c) 2022 Minireferece Co. - MIT License
+"""
+import functools
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import norm
+from scipy.stats import t as tdist
+
+from core_helpers import DEFAULT_CHUNK_VALUES, profiled
+from core_helpers import _gen_chunks, _spawn_seeds
+
+
+
+
+# Bootstrap
+################################################################################
+# The function `bootstrap` computes bootstrap confidence intervals like
+# `scipy.stats.bootstrap`, but it generates the resample indices in chunks of at
+# most DEFAULT_CHUNK_VALUES values, and it accepts batches of datasets (arrays
+# with the observations along the last axis), so coverage studies can compute
+# the CIs for thousands of simulated datasets in a single call (the datasets are
+# processed in blocks, and their bootstrap distributions aren't kept by default):
+#     data = norm(0,1).rvs(size=(1000, 30))        # 1000 datasets of size 30
+#     res = bootstrap(data, "median", seed=42)     # res.low.shape == (1000,)
+
+def _diff_of_means(xs, ys, axis=-1):
+    return np.mean(xs, axis=axis) - np.mean(ys, axis=axis)
+
+def _diff_of_medians(xs, ys, axis=-1):
+    return np.median(xs, axis=axis) - np.median(ys, axis=axis)
+
+BOOTSTRAP_STATISTICS = {
+    "mean": np.mean,
+    "median": np.median,
+    "std": functools.partial(np.std, ddof=1),
+    "var": functools.partial(np.var, ddof=1),
+    "meandiff": _diff_of_means,      # two samples
+    "mediandiff": _diff_of_medians,  # two samples
+}
+
+BootstrapResult = namedtuple("BootstrapResult", ["estimate", "low", "high", "stderr", "distribution"])
+
+def _bootstrap_statistic(statistic):
+    """
+    Returns the vectorized function for the `statistic`, which is either a name
+    in BOOTSTRAP_STATISTICS, a quantile like "q0.9", or a function with an `axis`
+    argument that computes the statistic of one or more samples.
+    """
+    if callable(statistic):
+        return statistic
+    if statistic in BOOTSTRAP_STATISTICS:
+        return BOOTSTRAP_STATISTICS[statistic]
+    if isinstance(statistic, str) and statistic.startswith("q"):
+        return functools.partial(np.quantile, q=float(statistic[1:]))
+    raise ValueError("Unknown statistic " + repr(statistic) + "; use one of "
+                     + str(list(BOOTSTRAP_STATISTICS)) + ", a quantile like 'q0.9', or a function")
+
+def _jackknife(samples, statfunc, k):
+    """
+    Returns the (B, n_k) leave-one-out values of `statfunc` for sample `k`.
+    """
+    B, n = samples[k].shape
+    rows = max(1, DEFAULT_CHUNK_VALUES // max(1, B*n))
+    values = []
+    for start in range(0, n, rows):
+        left_out = np.arange(start, min(start+rows, n))
+        idx = np.arange(0, n-1)[np.newaxis,:]
+        idx = idx + (idx >= left_out[:,np.newaxis])         # all indices except left_out
+        chunk = [sample[:,np.newaxis,:] for sample in samples]
+        chunk[k] = samples[k][:,idx]
+        values.append(statfunc(*chunk, axis=-1))
+    return np.concatenate(values, axis=-1)
+
+def _row_quantiles(sorted_values, qs):
+    """
+    Returns the quantiles `qs[i]` of the sorted rows `sorted_values[i]`, using
+    the same linear interpolation as `np.quantile`.
+    """
+    m = sorted_values.shape[-1]
+    positions = np.clip(qs, 0, 1) * (m - 1)
+    below = np.floor(positions).astype(np.int64)
+    above = np.minimum(below + 1, m - 1)
+    rows = np.arange(sorted_values.shape[0])
+    weight = positions - below
+    return (1 - weight) * sorted_values[rows, below] + weight * sorted_values[rows, above]
+
+def _bootstrap_block(samples, statfunc, n_resamples, confidence_level, method, seed, chunksize):
+    """
+    Returns the estimate, CI low and high, standard error, and the sorted
+    bootstrap distribution (shape (B, n_resamples)) for the block of datasets
+    `samples` (a list of (B, n_k) arrays).
+    """
+    B = samples[0].shape[0]
+    ns = [sample.shape[-1] for sample in samples]
+
+    # 1. statistics of the resamples, computed in chunks
+    if chunksize is None:
+        chunksize = max(1, DEFAULT_CHUNK_VALUES // (B * sum(ns)))
+    bounds = [(start, min(start+chunksize, n_resamples)) for start in range(0, n_resamples, chunksize)]
+    rows = np.arange(B)[:,np.newaxis,np.newaxis]
+    boot = np.empty((B, n_resamples))
+    for (start, stop), seedseq in zip(bounds, _spawn_seeds(seed, len(bounds))):
+        rng = np.random.default_rng(seedseq)
+        resamples = [sample[rows, rng.integers(0, n, size=(B, stop-start, n))]
+                     for sample, n in zip(samples, ns)]
+        boot[:,start:stop] = statfunc(*resamples, axis=-1)
+
+    # 2. confidence interval
+    estimate = np.asarray(statfunc(*samples, axis=-1), dtype=float)
+    alpha = (1 - confidence_level) / 2
+    boot.sort(axis=-1)
+    if method == "percentile":
+        qs_low, qs_high = np.full(B, alpha), np.full(B, 1-alpha)
+    else:
+        # bias correction from the fraction of resamples below the estimate
+        below = np.sum(boot < estimate[:,np.newaxis], axis=-1)
+        below_eq = np.sum(boot <= estimate[:,np.newaxis], axis=-1)
+        z0 = norm.ppf((below + below_eq) / (2 * n_resamples))
+        # acceleration from the jackknife values of each sample
+        num, den = 0.0, 0.0
+        for k, n in enumerate(ns):
+            jack = _jackknife(samples, statfunc, k)
+            U = (n - 1) * (jack.mean(axis=-1, keepdims=True) - jack)
+            num = num + np.sum(U**3, axis=-1) / n**3
+            den = den + np.sum(U**2, axis=-1) / n**2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            accel = np.where(den > 0, num / (6 * den**1.5), 0.0)
+        z_low, z_high = norm.ppf(alpha), norm.ppf(1-alpha)
+        qs_low = norm.cdf(z0 + (z0 + z_low) / (1 - accel * (z0 + z_low)))
+        qs_high = norm.cdf(z0 + (z0 + z_high) / (1 - accel * (z0 + z_high)))
+    low = _row_quantiles(boot, qs_low)
+    high = _row_quantiles(boot, qs_high)
+    stderr = np.std(boot, axis=-1, ddof=1)
+    return estimate, low, high, stderr, boot
+
+@profiled
+def bootstrap(data, statistic="mean", n_resamples=9999, confidence_level=0.95,
+              method="BCa", seed=None, chunksize=None, keep_distribution=None):
+    """
+    Compute the bootstrap estimate of the sampling distribution of `statistic`
+    and a confidence interval with the given `confidence_level`, using the
+    `method` "percentile" or "BCa" (bias-corrected and accelerated).
+    The `data` is an array of observations or a tuple of arrays for statistics
+    of several independent samples (e.g. "meandiff"). Arrays with more than one
+    dimension are batches of datasets, with the observations along the last axis.
+    Resamples are generated `chunksize` at a time, and each chunk gets its own
+    random stream spawned from `seed`, so the results are reproducible.
+    Batches are processed in blocks of datasets, so the memory used doesn't
+    grow with the number of datasets unless `keep_distribution` is True
+    (the default is to keep the distribution only for a single dataset).
+    Returns a `BootstrapResult` with the `estimate` of the statistic, the CI
+    `low` and `high`, the bootstrap standard error `stderr`, and the bootstrap
+    `distribution` (shape (..., n_resamples) for batched data, or None).
+    """
+    if method not in ("percentile", "BCa"):
+        raise ValueError("Unknown method " + repr(method) + "; use 'percentile' or 'BCa'")
+    statfunc = _bootstrap_statistic(statistic)
+    arrays = data if isinstance(data, (tuple, list)) else (data,)
+    arrays = [np.asarray(array, dtype=float) for array in arrays]
+    batch_shape = arrays[0].shape[:-1]
+    if any(array.shape[:-1] != batch_shape for array in arrays):
+        raise ValueError("All the samples must have the same batch shape " + str(batch_shape))
+    samples = [array.reshape(-1, array.shape[-1]) for array in arrays]
+    B = samples[0].shape[0]
+    if keep_distribution is None:
+        keep_distribution = batch_shape == ()
+
+    # blocks of datasets whose bootstrap distributions fit in DEFAULT_CHUNK_VALUES values;
+    # a single block uses `seed` directly, several blocks get spawned child seeds
+    blocksize = max(1, DEFAULT_CHUNK_VALUES // n_resamples)
+    starts = range(0, B, blocksize)
+    seeds = [seed] if len(starts) == 1 else _spawn_seeds(seed, len(starts))
+    estimate, low, high, stderr = np.empty(B), np.empty(B), np.empty(B), np.empty(B)
+    boot = np.empty((B, n_resamples)) if keep_distribution else None
+    for start, blockseed in zip(starts, seeds):
+        block = slice(start, min(start+blocksize, B))
+        results = _bootstrap_block([sample[block] for sample in samples], statfunc, n_resamples,
+                                   confidence_level, method, blockseed, chunksize)
+        estimate[block], low[block], high[block], stderr[block] = results[:4]
+        if keep_distribution:
+            boot[block] = results[4]
+
+    if batch_shape == ():
+        return BootstrapResult(float(estimate[0]), float(low[0]), float(high[0]),
+                               float(stderr[0]), boot[0] if keep_distribution else None)
+    return BootstrapResult(estimate.reshape(batch_shape), low.reshape(batch_shape),
+                           high.reshape(batch_shape), stderr.reshape(batch_shape),
+                           boot.reshape(batch_shape + (n_resamples,)) if keep_distribution else None)
+
+
+
+
+# Permutation tests
+################################################################################
+# The function `permutation_test` compares two independent samples by shuffling
+# the pooled data. It generates the permutations in batches of `batchsize`
+# shuffled copies and computes the statistic for the whole batch at once. Each
+# batch gets its own random stream spawned from `seed`, so the results don't
+# depend on the number of `workers` processes. When `alpha` is given, the test
+# stops once the Monte Carlo confidence interval of the p-value is entirely
+# below or above `alpha` (the batches are checked in order, so early stopping
+# is also reproducible).
+
+PermutationTestResult = namedtuple("PermutationTestResult",
+                                   ["statistic", "pvalue", "stderr", "n_permutations", "null_distribution"])
+
+def _permutation_batch(pooled, n1, statfunc, size, seedseq):
+    """
+    Returns the statistics of `size` random permutations of the `pooled` data,
+    where the first `n1` values of each permutation form the first sample.
+    """
+    rng = np.random.default_rng(seedseq)
+    permuted = rng.permuted(np.broadcast_to(pooled, (size, len(pooled))), axis=1)
+    return np.asarray(statfunc(permuted[:,:n1], permuted[:,n1:], axis=-1), dtype=float)
+
+def _permutation_pvalue(null, observed, alternative):
+    """
+    Returns the p-value and its standard error for the statistics in `null`.
+    """
+    m = len(null)
+    gamma = abs(1e-14 * observed)    # tolerance for ties due to rounding errors
+    p_less = (np.count_nonzero(null <= observed + gamma) + 1) / (m + 1)
+    p_greater = (np.count_nonzero(null >= observed - gamma) + 1) / (m + 1)
+    if alternative == "less":
+        p, factor = p_less, 1
+    elif alternative == "greater":
+        p, factor = p_greater, 1
+    else:
+        p, factor = min(p_less, p_greater), 2
+    stderr = factor * np.sqrt(p * (1 - p) / m)
+    return min(1.0, factor * p), stderr
+
+@profiled
+def permutation_test(xs, ys, statistic="meandiff", alternative="two-sided", n_permutations=10000,
+                     batchsize=None, seed=None, workers=None, alpha=None, confidence_level=0.99):
+    """
+    Permutation test for the difference between the samples `xs` and `ys`
+    using the `statistic` (see BOOTSTRAP_STATISTICS or pass a function `f(xs,
+    ys, axis)`), with `alternative` "two-sided", "less", or "greater".
+    Pass `alpha` to stop early, once the `confidence_level` interval of the
+    p-value is below or above `alpha`, and `workers` to compute the batches on
+    several processes (`workers=-1` to use all CPU cores).
+    Returns a `PermutationTestResult` with the observed `statistic`, the `pvalue`,
+    its Monte Carlo standard error `stderr`, the number of permutations used,
+    and the `null_distribution` of the statistic.
+    """
+    if alternative not in ("two-sided", "less", "greater"):
+        raise ValueError("Unknown alternative " + repr(alternative))
+    statfunc = _bootstrap_statistic(statistic)
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    pooled = np.concatenate([xs, ys])
+    observed = float(statfunc(xs, ys, axis=-1))
+    if batchsize is None:
+        batchsize = max(1, min(1000, DEFAULT_CHUNK_VALUES // len(pooled)))
+    sizes = [min(batchsize, n_permutations-start) for start in range(0, n_permutations, batchsize)]
+    seedseqs = _spawn_seeds(seed if seed is not None else np.random.SeedSequence(), len(sizes))
+    z = norm.ppf(1 - (1 - confidence_level) / 2)
+
+    def done(nulls):
+        if alpha is None:
+            return False
+        pvalue, stderr = _permutation_pvalue(np.concatenate(nulls), observed, alternative)
+        return pvalue + z*stderr < alpha or pvalue - z*stderr > alpha
+
+    nulls = []
+    if workers == -1:
+        workers = os.cpu_count()
+    if workers is None or workers == 1:
+        for size, seedseq in zip(sizes, seedseqs):
+            nulls.append(_permutation_batch(pooled, len(xs), statfunc, size, seedseq))
+            if done(nulls):
+                break
+    else:
+        # keep at most 2*workers batches in flight, and check them in order
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            batches = iter(zip(sizes, seedseqs))
+            futures = []
+            for size, seedseq in batches:
+                futures.append(executor.submit(_permutation_batch, pooled, len(xs), statfunc, size, seedseq))
+                if len(futures) < 2*workers:
+                    continue
+                nulls.append(futures.pop(0).result())
+                if done(nulls):
+                    break
+            else:
+                while futures and not (nulls and done(nulls)):
+                    nulls.append(futures.pop(0).result())
+            for future in futures:
+                future.cancel()
+
+    null = np.concatenate(nulls)
+    pvalue, stderr = _permutation_pvalue(null, observed, alternative)
+    return PermutationTestResult(observed, pvalue, stderr, len(null), null)
+
+
+
+
+# Simulation studies
+################################################################################
+# Coverage and power studies of the two-sample t-tests. The function
+# `ttest_ind_batch` computes the pooled-variance or Welch t-test for each row
+# of the 2D arrays `xs` and `ys` (one replicate per row) at once, and
+# `simulate_ttests` draws the replicates in chunks and summarizes the results.
+# Use `ttest_sweep` to run the simulations over grids of sample sizes, ratios
+# of standard deviations, and differences of means, e.g.
+#     ttest_sweep(n1s=[10,20], n2s=[40], sigma_ratios=[1,2,4], N=10000, seed=42)
+
+TTestResult = namedtuple("TTestResult", ["estimate", "statistic", "df", "pvalue", "low", "high"])
+
+def ttest_ind_batch(xs, ys, equal_var=True, alternative="two-sided", confidence_level=0.95):
+    """
+    Two-sample t-test of the difference of means between each row of `xs` and
+    the corresponding row of `ys` (observations along the last axis).
+    Uses the pooled variance when `equal_var` is True, otherwise Welch's test.
+    Returns a `TTestResult` of arrays with the difference of means `estimate`,
+    the t `statistic`, the degrees of freedom `df`, the `pvalue` for the
+    `alternative`, and the `confidence_level` CI [`low`,`high`] for the difference.
+    """
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    n1, n2 = xs.shape[-1], ys.shape[-1]
+    estimate = xs.mean(axis=-1) - ys.mean(axis=-1)
+    var1, var2 = xs.var(axis=-1, ddof=1), ys.var(axis=-1, ddof=1)
+    if equal_var:
+        df = np.full(estimate.shape, n1 + n2 - 2.0)
+        pooled_var = ((n1-1)*var1 + (n2-1)*var2) / df
+        stderr = np.sqrt(pooled_var * (1/n1 + 1/n2))
+    else:
+        vn1, vn2 = var1/n1, var2/n2
+        stderr = np.sqrt(vn1 + vn2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            df = (vn1 + vn2)**2 / (vn1**2/(n1-1) + vn2**2/(n2-1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        statistic = estimate / stderr
+    if alternative == "two-sided":
+        pvalue = 2 * tdist.sf(np.abs(statistic), df)
+    elif alternative == "less":
+        pvalue = tdist.cdf(statistic, df)
+    elif alternative == "greater":
+        pvalue = tdist.sf(statistic, df)
+    else:
+        raise ValueError("Unknown alternative " + repr(alternative))
+    margin = tdist.ppf(1 - (1 - confidence_level)/2, df) * stderr
+    return TTestResult(estimate, statistic, df, pvalue, estimate - margin, estimate + margin)
+
+@profiled
+def simulate_ttests(rv1, rv2, n1, n2, N=10000, alpha=0.05, confidence_level=0.95,
+                    seed=None, chunksize=None):
+    """
+    Simulate `N` replicates of samples of size `n1` from `rv1` and `n2` from
+    `rv2`, and run the pooled and Welch t-tests on each replicate.
+    Returns a dict {"pooled": summary, "welch": summary}, where each summary
+    contains the proportion of replicates with p-value < `alpha` ("rejection_rate",
+    the type I error rate if rv1 and rv2 have the same mean, the power otherwise),
+    the proportion of CIs that contain the true difference of means ("coverage"),
+    and the average width of the CIs ("ci_width").
+    """
+    true_diff = rv1.mean() - rv2.mean()
+    if chunksize is None:
+        chunksize = max(1, DEFAULT_CHUNK_VALUES // (n1 + n2))
+    seed1, seed2 = _spawn_seeds(seed, 2)
+    chunks1 = _gen_chunks(rv1, n1, N, chunksize=chunksize, seed=seed1)
+    chunks2 = _gen_chunks(rv2, n2, N, chunksize=chunksize, seed=seed2)
+    totals = {method: np.zeros(3) for method in ["pooled", "welch"]}
+    for xs, ys in zip(chunks1, chunks2):
+        for method, equal_var in [("pooled", True), ("welch", False)]:
+            res = ttest_ind_batch(xs, ys, equal_var=equal_var, confidence_level=confidence_level)
+            totals[method] += [np.sum(res.pvalue < alpha),
+                               np.sum((res.low <= true_diff) & (true_diff <= res.high)),
+                               np.sum(res.high - res.low)]
+    return {method: dict(zip(["rejection_rate", "coverage", "ci_width"], (total / N).tolist()))
+            for method, total in totals.items()}
+
+def _ttest_sweep_cell(cell, sigma, N, alpha, confidence_level, seedseq):
+    n1, n2, sigma_ratio, mu_diff = cell
+    rv1, rv2 = norm(mu_diff, sigma_ratio*sigma), norm(0, sigma)
+    summaries = simulate_ttests(rv1, rv2, n1, n2, N=N, alpha=alpha,
+                                confidence_level=confidence_level, seed=seedseq)
+    return [{"n1": n1, "n2": n2, "sigma_ratio": sigma_ratio, "mu_diff": mu_diff,
+             "method": method, **summary, "N": N} for method, summary in summaries.items()]
+
+@profiled
+def ttest_sweep(n1s, n2s, sigma_ratios, mu_diffs=(0,), sigma=1, N=10000, alpha=0.05,
+                confidence_level=0.95, seed=None, workers=None):
+    """
+    Run `simulate_ttests` for all combinations of the sample sizes `n1s` and
+    `n2s`, the ratios `sigma_ratios` of the standard deviations sigma1/sigma2,
+    and the differences of means `mu_diffs`, for the populations
+    norm(mu_diff, sigma_ratio*sigma) and norm(0, sigma).
+    Returns a tidy pd.DataFrame with one row per combination and t-test method.
+    Each combination gets its own random stream spawned from `seed`, and can be
+    simulated on `workers` processes (`workers=-1` to use all CPU cores).
+    """
+    cells = [(n1, n2, sigma_ratio, mu_diff) for n1 in n1s for n2 in n2s
+             for sigma_ratio in sigma_ratios for mu_diff in mu_diffs]
+    seedseqs = _spawn_seeds(seed, len(cells))
+    args = [cells, [sigma]*len(cells), [N]*len(cells), [alpha]*len(cells),
+            [confidence_level]*len(cells), seedseqs]
+    if workers == -1:
+        workers = os.cpu_count()
+    if workers is None or workers == 1:
+        results = map(_ttest_sweep_cell, *args)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_ttest_sweep_cell, *args))
+    rows = [row for cell_rows in results for row in cell_rows]
+    import pandas as pd
+    return pd.DataFrame(rows)
@@ -6,12 +6,20 @@ TODOs:
  - change x to xs (to signal it's a array-like)
  - rename all r.v. generation functions to use `gen_` prefix.
 """
+__version__ = "0.2.0"
+
+import functools
+import hashlib
+import inspect
+import io
+import json
 import os
+import shutil
+import tempfile
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from scipy.integrate import quad
 import seaborn as sns
 
 from scipy.stats import randint    # special handling beta+1=beta
@@ -21,6 +29,18 @@ from scipy.stats import expon      # hide loc=0 parameter
 from scipy.stats import gamma      # hide loc=0 parameter
 from scipy.stats import norm
 
+# The computations live in modules that don't import the plotting libraries,
+# so worker processes start quickly. All their helpers are available from here.
+from core_helpers import *
+from prob_helpers import *
+from sampling_helpers import *
+from inference_helpers import *
+from core_helpers import _Unhashable, _default_xlims, _fingerprint, _phase, _rv_func, _spawn_seeds
+import core_helpers
+import inference_helpers
+import prob_helpers
+import sampling_helpers
+
 
 
 # Figure settings
@@ -89,16 +109,438 @@ def default_labeler(params, params_to_latex):
     label = ', '.join(label_parts)
     return label
 
-def ensure_containing_dir_exists(filepath):
-    parent = os.path.join(filepath, os.pardir)
-    absparent = os.path.abspath(parent)
-    if not os.path.exists(absparent):
-        os.makedirs(absparent)
+
+
+# Figure export
+################################################################################
+# All the functions that accept a `filename` save their figures using
+# `export_figure`, which writes one file per format in `formats` (PDF and PNG
+# by default). Set EXPORT_IN_BACKGROUND = True (or PLOT_HELPERS_BACKGROUND_EXPORT=1)
+# to write the files on a background thread, and call `wait_for_exports()`
+# before using the files. The figures are always rendered on the calling thread
+# (matplotlib isn't thread-safe), and only the writes of the rendered bytes to
+# the files happen in the background, so the figure can be modified right away.
+
+EXPORT_FORMATS = ("pdf", "png")
+EXPORT_DPI = 300
+EXPORT_IN_BACKGROUND = os.environ.get("PLOT_HELPERS_BACKGROUND_EXPORT", "") not in ("", "0")
+EXPORT_WORKERS = 2
+VECTOR_FORMATS = ("pdf", "svg", "eps", "ps")
+RASTERIZE_THRESHOLD = 5000    # rasterize scatter layers with more points in vector output
+
+_export_executor = None
+_pending_exports = {}         # basename --> list of futures of its background exports
+
+def _basename(filename):
+    return filename.replace('.pdf','').replace('.png','')
+
+def _output_files(filename, formats=None):
+    """
+    Returns the list of files written for the figure `filename`.
+    """
+    basename = _basename(filename)
+    return [basename + '.' + fmt for fmt in (formats or EXPORT_FORMATS)]
+
+def _rasterize_large_layers(fig, threshold):
+    """
+    Mark the scatter layers of `fig` with more than `threshold` points as
+    rasterized, so vector output files contain a single image for them.
+    """
+    from matplotlib.collections import Collection
+    for collection in fig.findobj(Collection):
+        if len(collection.get_offsets()) > threshold:
+            collection.set_rasterized(True)
+
+def _render_figure(fig, fmt, dpi):
+    """
+    Returns the contents of the file with the format `fmt` for the figure `fig`.
+    """
+    with _phase("savefig", helper="export_figure"):
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt, dpi=dpi, bbox_inches="tight", pad_inches=0.02)
+    return buffer.getvalue()
+
+def _write_files(contents):
+    """
+    Write the bytes `data` to `outfile` for each pair in `contents`.
+    """
+    for outfile, data in contents:
+        with open(outfile, "wb") as outfp:
+            outfp.write(data)
+    return [outfile for outfile, _ in contents]
+
+@profiled
+def export_figure(fig, filename, formats=None, dpi=None, background=None):
+    """
+    Layout the figure `fig` and save it as `filename` in all the `formats`
+    (default EXPORT_FORMATS) at the resolution `dpi` (default EXPORT_DPI).
+    Returns a `concurrent.futures.Future` whose result is the list of files.
+    """
+    from concurrent.futures import Future, ThreadPoolExecutor
+    global _export_executor
+    formats = formats or EXPORT_FORMATS
+    dpi = dpi or EXPORT_DPI
+    background = EXPORT_IN_BACKGROUND if background is None else background
+    outfiles = _output_files(filename, formats)
+
+    ensure_containing_dir_exists(filename)
+    if fig.get_layout_engine() is None:
+        with _phase("layout"):
+            fig.tight_layout()
+    if any(fmt in VECTOR_FORMATS for fmt in formats):
+        _rasterize_large_layers(fig, RASTERIZE_THRESHOLD)
+
+    contents = [(outfile, _render_figure(fig, fmt, dpi)) for outfile, fmt in zip(outfiles, formats)]
+    if background:
+        if _export_executor is None:
+            _export_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS,
+                                                  thread_name_prefix="export_figure")
+        future = _export_executor.submit(_write_files, contents)
+        _pending_exports.setdefault(_basename(filename), []).append(future)
+    else:
+        future = Future()
+        try:
+            future.set_result(_write_files(contents))
+        except Exception as e:
+            future.set_exception(e)
+            raise
+    return future
+
+def wait_for_exports():
+    """
+    Wait until all the background exports are done, and return the list of
+    files written. If some exports failed, raises a RuntimeError that lists
+    all the errors, after waiting for the other exports.
+    """
+    outfiles, errors = [], []
+    while _pending_exports:
+        _, futures = _pending_exports.popitem()
+        for future in futures:
+            try:
+                outfiles.extend(future.result())
+            except Exception as e:
+                errors.append(e)
+    if errors:
+        messages = "\n".join(type(e).__name__ + ": " + str(e) for e in errors)
+        raise RuntimeError(str(len(errors)) + " figure exports failed:\n" + messages) from errors[0]
+    return outfiles
+
+
+
+# Figure cache
+################################################################################
+# Functions decorated with `@cached_figure` save their output files and return
+# value in a content-addressed store, keyed on a hash of the function name, its
+# arguments, the matplotlib rcParams and render backend, the export formats and
+# resolution, and the source code of the helper modules. A repeated call with
+# the same arguments copies the stored files to the requested filename, without
+# running the function, and shows the stored PNG image in a new figure (figure
+# and axes return values refer to this figure). The return values are stored
+# as JSON and `.npz` arrays, functions that return other values aren't cached.
+# The cache is off by default: set FIGURE_CACHE_ENABLED = True (or
+# PLOT_HELPERS_FIGURE_CACHE=1) to use it, as `build_figures.py` does.
+# Pass `rebuild=True` (or set PLOT_HELPERS_REBUILD=1) to force a re-render.
+
+FIGURE_CACHE_ENABLED = os.environ.get("PLOT_HELPERS_FIGURE_CACHE", "") not in ("", "0")
+FIGURE_CACHE_DIR = os.environ.get("PLOT_HELPERS_CACHE_DIR",
+                                  os.path.join(os.path.expanduser("~"), ".cache", "plot_helpers"))
+FIGURE_CACHE_MAX_BYTES = int(os.environ.get("PLOT_HELPERS_CACHE_MAX_BYTES", 500 * 2**20))
+
+
+@functools.lru_cache(maxsize=None)
+def _module_fingerprint():
+    """
+    Hash of the source code of this module and of the compute modules it uses.
+    """
+    source_hash = hashlib.sha256()
+    for module in [core_helpers, prob_helpers, sampling_helpers, inference_helpers]:
+        with open(module.__file__, "rb") as srcfile:
+            source_hash.update(srcfile.read())
+    with open(__file__, "rb") as srcfile:
+        source_hash.update(srcfile.read())
+    return __version__ + ":" + source_hash.hexdigest()
+
+def _rcparams_fingerprint():
+    """
+    Hash of the current matplotlib settings (figure size, fonts, styles, etc.).
+    """
+    settings = sorted((key, repr(value)) for key, value in plt.rcParams.items())
+    return hashlib.sha256(repr(settings).encode("utf8")).hexdigest()
+
+def _evict_figure_cache(max_bytes):
+    """
+    Remove the least recently used entries until the cache is below `max_bytes`.
+    """
+    if not os.path.isdir(FIGURE_CACHE_DIR):
+        return
+    entries = []
+    for key in os.listdir(FIGURE_CACHE_DIR):
+        entry = os.path.join(FIGURE_CACHE_DIR, key)
+        if not os.path.isdir(entry) or key.startswith("tmp"):
+            continue
+        size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+        entries.append((os.path.getmtime(entry), size, entry))
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+def _encode_result(result, arrays):
+    """
+    Returns a JSON-serializable description of the return value `result` and
+    adds its arrays to the dict `arrays`. Raises `_Unhashable` for values that
+    can't be stored (only numbers, strings, arrays, figures, and axes, and
+    lists and tuples of them are supported).
+    """
+    if result is None or isinstance(result, (bool, int, float, str)):
+        return {"value": result}
+    if isinstance(result, plt.Figure):
+        return {"figure": None}
+    if isinstance(result, plt.Axes):
+        return {"axes": None}
+    if isinstance(result, (np.ndarray, np.generic)) and result.dtype != object:
+        name = "array" + str(len(arrays))
+        arrays[name] = result
+        return {"array": name}
+    if isinstance(result, (list, tuple)):
+        return {type(result).__name__: [_encode_result(item, arrays) for item in result]}
+    raise _Unhashable(type(result).__name__)
+
+def _decode_result(description, arrays, fig, ax):
+    """
+    Returns the value described by `description` (see `_encode_result`), where
+    figures and axes are replaced by `fig` and `ax`.
+    """
+    kind, value = next(iter(description.items()))
+    if kind == "value":
+        return value
+    if kind == "figure":
+        return fig
+    if kind == "axes":
+        return ax
+    if kind == "array":
+        return arrays[value][()] if arrays[value].ndim == 0 else arrays[value]
+    items = [_decode_result(item, arrays, fig, ax) for item in value]
+    return items if kind == "list" else tuple(items)
+
+def _figure_from_image(path, dpi):
+    """
+    Returns a new figure and axes that show the PNG image `path` at its size.
+    """
+    image = plt.imread(path)
+    height, width = image.shape[:2]
+    fig = plt.figure(figsize=(width/dpi, height/dpi), dpi=dpi)
+    ax = fig.add_axes((0, 0, 1, 1))
+    ax.imshow(image)
+    ax.set_axis_off()
+    return fig, ax
+
+def _store_in_figure_cache(entry, outfiles, description, arrays, preview=None):
+    """
+    Copy the `outfiles`, the `description` of the return value and its
+    `arrays` to the cache `entry` directory, along with the PNG image of the
+    figure (the bytes `preview`, or the PNG file in `outfiles`).
+    """
+    tmpentry = None
+    try:
+        os.makedirs(FIGURE_CACHE_DIR, exist_ok=True)
+        tmpentry = tempfile.mkdtemp(prefix="tmp", dir=FIGURE_CACHE_DIR)
+        for outfile in outfiles:
+            shutil.copyfile(outfile, os.path.join(tmpentry, "out" + os.path.splitext(outfile)[1]))
+        if preview is not None:
+            with open(os.path.join(tmpentry, "out.png"), "wb") as previewfile:
+                previewfile.write(preview)
+        with open(os.path.join(tmpentry, "result.json"), "w") as resultfile:
+            json.dump(description, resultfile)
+        np.savez(os.path.join(tmpentry, "result.npz"), **arrays)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmpentry, entry)
+    except OSError:
+        if tmpentry:
+            shutil.rmtree(tmpentry, ignore_errors=True)
+    _evict_figure_cache(FIGURE_CACHE_MAX_BYTES)
+
+def clear_figure_cache():
+    """
+    Remove all the entries in the figure cache.
+    """
+    shutil.rmtree(FIGURE_CACHE_DIR, ignore_errors=True)
+
+def cached_figure(filename_arg, random=False):
+    """
+    Decorator that caches the files written by the function to the path given
+    in its `filename_arg` argument. The cache is only used when the function
+    creates its own figure (`ax` is None) and, for functions that generate
+    random samples (`random=True`), when a `seed` is given.
+    Cache hits draw the stored image in a new figure and return it in place of
+    the figure and axes return values.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, rebuild=False, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            filename = arguments.pop(filename_arg)
+            if not FIGURE_CACHE_ENABLED or not filename or arguments.get("ax") is not None \
+                    or (random and arguments.get("seed") is None):
+                return func(*args, **kwargs)
+            formats = tuple(arguments.get("formats") or EXPORT_FORMATS)
+            dpi = arguments.get("dpi") or EXPORT_DPI
+            try:
+                keysrc = func.__qualname__ + "|" + _fingerprint(arguments) + "|" + _module_fingerprint()\
+                    + "|" + _rcparams_fingerprint() + "|" + RENDER_BACKEND\
+                    + "|" + ",".join(formats) + "|" + str(dpi)
+            except _Unhashable:
+                return func(*args, **kwargs)
+            key = hashlib.sha256(keysrc.encode("utf8")).hexdigest()
+            entry = os.path.join(FIGURE_CACHE_DIR, key)
+            outfiles = _output_files(filename, formats)
+            stored_files = [os.path.join(entry, "out" + os.path.splitext(outfile)[1]) for outfile in outfiles]
+            rebuild = rebuild or os.environ.get("PLOT_HELPERS_REBUILD", "") not in ("", "0")
+
+            stored_png = os.path.join(entry, "out.png")
+            stored_results = [os.path.join(entry, "result.json"), os.path.join(entry, "result.npz")]
+
+            # cache hit: copy the stored files and show the stored image
+            if not rebuild and all(os.path.exists(path) for path in stored_files + stored_results + [stored_png]):
+                ensure_containing_dir_exists(filename)
+                for outfile, stored_file in zip(outfiles, stored_files):
+                    shutil.copyfile(stored_file, outfile)
+                os.utime(entry)
+                with open(stored_results[0]) as resultfile:
+                    description = json.load(resultfile)
+                with np.load(stored_results[1], allow_pickle=False) as npzfile:
+                    arrays = dict(npzfile)
+                fig, ax = _figure_from_image(stored_png, dpi)
+                return _decode_result(description, arrays, fig, ax)
+
+            # cache miss: run the function and store its outputs once they are written
+            result = func(*args, **kwargs)
+            arrays = {}
+            try:
+                description = _encode_result(result, arrays)
+            except _Unhashable:
+                return result
+            preview = None
+            if "png" not in formats:
+                fig = result if isinstance(result, plt.Figure) else getattr(result, "figure", None) or plt.gcf()
+                preview = _render_figure(fig, "png", dpi)
+            futures = _pending_exports.get(_basename(filename))
+            if futures:
+                future = futures[-1]   # the export started by this call
+                future.add_done_callback(
+                    lambda f: _store_in_figure_cache(entry, outfiles, description, arrays, preview)
+                    if f.exception() is None else None)
+            else:
+                _store_in_figure_cache(entry, outfiles, description, arrays, preview)
+            return result
+
+        return wrapper
+    return decorator
+
+
+
+
+# Rendering
+################################################################################
+# The curves in the plots are drawn using `sns.lineplot` (RENDER_BACKEND="seaborn")
+# or directly using matplotlib (RENDER_BACKEND="matplotlib"), which is much faster
+# for dense curves. The matplotlib backend also samples the curves adaptively:
+# dense where the function bends and sparse where it is flat.
+# Set the backend using `set_render_backend` or the PLOT_HELPERS_BACKEND env var.
+
+RENDER_BACKENDS = ["seaborn", "matplotlib"]
+RENDER_BACKEND = os.environ.get("PLOT_HELPERS_BACKEND", "seaborn")
+
+def set_render_backend(backend):
+    """
+    Choose the plotting library used to draw curves: "seaborn" or "matplotlib".
+    """
+    global RENDER_BACKEND
+    if backend not in RENDER_BACKENDS:
+        raise ValueError("Unknown render backend " + repr(backend) + "; use one of " + str(RENDER_BACKENDS))
+    RENDER_BACKEND = backend
+
+def _lineplot(x, y, ax=None, label=None, **kwargs):
+    """
+    Draw the curve through the points (`x`,`y`) using the current render backend.
+    """
+    with _phase("draw", x):
+        if RENDER_BACKEND == "seaborn":
+            return sns.lineplot(x=x, y=y, ax=ax, label=label, **kwargs)
+        if ax is None:
+            ax = plt.gca()
+        ax.plot(x, y, label=label, **kwargs)
+        if label:
+            ax.legend()
+        return ax
+
+def _scatterplot(x, y, ax=None, **kwargs):
+    """
+    Draw a scatter plot of the points (`x`,`y`) using the current render backend.
+    """
+    with _phase("draw", x):
+        if RENDER_BACKEND == "seaborn":
+            return sns.scatterplot(x=x, y=y, ax=ax, **kwargs)
+        if ax is None:
+            ax = plt.gca()
+        ax.scatter(x, y, **kwargs)
+        return ax
+
+def adaptive_grid(f, xmin, xmax, max_points=1000, init_points=65, tol=0.0005, breakpoints=()):
+    """
+    Returns points `xs` in [xmin,xmax] and the values `ys = f(xs)`, sampled
+    adaptively: intervals where the midpoint value of the vectorized function
+    `f` differs from the straight line by more than `tol` (relative to the range
+    of `f`) are split in two, until there are at most `max_points` points or
+    the intervals are shorter than `(xmax-xmin)/(8*max_points)` (discontinuities).
+    The `breakpoints` inside [xmin,xmax] are always included in `xs`.
+    """
+    min_dx = (xmax - xmin) / (8 * max_points)
+    xs = np.linspace(xmin, xmax, init_points)
+    breakpoints = [bp for bp in np.atleast_1d(breakpoints) if xmin < bp < xmax]
+    xs = np.unique(np.concatenate([xs, breakpoints]))
+    ys = f(xs)
+    while len(xs) < max_points:
+        mids = (xs[:-1] + xs[1:]) / 2
+        ymids = f(mids)
+        yscale = np.nanmax(ys) - np.nanmin(ys) or 1.0
+        errs = np.abs(ymids - (ys[:-1] + ys[1:]) / 2) / yscale
+        errs = np.where(np.isnan(errs), 0, errs)
+        refine = np.flatnonzero((errs > tol) & (np.diff(xs) > min_dx))
+        if len(refine) == 0:
+            break
+        if len(xs) + len(refine) > max_points:
+            budget = max_points - len(xs)
+            refine = refine[np.argsort(errs[refine])[::-1][:budget]]
+        order = np.argsort(np.concatenate([xs, mids[refine]]), kind="stable")
+        xs = np.concatenate([xs, mids[refine]])[order]
+        ys = np.concatenate([ys, ymids[refine]])[order]
+    return xs, ys
+
+def _curve(f, xmin, xmax, num, breakpoints=()):
+    """
+    Returns `num` equally spaced points `xs` and `f(xs)` for the seaborn backend,
+    or an adaptive grid with at most `num` points for the matplotlib backend.
+    Both grids include the `breakpoints` inside [xmin,xmax].
+    """
+    if RENDER_BACKEND == "seaborn":
+        breakpoints = [bp for bp in np.atleast_1d(breakpoints) if xmin < bp < xmax]
+        xs = np.unique(np.concatenate([np.linspace(xmin, xmax, num), breakpoints]))
+        return xs, f(xs)
+    return adaptive_grid(f, xmin, xmax, max_points=num, breakpoints=breakpoints)
+
 
 
 # Continuous random variables
 ################################################################################
 
+@profiled
 def plot_pdf(rv, xlims=None, ylims=None, rv_name="X", ax=None, title=None, label=None, linestyle='solid'):
     """
     Plot the pdf of the continuous random variable `rv` over the `xlims`.
@@ -113,12 +555,11 @@ def plot_pdf(rv, xlims=None, ylims=None, rv_name="X", ax=None, title=None, label
     if xlims:
         xmin, xmax = xlims
     else:
-        xmin, xmax = rv.ppf(0.000000001), rv.ppf(0.99999)
-    xs = np.linspace(xmin, xmax, 1000)
+        xmin, xmax = _default_xlims(rv, 0.000000001, 0.99999)
 
     # Compute the probability mass function and plot it
-    fXs = rv.pdf(xs)
-    sns.lineplot(x=xs, y=fXs, ax=ax, label=label, linestyle=linestyle)
+    xs, fXs = _curve(_rv_func(rv, "pdf"), xmin, xmax, 1000)
+    _lineplot(xs, fXs, ax=ax, label=label, linestyle=linestyle)
     ax.set_xlabel(rv_name.lower())
     ax.set_ylabel(f"$f_{{{rv_name}}}$")
     if ylims:
@@ -135,6 +576,7 @@ def plot_pdf(rv, xlims=None, ylims=None, rv_name="X", ax=None, title=None, label
 
 
 
+@profiled
 def calc_prob_and_plot(rv, a, b, xlims=None, ax=None, title=None):
     """
     Calculate the probability random variable `rv` falls between a and b,
@@ -142,67 +584,65 @@ def calc_prob_and_plot(rv, a, b, xlims=None, ax=None, title=None):
     """
 
     # 1. calculate Pr(a<X<b) == integral of rv.pdf between x=a and x=b
-    p = quad(rv.pdf, a, b)[0]
+    p = float(calc_probs(rv, a, b))
 
     # 2. plot the probability density function (pdf)
     if xlims:
         xmin, xmax = xlims
     else:
-        xmin, xmax = rv.ppf(0.001), rv.ppf(0.999)
-    x = np.linspace(xmin, xmax, 10000)
-    pX = rv.pdf(x)
-    ax = sns.lineplot(x=x, y=pX, ax=ax)
+        xmin, xmax = _default_xlims(rv)
+    x, pX = _curve(_rv_func(rv, "pdf"), xmin, xmax, 10000, breakpoints=[a, b])
+    ax = _lineplot(x, pX, ax=ax)
     if title is None:
         title = "Probability density for the random variable " + rv.dist.name + str(rv.args) \
                  + " between " + str(a) + " and " + str(b)
     ax.set_title(title, y=0, pad=-30)
 
     # 3. highlight the area under pX between x=a and x=b
-    mask = (x > a) & (x < b)
+    mask = (x >= a) & (x <= b)
     ax.fill_between(x[mask], y1=pX[mask], alpha=0.2, facecolor="blue")
-    ax.vlines([a], ymin=0, ymax=rv.pdf(a), linestyle="-", alpha=0.5, color="blue")
-    ax.vlines([b], ymin=0, ymax=rv.pdf(b), linestyle="-", alpha=0.5, color="blue")
+    ax.vlines([a], ymin=0, ymax=rv_eval(rv, "pdf", a), linestyle="-", alpha=0.5, color="blue")
+    ax.vlines([b], ymin=0, ymax=rv_eval(rv, "pdf", b), linestyle="-", alpha=0.5, color="blue")
     
     # return prob and figure axes
     return p, ax
 
 
 
+@profiled
 def calc_prob_and_plot_tails(rv, x_l, x_r, xlims=None, ax=None, title=None):
     """
     Plot the area-under-the-curve visualization for the distribution's tails and
     calculate their combined probability mass: Pr({X < x_l}) + Pr({X > x_r}).
     """
     # 1. compute the probability in the left (-∞,x_l] and right [x_r,∞) tails
-    p_l = quad(rv.pdf, rv.ppf(0.0000000000001), x_l)[0]
-    p_r = quad(rv.pdf, x_r, rv.ppf(0.9999999999999))[0]
-    p_tails = p_l + p_r
+    p_tails = float(calc_tail_probs(rv, x_l, x_r))
 
     # 2. plot the probability density function (pdf)
     if xlims:
         xmin, xmax = xlims
     else:
-        xmin, xmax = rv.ppf(0.001), rv.ppf(0.999)
-    x = np.linspace(xmin, xmax, 10000)
-    pX = rv.pdf(x)
-    ax = sns.lineplot(x=x, y=pX, ax=ax)
+        xmin, xmax = _default_xlims(rv)
+    x, pX = _curve(_rv_func(rv, "pdf"), xmin, xmax, 10000, breakpoints=[x_l, x_r])
+    ax = _lineplot(x, pX, ax=ax)
     if title is None:
         title = "Tails of the random variable " + rv.dist.name + str(rv.args)
     ax.set_title(title, y=0, pad=-30)
 
     # 3. highlight the area under pX for the tails
-    mask_l = x < x_l   # left tail
-    mask_u = x > x_r   # right tail
+    mask_l = x <= x_l   # left tail
+    mask_u = x >= x_r   # right tail
     ax.fill_between(x[mask_l], y1=pX[mask_l], alpha=0.3, facecolor="red")
     ax.fill_between(x[mask_u], y1=pX[mask_u], alpha=0.3, facecolor="red")
-    ax.vlines([x_l], ymin=0, ymax=rv.pdf(x_l), linestyle="-", alpha=0.5, color="red")
-    ax.vlines([x_r], ymin=0, ymax=rv.pdf(x_r), linestyle="-", alpha=0.5, color="red")
+    ax.vlines([x_l], ymin=0, ymax=rv_eval(rv, "pdf", x_l), linestyle="-", alpha=0.5, color="red")
+    ax.vlines([x_r], ymin=0, ymax=rv_eval(rv, "pdf", x_r), linestyle="-", alpha=0.5, color="red")
 
     # return prob and figure axes
     return p_tails, ax
 
 
 
+@profiled
 def plot_pdf_and_cdf(rv, b=None, a=-np.inf, xlims=None, rv_name="X", title=None):
     """
     Plot side-by-side figure that shows pdf and CDF of random variable `rv`.
@@ -225,31 +665,30 @@ def plot_pdf_and_cdf(rv, b=None, a=-np.inf, xlims=None, rv_name="X", title=None)
     if xlims:
         xmin, xmax = xlims
     else:
-        xmin, xmax = rv.ppf(0.001), rv.ppf(0.999)
-    x = np.linspace(xmin, xmax, 1000)
-    pX = rv.pdf(x)
-    sns.lineplot(x=x, y=pX, ax=ax0)
+        xmin, xmax = _default_xlims(rv)
+    x, pX = _curve(_rv_func(rv, "pdf"), xmin, xmax, 1000, breakpoints=[b] if b else [])
+    _lineplot(x, pX, ax=ax0)
     ax0.set_title("Probability density function")
 
     if b:
         # highlight the area under pX between x=a and x=b
-        mask = (x > a) & (x < b)
+        mask = (x >= a) & (x <= b)
         ax0.fill_between(x[mask], y1=pX[mask], alpha=0.2, facecolor="blue")
-        ax0.vlines([b], ymin=0, ymax=rv.pdf(b), linestyle="-", alpha=0.5, color="blue")
+        ax0.vlines([b], ymin=0, ymax=rv_eval(rv, "pdf", b), linestyle="-", alpha=0.5, color="blue")
         ax0.text(b, 0, "$b$", horizontalalignment="center", verticalalignment="top")
-        ax0.text(b, rv.pdf(b)/2.5, r"Pr$(\{" + rv_name + r" \leq b \})$    ",
+        ax0.text(b, rv_eval(rv, "pdf", b)/2.5, r"Pr$(\{" + rv_name + r" \leq b \})$    ",
                  horizontalalignment="right", verticalalignment="center")
 
     # 2. plot the CDF
-    FX = rv.cdf(x)
-    sns.lineplot(x=x, y=FX, ax=ax1)
+    xF, FX = _curve(_rv_func(rv, "cdf"), xmin, xmax, 1000, breakpoints=[b] if b else [])
+    _lineplot(xF, FX, ax=ax1)
     ax1.set_title("Cumulative distribution function")
 
     if b:
         # highlight the point x=b
-        ax1.vlines([b], ymin=0, ymax=rv.cdf(b), linestyle="-", color="blue")
+        ax1.vlines([b], ymin=0, ymax=rv_eval(rv, "cdf", b), linestyle="-", color="blue")
         ax1.text(b, 0, "$b$", horizontalalignment="center", verticalalignment="top")
-        ax1.text(b, rv.cdf(b), "$(b, F_{" + rv_name + "}(b))$",
+        ax1.text(b, rv_eval(rv, "cdf", b), "$(b, F_{" + rv_name + "}(b))$",
                  horizontalalignment="right", verticalalignment="bottom")
 
     # return figure and axes
@@ -257,11 +696,14 @@ def plot_pdf_and_cdf(rv, b=None, a=-np.inf, xlims=None, rv_name="X", title=None)
 
 
 
+@profiled
+@cached_figure("fname")
 def generate_pdf_panel(fname, xs, model, params_matrix,
                        params_to_latex={},
                        xticks=None, ylims=None,
                        fontsize=10,
-                       labeler=default_labeler):
+                       labeler=default_labeler,
+                       formats=None, dpi=None):
     """
     Generate PDF and PNG figures with panel of probability density function of
     `model` over the sample space `xs` for all RV parameters specified in the
@@ -272,12 +714,7 @@ def generate_pdf_panel(fname, xs, model, params_matrix,
     N = max( [len(row) for row in params_matrix] )
 
     # RV generation
-    fXs_matrix = np.zeros( (M,N,len(xs)) )
-    for i in range(0,M):
-        for j in range(0,N):
-            params = params_matrix[i][j]
-            rv = model(**params)
-            fXs_matrix[i][j] = rv.pdf(xs)
+    fXs_matrix = eval_params_grid(model, params_matrix, xs, method="pdf")
 
     # Generate the MxN panel of subplots
     fig, axarr = plt.subplots(M, N, sharey=True)
@@ -307,7 +744,7 @@ def generate_pdf_panel(fname, xs, model, params_matrix,
             else:
                 display_params = params
             label = labeler(display_params, params_to_latex)
-            sns.lineplot(x=xs, y=fXs, ax=ax)
+            _lineplot(xs, fXs, ax=ax)
             if ylims:
                 ax.set_ylim(*ylims)
             if xticks is not None:
@@ -318,11 +755,7 @@ def generate_pdf_panel(fname, xs, model, params_matrix,
                     size=fontsize)
 
     # Save as PDF and PNG
-    ensure_containing_dir_exists(fname)
-    basename = fname.replace('.pdf','').replace('.png','')
-    fig.tight_layout()
-    fig.savefig(basename + '.pdf', dpi=300, bbox_inches="tight", pad_inches=0.02)
-    fig.savefig(basename + '.png', dpi=300, bbox_inches="tight", pad_inches=0.02)
+    export_figure(fig, fname, formats=formats, dpi=dpi)
 
     return fig
 
@@ -331,6 +764,7 @@ def generate_pdf_panel(fname, xs, model, params_matrix,
 # Discrete random variables
 ################################################################################
 
+@profiled
 def plot_pmf(rv, xlims=None, ylims=None, rv_name="X", ax=None, title=None, label=None):
     """
     Plot the pmf of the discrete random variable `rv` over the `xlims`.
@@ -345,13 +779,14 @@ def plot_pmf(rv, xlims=None, ylims=None, rv_name="X", ax=None, title=None, label
     if xlims:
         xmin, xmax = xlims
     else:
-        xmin, xmax = rv.ppf(0.000000001), rv.ppf(0.99999)
+        xmin, xmax = _default_xlims(rv, 0.000000001, 0.99999)
     xs = np.arange(xmin, xmax)
 
     # Compute the probability mass function and plot it
-    fXs = rv.pmf(xs)
+    fXs = rv_eval(rv, "pmf", xs)
     fXs = np.where(fXs == 0, np.nan, fXs)  # set zero fXs to np.nan
-    ax.stem(fXs, basefmt=" ", label=label)
+    with _phase("draw", xs):
+        ax.stem(fXs, basefmt=" ", label=label)
     ax.set_xticks(xs)
     ax.set_xlabel(rv_name.lower())
     ax.set_ylabel(f"$f_{{{rv_name}}}$")
@@ -369,6 +804,7 @@ def plot_pmf(rv, xlims=None, ylims=None, rv_name="X", ax=None, title=None, label
     return ax
 
 
+@profiled
 def plot_cdf(rv, xlims=None, ylims=None, rv_name="X", ax=None, title=None, label=None):
     """
     Plot the CDF of the random variable `rv` (discrete or continuous) over the `xlims`.
@@ -383,12 +819,11 @@ def plot_cdf(rv, xlims=None, ylims=None, rv_name="X", ax=None, title=None, label
     if xlims:
         xmin, xmax = xlims
     else:
-        xmin, xmax = rv.ppf(0.000000001), rv.ppf(0.99999)
-    xs = np.linspace(xmin, xmax, 1000)
+        xmin, xmax = _default_xlims(rv, 0.000000001, 0.99999)
 
     # Compute the CDF and plot it
-    FXs = rv.cdf(xs)
-    sns.lineplot(x=xs, y=FXs, ax=ax)
+    xs, FXs = _curve(_rv_func(rv, "cdf"), xmin, xmax, 1000)
+    _lineplot(xs, FXs, ax=ax)
 
     # Set plot attributes
     ax.set_xlabel(rv_name.lower())
@@ -406,11 +841,14 @@ def plot_cdf(rv, xlims=None, ylims=None, rv_name="X", ax=None, title=None, label
     return ax
 
 
+@profiled
+@cached_figure("fname")
 def generate_pmf_panel(fname, xs, model, params_matrix,
                        params_to_latex={},
                        xticks=None,
                        fontsize=10,
-                       labeler=default_labeler):
+                       labeler=default_labeler,
+                       formats=None, dpi=None):
     """
     Generate PDF and PNG figures with panel of probability mass function of
     `model` over the sample space `xs` for all RV parameters specified in the
@@ -420,26 +858,8 @@ def generate_pmf_panel(fname, xs, model, params_matrix,
     M = len(params_matrix)
     N = max( [len(row) for row in params_matrix] )
 
-    # prepare x-axis ticks at aevery multiple of `kticks`
-    xmax = np.max(xs) + 1
-
     # RV generation
-    fX_matrix = np.zeros( (M,N,xmax) )
-    for i in range(0,M):
-        for j in range(0,N):
-            params = params_matrix[i][j]
-            rv = model(**params)
-            low, high = rv.support()
-            if high == np.inf:
-                high = 1000
-            calX = range(low, high+1)
-            fXs = []
-            for x in xs:
-                if x in calX:
-                    fXs.append(rv.pmf(x))
-                else:
-                    fXs.append(np.nan)
-            fX_matrix[i][j] = fXs
+    fX_matrix = eval_params_grid(model, params_matrix, xs, method="pmf")
 
     # Generate the MxN panel of subplots
     fig, axarr = plt.subplots(M, N, sharex=True, sharey=True)
@@ -468,7 +888,8 @@ def generate_pmf_panel(fname, xs, model, params_matrix,
             else:
                 display_params = params
             label = labeler(display_params, params_to_latex)
-            markerline, _stemlines, _baseline = ax.stem(fX, basefmt=" ")
+            with _phase("draw", xs):
+                markerline, _stemlines, _baseline = ax.stem(fX, basefmt=" ")
             plt.setp(markerline, markersize = 2)
             if xticks is not None:
                 ax.xaxis.set_ticks(xticks)
@@ -478,24 +899,151 @@ def generate_pmf_panel(fname, xs, model, params_matrix,
                     size=fontsize)
 
     # Save as PDF and PNG
-    ensure_containing_dir_exists(fname)
-    basename = fname.replace('.pdf','').replace('.png','')
-    fig.tight_layout()
-    fig.savefig(basename + '.pdf', dpi=300, bbox_inches="tight", pad_inches=0.02)
-    fig.savefig(basename + '.png', dpi=300, bbox_inches="tight", pad_inches=0.02)
+    export_figure(fig, fname, formats=formats, dpi=dpi)
     
     return fig
 
 
+# Joint distributions
+################################################################################
+# Plots of the joint distributions tabulated on a grid by `joint_grid` (see
+# prob_helpers), e.g.
+#     joint = joint_grid((randint(1,7), randint(1,7)), range(1,7), range(1,7))
+#     plot_joint(joint, kind="contour", rv_names=("X","Y"))
+
+
+def _spacing(points):
+    return points[1] - points[0] if len(points) > 1 else 1.0
+
+def _is_uniform(points):
+    return len(points) < 3 or np.allclose(np.diff(points), _spacing(points), rtol=1e-6, atol=0)
+
+def _plot_marginal(ax, points, fs, discrete, vertical=False, color="b"):
+    """
+    Draw the marginal pmf (stems) or pdf (filled curve) `fs` at the `points`
+    in a marginal strip, along the y-axis when `vertical=True`.
+    """
+    with _phase("draw", points):
+        if discrete:
+            fs = np.where(fs == 0, np.nan, fs)    # don't draw markers at zero
+            if vertical:
+                ax.hlines(points, 0, fs, color=color)
+                ax.plot(fs, points, "o", color=color, markersize=3)
+            else:
+                ax.vlines(points, 0, fs, color=color)
+                ax.plot(points, fs, "o", color=color, markersize=3)
+        elif vertical:
+            ax.plot(fs, points, color=color)
+            ax.fill_betweenx(points, 0, fs, color=color, alpha=0.2)
+        else:
+            ax.plot(points, fs, color=color)
+            ax.fill_between(points, 0, fs, color=color, alpha=0.2)
+
+
+@profiled
+def plot_joint(joint, kind="heatmap", marginals=True, rv_names=("X","Y"), levels=10,
+               cmap="Blues", ax=None, xlims=None, ylims=None, filename=None, formats=None, dpi=None):
+    """
+    Plot the `TabulatedJoint` distribution `joint` (see `joint_grid`) as a
+    heatmap (`kind="heatmap"`) or as contour lines (`kind="contour"`), with
+    the marginal distributions in strips above and to the right of the plot.
+    Strips are drawn only when `ax` is not given (`marginals=False` to hide).
+    Returns the axes of the joint plot and of the two marginals (or None).
+    """
+    # 1. Setup figure and axes
+    ax_x = ax_y = None
+    if ax is not None:
+        fig = ax.figure
+    elif marginals:
+        fig = plt.figure(layout="constrained")
+        grid = fig.add_gridspec(2, 2, width_ratios=(4,1), height_ratios=(1,4))
+        ax = fig.add_subplot(grid[1,0])
+        ax_x = fig.add_subplot(grid[0,0], sharex=ax)
+        ax_y = fig.add_subplot(grid[1,1], sharey=ax)
+    else:
+        fig, ax = plt.subplots()
+
+    # 2. Plot the joint pmf or pdf
+    xname, yname = rv_names
+    with _phase("draw", joint.values):
+        if kind == "heatmap":
+            values = np.where(joint.values > 0, joint.values, np.nan) if any(joint.discrete) else joint.values
+            if _is_uniform(joint.xs) and _is_uniform(joint.ys):
+                # an image is much faster to draw than a mesh with one patch per cell
+                dx, dy = _spacing(joint.xs), _spacing(joint.ys)
+                extent = (joint.xs[0]-dx/2, joint.xs[-1]+dx/2, joint.ys[0]-dy/2, joint.ys[-1]+dy/2)
+                mesh = ax.imshow(values.T, origin="lower", extent=extent, aspect="auto",
+                                 interpolation="nearest", cmap=cmap, vmin=0)
+            else:
+                mesh = ax.pcolormesh(joint.xs, joint.ys, values.T, shading="nearest", cmap=cmap,
+                                     vmin=0, rasterized=True)
+        elif kind == "contour":
+            mesh = ax.contour(joint.xs, joint.ys, joint.values.T, levels=levels, cmap=cmap)
+        else:
+            raise ValueError("Unknown kind " + repr(kind) + ", use 'heatmap' or 'contour'")
+    ax.set_xlabel(xname.lower())
+    ax.set_ylabel(yname.lower())
+    if ax_x is None:
+        fig.colorbar(mesh, ax=ax, label=f"$f_{{{xname}{yname}}}$")
+
+    # 3. Add the marginals
+    if ax_x is not None:
+        _plot_marginal(ax_x, joint.xs, joint.marginal_x(), joint.discrete[0])
+        _plot_marginal(ax_y, joint.ys, joint.marginal_y(), joint.discrete[1], vertical=True)
+        ax_x.set_ylabel(f"$f_{{{xname}}}$")
+        ax_y.set_xlabel(f"$f_{{{yname}}}$")
+        ax_x.set_ylim(bottom=0)
+        ax_y.set_xlim(left=0)
+        ax_x.tick_params(labelbottom=False)
+        ax_y.tick_params(labelleft=False)
+
+    # 4. Handle keyword arguments
+    if xlims:
+        ax.set_xlim(xlims)
+    if ylims:
+        ax.set_ylim(ylims)
+    if filename:
+        export_figure(fig, filename, formats=formats, dpi=dpi)
+
+    return ax, ax_x, ax_y
+
+
+
+
 # Diagnositic plots (used in Section 2.7 Random variable generation)
 ################################################################################
 # The function qq_plot tries to imitate the behaviour of the function `qqplot`
 # defined in `statsmodels.graphics.api`. Usage: `qqplot(data, dist=norm(0,1), line='q')`. See:
 # https://github.com/statsmodels/statsmodels/blob/main/statsmodels/graphics/gofplots.py#L912-L919
-#
-# TODO: figure out how to plot all of data correctly: currenlty missing first and last data point
+# Like statsmodels, we plot the sorted data against the theoretical quantiles
+# at the plotting positions (i-a)/(n+1-2a) for i=1,...,n, so all points are shown.
+# The points are computed by `calc_qq_points` (see prob_helpers).
 
-def qq_plot(data, dist, ax=None, xlims=None, filename=None):
+def _thin_indices(xs, max_points):
+    """
+    Returns the indices of at most `max_points` (and at least 2) of the sorted
+    values `xs`: the first and the last values, and values equally spaced by
+    rank and by value, so the tails are not thinned out.
+    """
+    n = len(xs)
+    k = max(max_points - 2, 0)    # number of points besides the first and the last
+    by_rank = np.linspace(0, n-1, k//2).round().astype(int)
+    by_value = np.searchsorted(xs, np.linspace(xs[0], xs[-1], k - k//2))
+    return np.unique(np.concatenate([by_rank, by_value.clip(0, n-1), [0, n-1]]))
+
+
+@profiled
+@cached_figure("filename")
+def qq_plot(data, dist, ax=None, xlims=None, filename=None, formats=None, dpi=None,
+            max_points=None, kind="scatter", return_points=False):
+    """
+    Draw the Q-Q plot of the `data` against the theoretical distribution `dist`.
+    For large datasets, use `max_points` to plot only a thinned subset of the
+    points (all extreme points are kept), or use `kind="hexbin"` to show the
+    density of the points as a shaded Q-Q band.
+    Returns the axes, or `(ax, xs, ys)` with the theoretical quantiles `xs` and
+    the data quantiles `ys` of the plotted points if `return_points=True`.
+    """
     # Setup figure and axes
     if ax is None:
         fig, ax = plt.subplots()
@@ -503,57 +1051,63 @@ def qq_plot(data, dist, ax=None, xlims=None, filename=None):
         fig = ax.figure
 
     # Add the Q-Q scatter plot
-    qs = np.linspace(0, 1, len(data)+1)
-    xs = dist.ppf(qs)
-    ys = np.quantile(data, qs)
-    sns.scatterplot(x=xs, y=ys, ax=ax, alpha=0.2)
+    xs, ys = calc_qq_points(data, dist)
+    if kind == "hexbin":
+        gridsize = 200 if max_points is None else max(10, int(np.sqrt(max_points)))
+        with _phase("draw", xs):
+            ax.hexbin(xs, ys, gridsize=gridsize, bins="log", mincnt=1, cmap="Blues", linewidths=0)
+        xs_plot, ys_plot = xs, ys
+    else:
+        if max_points is not None and len(xs) > max_points:
+            idx = _thin_indices(xs, max_points)
+            xs_plot, ys_plot = xs[idx], ys[idx]
+        else:
+            xs_plot, ys_plot = xs, ys
+        _scatterplot(xs_plot, ys_plot, ax=ax, alpha=0.2)
 
     # Compute the parameters m and b for the diagonal
-    xq25, xq75 = dist.ppf([0.25, 0.75])
-    yq25, yq75 = np.quantile(data, [0.25,0.75])
+    xq25, xq75 = rv_eval(dist, "ppf", np.array([0.25, 0.75]))
+    yq25, yq75 = np.quantile(ys, [0.25,0.75])
     m = (yq75-yq25)/(xq75-xq25)
     b = yq25 - m * xq25
     # add the line  y = m*x+b  to the plot
-    linexs = np.linspace(min(xs[1:]),max(xs[:-1]))
+    linexs = np.linspace(xs[0], xs[-1])
     lineys = m*linexs + b
-    sns.lineplot(x=linexs, y=lineys, ax=ax, color="r")
+    _lineplot(linexs, lineys, ax=ax, color="r")
 
     # Handle keyword arguments
     if xlims:
         ax.set_xlim(xlims)
     if filename:
-        basename = filename.replace('.pdf','').replace('.png','')
-        fig.tight_layout()
-        fig.savefig(basename + '.pdf', dpi=300, bbox_inches="tight", pad_inches=0.02)
-        fig.savefig(basename + '.png', dpi=300, bbox_inches="tight", pad_inches=0.02)
+        export_figure(fig, filename, formats=formats, dpi=dpi)
 
+    if return_points:
+        return ax, xs_plot, ys_plot
     return ax
 
 
 
 
-
 # Random samples
 ################################################################################
+# Plots of the samples and sampling distributions generated by `gen_samples`
+# and `gen_sampling_dist` (see sampling_helpers).
 
-def gen_samples(rv, n=30, N=10):
-    """
-    Generate `N` samples of size `n` from the random variable `rv`.
-    Returns a pd.DataFrame with `N` columns containing the samples.
-    """
-    samples = {}
-    for i in range(0, N):
-        column_name = "sample" + str(i)
-        samples[column_name] = rv.rvs(n)
-    samples_df = pd.DataFrame(samples)
-    return samples_df
-
-
-def plot_samples(samples_df, ax=None, xlims=None, filename=None):
+@profiled
+def plot_samples(samples_df, ax=None, xlims=None, filename=None, formats=None, dpi=None,
+                 kind="strip"):
     """
     Draw a strip plots for each of the columns in `samples_df`.
     Annotate each strip plot with the mean for each sample.
+    Use `kind="density"` for large samples to draw binned strips, with one
+    marker per bin shaded according to the number of values it contains.
+    The `samples_df` can also be a `SampleSet`.
     """
+    if isinstance(samples_df, SampleSet):
+        xbars = samples_df.mean()
+        samples_df = samples_df.to_dataframe()    # a view, no copy
+    else:
+        xbars = samples_df.mean().to_numpy()
     n, N = samples_df.shape  # sample size, number of samples
 
     # 1. Setup figure and axes
@@ -563,123 +1117,183 @@ def plot_samples(samples_df, ax=None, xlims=None, filename=None):
         fig = ax.figure
 
     # 2. Plot the samples as strip plot
-    pal = "dark:b"
-    sns.stripplot(samples_df, orient="h", palette=pal, ax=ax)
+    if kind == "density":
+        values = samples_df.to_numpy()
+        lo, hi = xlims if xlims else (np.nanmin(values), np.nanmax(values))
+        _binned_rug(ax, values, np.arange(0, N), lo, hi, color="b", marker="o", s=20)
+        ticks = np.arange(0, N, max(1, N // 20))   # label at most 20 of the samples
+        ax.set_yticks(ticks, labels=[str(samples_df.columns[i]) for i in ticks])
+        ax.set_ylim(N-0.5, -0.5)
+    else:
+        pal = "dark:b"
+        with _phase("draw", samples_df):
+            sns.stripplot(samples_df, orient="h", palette=pal, ax=ax)
 
     # 3. Add diamond-shaped marker to indicate mean in each sample
-    for i in range(0, N):
-        column_name = "sample" + str(i)
-        xbar_i = samples_df[column_name].mean()
-        ax.scatter(xbar_i, i, marker="D", s=75, color="r", zorder=10)
+    ax.scatter(xbars, np.arange(0, N), marker="D", s=75, color="r", zorder=10)
 
     # 4. Handle keyword arguments
     if xlims:
         ax.set_xlim(xlims)
     if filename:
-        basename = filename.replace('.pdf','').replace('.png','')
-        fig.tight_layout()
-        fig.savefig(basename + '.pdf', dpi=300, bbox_inches="tight", pad_inches=0.02)
-        fig.savefig(basename + '.png', dpi=300, bbox_inches="tight", pad_inches=0.02)
+        export_figure(fig, filename, formats=formats, dpi=dpi)
 
 
 
 
-def gen_sampling_dist(rv, statfunc=np.mean, n=30, N=1000):
+def _plot_hist_counts(ax, edges, counts, label=None):
     """
-    Generate `N` samples of size `n` from the random variable `rv`
-    and calculate the statistic `statfunc` from each sample.
+    Draw the density histogram for the precomputed `counts` in the bins `edges`.
     """
-    stats = []
-    for i in range(0, N):
-        sample = rv.rvs(n)
-        stat = statfunc(sample)
-        stats.append(stat)
-    return stats
+    centers = (edges[:-1] + edges[1:]) / 2
+    hist_data = {"stat": centers, "count": counts}
+    with _phase("draw", counts):
+        sns.histplot(hist_data, x="stat", weights="count", binwidth=edges[1]-edges[0],
+                     binrange=(edges[0], edges[-1]), stat="density", color="r", ax=ax, label=label)
+    ax.set_xlabel(None)
+
 
+RUG_BINS = 300    # number of bins used for the binned strip plots
 
-def plot_sampling_dist(stats, label=None, xlims=None, binwidth=None, ax=None, filename=None):
+def _binned_rug(ax, values, ys, lo, hi, nbins=RUG_BINS, color="b", max_alpha=0.8, **kwargs):
+    """
+    Draw a strip plot of the columns of `values` at the heights `ys` using one
+    marker per non-empty bin, shaded according to the number of values in it.
+    The number of markers is at most `nbins` per column.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    n, N = values.shape
+    binwidth = (hi - lo) / nbins
+    bins = np.floor((values - lo) / binwidth).astype(np.int64)
+    inside = (bins >= 0) & (bins < nbins)
+    cols = np.broadcast_to(np.arange(0, N), (n, N))
+    counts = np.bincount((cols * nbins + bins)[inside], minlength=N*nbins).reshape(N, nbins)
+    col_idx, bin_idx = np.nonzero(counts)
+    xs = lo + (bin_idx + 0.5) * binwidth
+    ys = np.broadcast_to(ys, (N,))[col_idx]
+    from matplotlib.colors import to_rgba
+    rgba = np.tile(to_rgba(color), (len(xs), 1))
+    weights = counts[col_idx, bin_idx] / counts.max()
+    rgba[:, 3] = max_alpha * (0.15 + 0.85 * weights)
+    with _phase("draw", xs):
+        ax.scatter(xs, ys, c=rgba, edgecolors="none", **kwargs)
+
+
+@profiled
+def plot_sampling_dist(stats, label=None, xlims=None, binwidth=None, ax=None, filename=None,
+                       formats=None, dpi=None, kind="strip"):
     """
     Plot a combined histogram and strip plot of the values in `stats`.
+    The `stats` can also be a `SamplingDistAccumulator`, in which case the
+    histogram uses its bin counts and the strip plot shows its reservoir sample.
+    Use `kind="density"` for large `stats` to precompute the histogram counts and
+    draw a binned strip plot with a bounded number of markers.
     """
     # 1. Setup figure and axes
     if ax is None:
         fig, ax = plt.subplots()
     else:
         fig = ax.figure
-    if binwidth is None:
+    if isinstance(stats, SamplingDistAccumulator):
+        accumulator = stats
+        if xlims is None:
+            xlims = accumulator.xlims
+        binwidth = accumulator.binwidth
+    elif binwidth is None:
         if xlims is None:
             xlims = min(stats), max(stats)
         binwidth = (xlims[1]-xlims[0]) / 30            
     
     # 2. Plot a histogram of the sampling distribution
-    sns.histplot(stats, binwidth=binwidth, stat="density", color="r", ax=ax, label=label)
+    if isinstance(stats, SamplingDistAccumulator):
+        _plot_hist_counts(ax, accumulator.edges, accumulator.counts, label=label)
+        stats = accumulator.sample()
+    elif kind == "density":
+        stats = np.asarray(stats)
+        lo, hi = np.min(stats), np.max(stats)
+        edges = lo + binwidth * np.arange(0, max(1, np.ceil((hi-lo)/binwidth)) + 1)
+        counts = np.histogram(stats, bins=edges)[0]
+        _plot_hist_counts(ax, edges, counts, label=label)
+    else:
+        with _phase("draw", stats):
+            sns.histplot(stats, binwidth=binwidth, stat="density", color="r", ax=ax, label=label)
 
     # 3. add the scatter plot of `stats` below
     y_offset = 1/(100*binwidth)
-    sns.scatterplot(x=stats, y=-y_offset, ax=ax, color="r", marker="D", s=30, alpha=0.1)
+    if kind == "density":
+        lo, hi = xlims if xlims else (np.min(stats), np.max(stats))
+        _binned_rug(ax, stats, -y_offset, lo, hi, color="r", marker="D", s=30, max_alpha=0.5)
+    else:
+        with _phase("draw", stats):
+            sns.scatterplot(x=stats, y=-y_offset, ax=ax, color="r", marker="D", s=30, alpha=0.1)
 
     # 4. Handle keyword arguments
     if xlims:
         ax.set_xlim(xlims)
     if filename:
-        basename = filename.replace('.pdf','').replace('.png','')
-        fig.tight_layout()
-        fig.savefig(basename + '.pdf', dpi=300, bbox_inches="tight", pad_inches=0.02)
-        fig.savefig(basename + '.png', dpi=300, bbox_inches="tight", pad_inches=0.02)
+        export_figure(fig, filename, formats=formats, dpi=dpi)
 
 
         
 
 
+
+
 # Panels illustrating CLT
 ################################################################################
 
         
-def plot_samples_panel(rv, xlims, N=10, ns=[10,30,100], filename=None):
+@profiled
+@cached_figure("filename", random=True)
+def plot_samples_panel(rv, xlims, N=10, ns=[10,30,100], filename=None, seed=None,
+                       formats=None, dpi=None):
     """
     Draw a panel of strip plots for `N` sample with sizes `ns`.
     Need to pass `xlims` because cannot be determined automatically.
+    Pass a `seed` to generate reproducible samples (and cache the figure).
     """
     fig, axs = plt.subplots(1, len(ns), sharey=True, figsize=(10,2.5))
+    seeds = _spawn_seeds(seed, len(ns))
 
-    for n, ax in zip(ns, axs):
-        samples_df = gen_samples(rv, n=n, N=N)
-        plot_samples(samples_df, xlims=xlims, ax=ax)
+    for n, ax, seed_n in zip(ns, axs, seeds):
+        samples = gen_samples(rv, n=n, N=N, seed=seed_n, as_sampleset=True)
+        plot_samples(samples, xlims=xlims, ax=ax)
         ax.set_title(f"Samples of size $n={n}$")
 
     if filename:
-        basename = filename.replace('.pdf','').replace('.png','')
-        fig.tight_layout()
-        fig.savefig(basename + '.pdf', dpi=300, bbox_inches="tight", pad_inches=0.02)
-        fig.savefig(basename + '.png', dpi=300, bbox_inches="tight", pad_inches=0.02)
+        export_figure(fig, filename, formats=formats, dpi=dpi)
 
 
 
-def plot_sampling_dists_panel(rv, xlims, N=1000, ns=[10,30,100], binwidth=None, filename=None):
+@profiled
+@cached_figure("filename", random=True)
+def plot_sampling_dists_panel(rv, xlims, N=1000, ns=[10,30,100], binwidth=None, filename=None,
+                              seed=None, formats=None, dpi=None):
     """
     Draw a panel of combined histogram and strip plot of the sampling distibutions
     of random variable `rv` for sample sizes `ns`.
     Need to pass appropriate `xlims` and `binwidth` parameters depending on `rv`.
+    Pass a `seed` to generate reproducible samples (and cache the figure).
     """
     fig, axs = plt.subplots(1, len(ns), sharey=True, figsize=(10,2.5))
+    seeds = _spawn_seeds(seed, len(ns))
 
     # plot parameters
     xs = np.linspace(*xlims, 1000)
 
     xbarss = []
-    for n, ax in zip([10,30,100], axs):
+    for n, ax, seed_n in zip([10,30,100], axs, seeds):
         # A. generate and plot sampling distributoin
-        xbars = gen_sampling_dist(rv, statfunc=np.mean, n=n, N=N)
+        xbars = gen_sampling_dist(rv, statfunc=np.mean, n=n, N=N, seed=seed_n)
         plot_sampling_dist(xbars, ax=ax, xlims=xlims, binwidth=binwidth, label=f"$n={n}$")
         # B. plot the distribution predicted by the CLT
         rvXbar = norm(rv.mean(), rv.std()/np.sqrt(n))
-        sns.lineplot(x=xs, y=rvXbar.pdf(xs), ax=ax, color="m")
+        _lineplot(xs, rv_eval(rvXbar, "pdf", xs), ax=ax, color="m")
         xbarss.append(xbars)
 
     if filename:
-        basename = filename.replace('.pdf','').replace('.png','')
-        fig.tight_layout()
-        fig.savefig(basename + '.pdf', dpi=300, bbox_inches="tight", pad_inches=0.02)
-        fig.savefig(basename + '.png', dpi=300, bbox_inches="tight", pad_inches=0.02)
+        export_figure(fig, filename, formats=formats, dpi=dpi)
     
     return xbarss
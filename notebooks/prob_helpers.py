@@ -0,0 +1,560 @@
+"""
+This file contains helper functions for computing with probability
+distributions: probabilities of intervals and tails, tabulated joint
+distributions, and expected values.
+(c) 2022 Minireferece Co. - MIT License
+"""
+import functools
+import hashlib
+import pickle
+from collections import namedtuple
+
+import numpy as np
+from scipy.integrate import quad
+
+import core_helpers
+from core_helpers import profiled, rv_eval
+from core_helpers import _Unhashable, _chunk_bounds, _fingerprint, _phase, _rv_cache_lookup
+
+
+
+
+# Parameter grids
+################################################################################
+
+@profiled
+def eval_params_grid(model, params_matrix, xs, method="pdf"):
+    """
+    Evaluate the function `method` ("pdf", "pmf", "cdf", ...) of the `model`
+    at all `xs` for all parameters in the list-of-lists `params_matrix`.
+    Returns an array of shape (M, N, len(xs)), computed by a single call to the
+    model with parameters stacked into (M, N, 1) arrays. Missing cells of
+    `params_matrix` and, for `method="pmf"`, the points outside of the support
+    of the model are set to np.nan. The results are cached (see `rv_eval`).
+    """
+    try:
+        key = ("params_grid", _fingerprint(model), _fingerprint(params_matrix),
+               method, _fingerprint(np.asarray(xs)))
+    except _Unhashable:
+        key = None
+    if key is None or not core_helpers.RV_CACHE_ENABLED:
+        return _eval_params_grid(model, params_matrix, xs, method)
+    return _rv_cache_lookup(key, lambda: _eval_params_grid(model, params_matrix, xs, method))
+
+def _eval_params_grid(model, params_matrix, xs, method):
+    M = len(params_matrix)
+    N = max( [len(row) for row in params_matrix] )
+    xs = np.asarray(xs)
+    cells = [(i, j) for i in range(0,M) for j in range(0,len(params_matrix[i]))]
+    param_names = list(params_matrix[0][0].keys())
+
+    fXs_matrix = np.full( (M,N,len(xs)), np.nan )
+    if any(params_matrix[i][j].keys() != set(param_names) for i, j in cells):
+        # cells use different parameters so we evaluate them one at a time
+        for i, j in cells:
+            params = {name: np.array([[value]]) for name, value in params_matrix[i][j].items()}
+            fXs_matrix[i,j] = _eval_stacked(model, params, xs, method)[0,0]
+        return fXs_matrix
+
+    params = {}
+    for name in param_names:
+        values = np.full( (M,N), np.nan )
+        for i, j in cells:
+            values[i,j] = params_matrix[i][j][name]
+        params[name] = values
+    fXs_matrix[:] = _eval_stacked(model, params, xs, method)
+    missing = np.ones( (M,N), dtype=bool )
+    for i, j in cells:
+        missing[i,j] = False
+    fXs_matrix[missing] = np.nan
+    return fXs_matrix
+
+def _eval_stacked(model, params, xs, method):
+    """
+    Evaluate `model.method` at the points `xs` for the (M, N) parameter arrays
+    in `params`. For pmfs, set the points outside of the support to np.nan.
+    """
+    params = {name: values[:,:,np.newaxis] for name, values in params.items()}
+    with np.errstate(invalid="ignore"), _phase("eval", xs):
+        fXs = getattr(model, method)(xs[np.newaxis,np.newaxis,:], **params)
+        if method == "pmf":
+            low, high = model.support(**params)
+            fXs = np.where((xs >= low) & (xs <= high), fXs, np.nan)
+    return fXs
+
+
+
+
+# Probabilities
+################################################################################
+
+@profiled
+def calc_probs(rv, a, b):
+    """
+    Calculate the probabilities Pr(a<X<b) that the random variable `rv` falls
+    between `a` and `b` for all the intervals in the array-likes `a` and `b`.
+    Uses the CDF of `rv` when available, otherwise integrates `rv.pdf`, or `rv`
+    itself if it is a density function like `lambda x: 2*x`.
+    """
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+    if hasattr(rv, "cdf"):
+        return rv_eval(rv, "cdf", b) - rv_eval(rv, "cdf", a)
+    pdf = getattr(rv, "pdf", rv)
+    ps = [quad(pdf, a_i, b_i)[0] for a_i, b_i in zip(a.ravel(), b.ravel())]
+    return np.array(ps).reshape(a.shape)
+
+
+@profiled
+def calc_tail_probs(rv, x_l, x_r):
+    """
+    Calculate the combined probability of the tails Pr({X < x_l}) + Pr({X > x_r})
+    of the random variable `rv` for all the cut-offs in the array-likes `x_l`
+    and `x_r`. Uses the CDF and survival function of `rv` when available, and
+    `rv` can also be a density function (see `calc_probs`).
+    """
+    x_l, x_r = np.broadcast_arrays(np.asarray(x_l, dtype=float), np.asarray(x_r, dtype=float))
+    if hasattr(rv, "cdf"):
+        return rv_eval(rv, "cdf", x_l) + rv_eval(rv, "sf", x_r)
+    return calc_probs(rv, -np.inf, x_l) + calc_probs(rv, x_r, np.inf)
+
+
+
+
+# Joint distributions
+################################################################################
+# Helpers for the joint distribution of two random variables X and Y tabulated
+# on a grid. The function `joint_grid` evaluates the joint pmf or pdf `fXY` at
+# all the pairs (x,y) of the grid `xs` by `ys` in a single broadcasted call
+# `fXY(xs[:,np.newaxis], ys[np.newaxis,:])`, so write `fXY` using NumPy
+# operations, e.g. `np.where(x <= y, 2.0, 0.0)` instead of `if x <= y: ...`
+# (functions that don't accept arrays are evaluated one pair at a time).
+# The grids are stored in the evaluation cache, so plotting the same joint
+# distribution again costs nothing. Examples:
+#     fXY = lambda x, y: norm(0,1).pdf(x) * expon(0,2).pdf(y)
+#     joint = joint_grid(fXY, np.linspace(-4,4,1000), np.linspace(0,15,1000))
+#     joint = joint_grid((randint(1,7), randint(1,7)), range(1,7), range(1,7))
+#     joint.marginal_y(), joint.conditional_y(x=0.5), joint.prob(lambda x, y: x+y == 7)
+#     plot_joint(joint, kind="contour", rv_names=("X","Y"))    # in plot_helpers
+
+def _integrate(fs, xs, axis, discrete):
+    """
+    Sum (`discrete=True`) or integrate using the trapezoid rule the values `fs`
+    over the points `xs` along `axis`.
+    """
+    if discrete:
+        return np.sum(fs, axis=axis)
+    fs = np.moveaxis(fs, axis, -1)
+    return np.sum((fs[..., 1:] + fs[..., :-1]) / 2 * np.diff(xs), axis=-1)
+
+
+class TabulatedJoint:
+    """
+    The joint pmf or pdf of the random variables X and Y tabulated on a grid:
+    `values[i,j]` is the value of f_XY at (`xs[i]`, `ys[j]`). The flags in
+    `discrete` tell for each variable if we sum over its values or integrate
+    over them (trapezoid rule). All methods are vectorized over the grid.
+    """
+
+    def __init__(self, xs, ys, values, discrete=False):
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        if self.values.shape != (len(self.xs), len(self.ys)):
+            raise ValueError("values must have shape (len(xs), len(ys))")
+        if isinstance(discrete, (bool, np.bool_)):
+            discrete = (discrete, discrete)
+        self.discrete = tuple(bool(d) for d in discrete)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def mass(self):
+        """
+        Returns the total probability on the grid (close to 1 if the grid covers the support).
+        """
+        fXs = _integrate(self.values, self.ys, axis=1, discrete=self.discrete[1])
+        return _integrate(fXs, self.xs, axis=0, discrete=self.discrete[0])
+
+    def marginal_x(self):
+        """
+        Returns the marginal f_X at the points `xs` (summing or integrating over y).
+        """
+        return _integrate(self.values, self.ys, axis=1, discrete=self.discrete[1])
+
+    def marginal_y(self):
+        """
+        Returns the marginal f_Y at the points `ys` (summing or integrating over x).
+        """
+        return _integrate(self.values, self.xs, axis=0, discrete=self.discrete[0])
+
+    def conditionals_y(self):
+        """
+        Returns the array of the conditionals f_{Y|X}(y|x) with the same shape as
+        `values` (row i is the conditional given x = xs[i], nan where f_X(x)=0).
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.values / self.marginal_x()[:, np.newaxis]
+
+    def conditionals_x(self):
+        """
+        Returns the array of the conditionals f_{X|Y}(x|y) with the same shape as
+        `values` (column j is the conditional given y = ys[j], nan where f_Y(y)=0).
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.values / self.marginal_y()[np.newaxis, :]
+
+    def _slice(self, axis, value):
+        """
+        Returns the values of f_XY along the other axis at x = `value` (axis=0)
+        or y = `value` (axis=1), interpolated between grid lines if continuous.
+        """
+        points, values = (self.xs, self.values) if axis == 0 else (self.ys, self.values.T)
+        matches = np.flatnonzero(np.isclose(points, value, rtol=0, atol=1e-12))
+        if len(matches) > 0:
+            return values[matches[0]]
+        if self.discrete[axis] or len(points) < 2 or not points[0] < value < points[-1]:
+            return np.zeros(values.shape[1])
+        i = np.searchsorted(points, value) - 1
+        w = (value - points[i]) / (points[i+1] - points[i])
+        return (1-w) * values[i] + w * values[i+1]
+
+    def conditional_y(self, x):
+        """
+        Returns the conditional f_{Y|X}(y|x) at the points `ys` for the value `x`.
+        """
+        fXYs = self._slice(0, x)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return fXYs / _integrate(fXYs, self.ys, axis=0, discrete=self.discrete[1])
+
+    def conditional_x(self, y):
+        """
+        Returns the conditional f_{X|Y}(x|y) at the points `xs` for the value `y`.
+        """
+        fXYs = self._slice(1, y)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return fXYs / _integrate(fXYs, self.xs, axis=0, discrete=self.discrete[0])
+
+    def expect(self, g):
+        """
+        Returns the expected value of `g(x,y)` (a vectorized function), normalized
+        by the probability mass on the grid.
+        """
+        gs = np.broadcast_to(g(self.xs[:, np.newaxis], self.ys[np.newaxis, :]), self.shape)
+        inner = _integrate(gs * self.values, self.ys, axis=1, discrete=self.discrete[1])
+        return _integrate(inner, self.xs, axis=0, discrete=self.discrete[0]) / self.mass()
+
+    def prob(self, event):
+        """
+        Returns the probability of the `event`, a vectorized function of (x,y)
+        that returns True for the pairs in the event, e.g. `lambda x, y: x < y`.
+        """
+        return self.expect(lambda x, y: np.asarray(event(x, y), dtype=float))
+
+    def mean(self):
+        """
+        Returns the means (E[X], E[Y]).
+        """
+        return self.expect(lambda x, y: x), self.expect(lambda x, y: y)
+
+    def cov(self):
+        """
+        Returns the 2x2 covariance matrix of X and Y.
+        """
+        meanX, meanY = self.mean()
+        varX = self.expect(lambda x, y: (x - meanX)**2)
+        varY = self.expect(lambda x, y: (y - meanY)**2)
+        covXY = self.expect(lambda x, y: (x - meanX) * (y - meanY))
+        return np.array([[varX, covXY], [covXY, varY]])
+
+
+def _joint_key(fXY):
+    """
+    Returns a string that identifies the joint distribution `fXY`, or None.
+    """
+    try:
+        if isinstance(fXY, (tuple, list)):
+            return "independent(" + ",".join(_fingerprint(rv) for rv in fXY) + ")"
+        if callable(fXY):
+            return _fingerprint(fXY)
+        # frozen multivariate distribution, e.g. multivariate_normal(mean, cov)
+        return "multivariate(" + hashlib.sha256(pickle.dumps(fXY)).hexdigest() + ")"
+    except (_Unhashable, pickle.PicklingError, TypeError, AttributeError):
+        return None
+
+def _eval_joint(fXY, xs, ys):
+    """
+    Evaluate the joint pmf or pdf `fXY` at all the points of the grid `xs` by `ys`.
+    """
+    if isinstance(fXY, (tuple, list)):
+        rvX, rvY = fXY
+        fXs = rv_eval(rvX, "pmf" if hasattr(rvX.dist, "pmf") else "pdf", xs)
+        fYs = rv_eval(rvY, "pmf" if hasattr(rvY.dist, "pmf") else "pdf", ys)
+        return np.outer(fXs, fYs)
+    with _phase("eval", (len(xs), len(ys))):
+        if not callable(fXY):
+            method = fXY.pdf if hasattr(fXY, "pdf") else fXY.pmf
+            points = np.stack(np.meshgrid(xs, ys, indexing="ij"), axis=-1)
+            return np.asarray(method(points), dtype=float).reshape(len(xs), len(ys))
+        X, Y = xs[:, np.newaxis], ys[np.newaxis, :]
+        try:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                fXYs = np.asarray(fXY(X, Y), dtype=float)
+        except (ValueError, TypeError):
+            fXYs = None     # `fXY` only accepts numbers
+        if fXYs is None or fXYs.size not in (1, X.size * Y.size):
+            fXYs = np.vectorize(fXY, otypes=[float])(X, Y)
+        return np.array(np.broadcast_to(fXYs, (len(xs), len(ys))))
+
+
+@profiled
+def joint_grid(fXY, xs, ys, discrete=None):
+    """
+    Tabulate the joint distribution `fXY` on the grid `xs` by `ys` and return a
+    `TabulatedJoint`. The `fXY` can be a function f(x,y), a pair of frozen random
+    variables (X,Y) that are independent, or a frozen multivariate distribution
+    with two components. Pass `discrete=True` (or a pair of flags, one per
+    variable) for joint pmfs. For pairs of random variables, the default is
+    to use `discrete=True` for the discrete ones.
+    The evaluated grids are cached (see `rv_eval`).
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    if discrete is None:
+        if isinstance(fXY, (tuple, list)):
+            discrete = tuple(hasattr(rv.dist, "pmf") for rv in fXY)
+        else:
+            discrete = not hasattr(fXY, "pdf") and hasattr(fXY, "pmf")
+    key = _joint_key(fXY) if core_helpers.RV_CACHE_ENABLED else None
+    if key is None:
+        values = _eval_joint(fXY, xs, ys)
+    else:
+        key = ("joint", key, _fingerprint(xs), _fingerprint(ys))
+        values = _rv_cache_lookup(key, lambda: _eval_joint(fXY, xs, ys))
+    return TabulatedJoint(xs, ys, values, discrete=discrete)
+
+
+
+
+# Expectations
+################################################################################
+# The function `expect` computes the expected values E[g(X)] of a list of
+# vectorized functions `gs` for a random variable X, or for all the parameters
+# of a family of distributions at once, e.g.
+#     expect(norm(0,1), [np.abs, lambda x: x**2])         # --> shape (2,)
+#     expect(gamma, [lambda x: x, np.log], params={"a": np.linspace(1,10,100)})
+# returns the values in an array of shape params_shape + (len(gs),). It uses
+# fixed-order quadrature rules: Gauss-Legendre on finite supports, Gauss-Legendre
+# for the body and Gauss-Laguerre for the tail on half-lines, and Gauss-Hermite
+# on the real line (centered at the median and scaled to the interquartile
+# range of X). The values use the rules with `2n` nodes, and the error estimate
+# is their difference from the rules with `n` nodes, plus, on infinite
+# intervals, the absolute contribution of the nodes beyond the last node of the
+# `n`-node rule. The first part flags integrands that aren't smooth, and the
+# second part flags heavy tails, which put a large part of the integral (or an
+# integral that doesn't converge, like the mean of a Cauchy distribution) far
+# from the nodes.
+# For discrete random variables the sums over the support are exact (infinite
+# supports are truncated at the quantile 1-DISCRETE_TAIL).
+
+ExpectationResult = namedtuple("ExpectationResult", ["value", "error"])
+
+DISCRETE_TAIL = 1e-15
+
+@functools.lru_cache(maxsize=None)
+def _gauss_rule(rule, n):
+    """
+    Returns the nodes and the log of the weights (times the inverse of the
+    weight function) of the Gauss quadrature `rule` with `n` nodes.
+    """
+    from numpy.polynomial import hermite, laguerre, legendre
+    if rule == "legendre":
+        ts, ws = legendre.leggauss(n)
+        return ts, np.log(ws)
+    if rule == "laguerre":
+        ts, ws = laguerre.laggauss(n)
+        with np.errstate(divide="ignore"):
+            return ts, np.log(ws) + ts
+    ts, ws = hermite.hermgauss(n)
+    with np.errstate(divide="ignore"):
+        return ts, np.log(ws) + ts**2
+
+def _broadcast_params(params):
+    """
+    Returns the dict of parameter arrays `params` (or a list of dicts, one per
+    distribution) broadcast to a common shape, and that shape.
+    """
+    if isinstance(params, (list, tuple)):
+        params = {name: np.array([p[name] for p in params]) for name in params[0]}
+    arrays = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in params.values()])
+    shape = arrays[0].shape if arrays else ()
+    return dict(zip(params.keys(), arrays)), shape
+
+def _gauss_sums(model, params, gs, rule, n, loc, scale, center, edge=np.inf):
+    """
+    Returns the (P, len(gs)) arrays of the Gauss `rule` approximations of the
+    integrals of g(x-center)*pdf(x) with the nodes x = loc + scale*t, and of
+    the sums of the absolute values of the terms for the nodes with |t| > `edge`.
+    """
+    scale = np.where(np.isfinite(scale) & (scale != 0), scale, 1.0)
+    ts, logws = _gauss_rule(rule, n)
+    xs = loc[:, np.newaxis] + scale[:, np.newaxis] * ts
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        fxs = model.pdf(xs, **params)
+        weights = np.where(fxs > 0, np.exp(logws + np.log(np.where(fxs > 0, fxs, 1.0))), 0.0)
+        weights *= np.abs(scale)[:, np.newaxis]
+        shifted = xs - center[:, np.newaxis]
+        terms = [weights * np.broadcast_to(g(shifted), xs.shape) for g in gs]
+        outer = np.abs(ts) > edge
+        return (np.stack([np.sum(term, axis=1) for term in terms], axis=-1),
+                np.stack([np.sum(np.abs(term[:, outer]), axis=1) for term in terms], axis=-1))
+
+def _quadrature(model, kwds, gs, rule, n, center):
+    """
+    Returns the (P, len(gs)) arrays of the integrals of g(x-center)*pdf(x) for
+    the P distributions `model(**kwds)` (1D parameter arrays), computed with
+    `2n` nodes, and of their error estimates. Half-lines are split into the
+    body, up to the quantile 0.99 (or from 0.01), integrated using
+    Gauss-Legendre, and the tail, using Gauss-Laguerre scaled to the decay
+    between the quantiles 0.99 and 0.999.
+    """
+    params = {name: values[:, np.newaxis] for name, values in kwds.items()}
+
+    def rule_sums(rule, loc, scale):
+        edge = np.inf if rule == "legendre" else np.max(np.abs(_gauss_rule(rule, n)[0]))
+        coarse, _ = _gauss_sums(model, params, gs, rule, n, loc, scale, center)
+        fine, outer = _gauss_sums(model, params, gs, rule, 2*n, loc, scale, center, edge)
+        return fine, np.abs(fine - coarse) + outer
+
+    low, high = model.support(**kwds)
+    low, high = np.broadcast_to(low, center.shape), np.broadcast_to(high, center.shape)
+    if rule == "legendre":
+        return rule_sums("legendre", (low+high)/2, (high-low)/2)
+    if rule == "hermite":
+        median = np.broadcast_to(model.ppf(0.5, **kwds), center.shape)
+        iqr = np.broadcast_to(model.ppf(0.75, **kwds) - model.ppf(0.25, **kwds), center.shape)
+        scale = iqr / (2 * 0.6745) * np.sqrt(2)      # sqrt(2)*sigma, exact for normal distributions
+        return rule_sums("hermite", median, scale)
+    right = np.isfinite(low)     # support [low, inf) or (-inf, high]
+    start = np.where(right, low, high)
+    q1 = np.where(right, model.ppf(0.99, **kwds), model.ppf(0.01, **kwds))
+    q2 = np.where(right, model.ppf(0.999, **kwds), model.ppf(0.001, **kwds))
+    body, body_error = rule_sums("legendre", (start+q1)/2, (q1-start)/2)
+    tail, tail_error = rule_sums("laguerre", q1, (q2-q1)/np.log(10))
+    return body + tail, body_error + tail_error
+
+def _support_sums(model, kwds, gs, center, tail=DISCRETE_TAIL):
+    """
+    Returns the (P, len(gs)) arrays of the sums of g(k)*pmf(k) over the support
+    of the P discrete distributions `model(**kwds)`, and of the error estimates
+    (the change in the sums when truncating the infinite supports at the
+    quantile 1-sqrt(tail) instead of 1-tail).
+    """
+    low, high = model.support(**kwds)
+    lo = np.where(np.isfinite(low), low, model.ppf(tail, **kwds) - 1)
+    hi = np.where(np.isfinite(high), high, model.ppf(1-tail, **kwds))
+    hi_coarse = np.where(np.isfinite(high), high, model.ppf(1-np.sqrt(tail), **kwds))
+    ks = np.arange(np.min(lo), np.max(hi) + 1)
+    values = np.zeros((len(lo), len(gs)))
+    errors = np.zeros((len(lo), len(gs)))
+    for start, stop in _chunk_bounds(len(lo), len(ks)):
+        params = {name: v[start:stop, np.newaxis] for name, v in kwds.items()}
+        with np.errstate(invalid="ignore"):
+            pks = model.pmf(ks, **params)
+        pks = np.where((ks >= lo[start:stop, np.newaxis]) & (ks <= hi[start:stop, np.newaxis]), pks, 0.0)
+        coarse = pks * (ks <= hi_coarse[start:stop, np.newaxis])
+        shifted = ks - center[start:stop, np.newaxis]
+        for j, g in enumerate(gs):
+            gks = np.broadcast_to(g(shifted), shifted.shape)
+            values[start:stop, j] = np.sum(gks * pks, axis=1)
+            errors[start:stop, j] = np.abs(values[start:stop, j] - np.sum(gks * coarse, axis=1))
+    return values, errors
+
+
+@profiled
+def expect(rv, gs, params=None, n=64, center=None):
+    """
+    Compute the expected values E[g(X)] for the functions in `gs` (a vectorized
+    function, or a list of them) where X is the frozen random variable `rv`,
+    or the distributions of the family `rv` with the `params` (a dict of
+    arrays that are broadcast together, or a list of dicts).
+    Returns an `ExpectationResult` with the `value` and `error` arrays of shape
+    params_shape + (len(gs),), without the last axis if `gs` is a function.
+    Continuous distributions use Gauss quadrature with `n` and `2n` nodes.
+    Pass `center` (broadcastable to params_shape) to compute E[g(X-center)].
+    """
+    single = callable(gs)
+    gs = [gs] if single else list(gs)
+    if params is None:
+        model, kwds = rv.dist, dict(rv.kwds)
+        names = model.shapes.replace(" ", "").split(",") if model.shapes else []
+        names += ["loc"] if hasattr(model, "pmf") else ["loc", "scale"]
+        kwds.update(zip(names, rv.args))
+        kwds, shape = _broadcast_params(kwds)
+    else:
+        model = rv
+        kwds, shape = _broadcast_params(params)
+    kwds = {name: values.ravel() for name, values in kwds.items()}
+    P = int(np.prod(shape))
+    center = np.broadcast_to(np.asarray(0.0 if center is None else center, dtype=float), shape).ravel()
+    values = np.full((P, len(gs)), np.nan)
+    errors = np.full((P, len(gs)), np.nan)
+
+    with _phase("eval", (P, 3*n)):
+        if hasattr(model, "pmf"):
+            values, errors = _support_sums(model, kwds, gs, center)
+        else:
+            # choose the quadrature rule for each distribution from its support
+            low, high = model.support(**kwds)
+            low, high = np.broadcast_to(low, (P,)), np.broadcast_to(high, (P,))
+            rules = np.where(np.isfinite(low) & np.isfinite(high), "legendre",
+                             np.where(np.isfinite(low) | np.isfinite(high), "laguerre", "hermite"))
+            for rule in np.unique(rules):
+                idx = np.flatnonzero(rules == rule)
+                sub = {name: v[idx] for name, v in kwds.items()}
+                values[idx], errors[idx] = _quadrature(model, sub, gs, rule, n, center[idx])
+
+    values, errors = values.reshape(shape + (len(gs),)), errors.reshape(shape + (len(gs),))
+    if single:
+        values, errors = values[..., 0], errors[..., 0]
+    return ExpectationResult(values, errors)
+
+
+@profiled
+def moments_table(model, params, n=64):
+    """
+    Returns a pd.DataFrame with one row per distribution of the family `model`
+    with the `params` (dict of arrays) and columns for the parameters, the
+    mean, variance, skewness, and excess kurtosis, and the largest error estimate.
+    """
+    kwds, shape = _broadcast_params(params)
+    means = expect(model, lambda x: x, params=kwds, n=n)
+    central = expect(model, [lambda x: x**2, lambda x: x**3, lambda x: x**4],
+                     params=kwds, n=n, center=means.value)
+    m2, m3, m4 = np.moveaxis(central.value, -1, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table = {name: values.ravel() for name, values in kwds.items()}
+        table.update(mean=means.value.ravel(), var=m2.ravel(), skew=(m3 / m2**1.5).ravel(),
+                     kurtosis=(m4 / m2**2 - 3).ravel(),
+                     error=np.maximum(means.error, central.error.max(axis=-1)).ravel())
+    import pandas as pd
+    return pd.DataFrame(table)
+
+
+
+
+# Q-Q plots
+################################################################################
+# The points of the Q-Q plots drawn by `qq_plot` in plot_helpers.
+
+@profiled
+def calc_qq_points(data, dist, a=0):
+    """
+    Returns the theoretical quantiles `xs` of the distribution `dist` and the
+    sorted `data` values `ys` that make up the points of the Q-Q plot.
+    """
+    ys = np.sort(np.asarray(data, dtype=float).ravel())
+    n = len(ys)
+    positions = (np.arange(1, n+1) - a) / (n + 1 - 2*a)
+    xs = rv_eval(dist, "ppf", positions)
+    return xs, ys
@@ -0,0 +1,461 @@
+"""
+This file contains helper functions for generating random samples and
+sampling distributions.
+(c) 2022 Minireferece Co. - MIT License
+"""
+import numpy as np
+
+from core_helpers import ensure_containing_dir_exists, profiled
+from core_helpers import _apply_statfunc, _chunk_bounds, _default_xlims, _gen_chunks, _phase
+
+
+
+
+# Random variable generation
+################################################################################
+# Sampling from a custom `rv_continuous` subclass defined by its pdf is slow,
+# because scipy inverts the CDF numerically (root-finding over integrals) for
+# every random value. A `TabulatedSampler` computes the CDF on a dense grid once
+# and then generates values by inverse transform sampling, interpolating the
+# table, so it can be used in place of `rv` in `gen_samples` and `gen_sampling_dist`.
+
+class TabulatedSampler:
+    """
+    Fast sampler for the continuous distribution with density `pdf` on the
+    interval `xlims`. The CDF is tabulated on `num` equally spaced points using
+    the trapezoid rule (the table is normalized to total probability one) and
+    `rvs` and `ppf` interpolate its inverse linearly.
+    Use `TabulatedSampler.from_rv(rv)` to tabulate a frozen scipy.stats rv.
+
+    The attribute `error_bound` is an estimate of the maximum error of the
+    tabulated CDF (the Kolmogorov-Smirnov distance between the distribution of
+    the generated values and the exact distribution), obtained by comparing the
+    table with a table of half the resolution. The error decreases like 1/num**2
+    for smooth densities. Call `validate` to check the sampler using a Q-Q plot.
+    """
+
+    def __init__(self, pdf, xlims, num=2**16+1):
+        self.xs = np.linspace(xlims[0], xlims[1], num)
+        fxs = self._eval_pdf(pdf, self.xs)
+        self.mass = self._trapz(fxs, self.xs)
+        if not self.mass > 0:
+            raise ValueError("The pdf has no probability mass in the interval " + str(xlims))
+        self.fxs = fxs / self.mass
+        self.cdfs = self._cumtrapz(self.fxs, self.xs)
+        coarse_cdfs = self._cumtrapz(self.fxs[::2], self.xs[::2])
+        self.error_bound = np.max(np.abs(np.interp(self.xs, self.xs[::2], coarse_cdfs) - self.cdfs))
+        self.rv = None         # reference distribution used by `validate`
+        self._pdf = pdf
+
+    @classmethod
+    def from_rv(cls, rv, num=2**16+1, tail=1e-9):
+        """
+        Tabulate the frozen random variable `rv` between its quantiles `tail`
+        and `1-tail`. The probability `2*tail` outside of the table is added to
+        the `error_bound`.
+        """
+        sampler = cls(rv.pdf, _default_xlims(rv, tail, 1-tail), num=num)
+        sampler.error_bound += 2*tail
+        sampler.rv = rv
+        return sampler
+
+    @staticmethod
+    def _eval_pdf(pdf, xs):
+        try:
+            fxs = np.asarray(pdf(xs), dtype=float)
+        except (TypeError, ValueError):
+            fxs = None    # `pdf` is not vectorized
+        if fxs is None or fxs.shape != xs.shape:
+            fxs = np.array([pdf(x) for x in xs], dtype=float)
+        return np.clip(np.nan_to_num(fxs), 0, None)
+
+    @staticmethod
+    def _trapz(fxs, xs):
+        return np.sum((fxs[1:] + fxs[:-1]) / 2 * np.diff(xs))
+
+    @staticmethod
+    def _cumtrapz(fxs, xs):
+        cdfs = np.concatenate([[0.0], np.cumsum((fxs[1:] + fxs[:-1]) / 2 * np.diff(xs))])
+        return cdfs / cdfs[-1]
+
+    def __getstate__(self):
+        # don't pickle the pdf function (e.g. a lambda) when sending to workers
+        state = self.__dict__.copy()
+        state["_pdf"] = None
+        return state
+
+    def rvs(self, size=None, random_state=None):
+        """
+        Generate random values with the shape `size` (a single value if `None`).
+        """
+        if isinstance(random_state, np.random.RandomState):
+            us = random_state.random_sample(size)
+        elif random_state is None:
+            us = np.random.random_sample(size)
+        else:
+            us = np.random.default_rng(random_state).random(size)
+        return self.ppf(us)
+
+    def ppf(self, q):
+        return np.interp(q, self.cdfs, self.xs)
+
+    def cdf(self, x):
+        return np.interp(x, self.xs, self.cdfs, left=0.0, right=1.0)
+
+    def sf(self, x):
+        return 1 - self.cdf(x)
+
+    def pdf(self, x):
+        return np.interp(x, self.xs, self.fxs, left=0.0, right=0.0)
+
+    def mean(self):
+        return self._trapz(self.xs * self.fxs, self.xs)
+
+    def var(self):
+        return self._trapz((self.xs - self.mean())**2 * self.fxs, self.xs)
+
+    def std(self):
+        return np.sqrt(self.var())
+
+    def validate(self, dist=None, n=1000, seed=None, ax=None, filename=None):
+        """
+        Draw `n` values from the sampler and compare them to the distribution
+        `dist` using a Q-Q plot. By default `dist` is the rv passed to `from_rv`,
+        or a generic scipy.stats distribution with the pdf (slow but exact).
+        Returns the Kolmogorov-Smirnov test result and the axes of the Q-Q plot.
+        """
+        from scipy.stats import kstest, rv_continuous
+        from plot_helpers import qq_plot    # imports the plotting libraries
+        if dist is None and self.rv is not None:
+            dist = self.rv
+        elif dist is None:
+            if self._pdf is None:
+                raise ValueError("Pass the reference distribution `dist` to validate the sampler.")
+            pdf, mass = self._pdf, self.mass
+            class _PdfDist(rv_continuous):
+                def _pdf(self, x):
+                    return pdf(x) / mass    # normalized like the table
+            xmin, xmax = self.xs[0], self.xs[-1]
+            dist = _PdfDist(a=xmin, b=xmax, name="tabulated")()
+        with _phase("rvs", (n,)):
+            values = self.rvs(n, random_state=seed)
+        ax = qq_plot(values, dist, ax=ax, filename=filename)
+        return kstest(values, dist.cdf), ax
+
+
+
+
+# Random samples
+################################################################################
+
+class SampleSet:
+    """
+    `N` samples of size `n` stored as the columns of one contiguous (n, N) array
+    `values`, which can be float32 to halve the memory, or a memory-mapped `.npy`
+    file (see `spill` and `load`) for sample grids larger than the RAM.
+    The per-sample statistics are computed in blocks of about one million values,
+    and `to_dataframe()` returns a pd.DataFrame view that doesn't copy the values.
+    """
+
+    def __init__(self, values, names=None):
+        if not isinstance(values, np.ndarray):
+            values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            values = values[:, np.newaxis]
+        if values.ndim != 2:
+            raise ValueError("values must be a 2D array of shape (n, N)")
+        self.values = values
+        if names is None:
+            names = ["sample" + str(i) for i in range(0, values.shape[1])]
+        if len(names) != values.shape[1]:
+            raise ValueError("need one name for each of the " + str(values.shape[1]) + " samples")
+        self.names = list(names)
+
+    @classmethod
+    def empty(cls, n, N, dtype=np.float64, path=None, names=None):
+        """
+        Allocate an uninitialized sample set, in memory or in the `.npy` file `path`.
+        """
+        if path is None:
+            values = np.empty((n, N), dtype=dtype)
+        else:
+            ensure_containing_dir_exists(path)
+            values = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(n, N))
+        return cls(values, names=names)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r", names=None):
+        """
+        Open the `.npy` file `path` written by `spill` or `save` (memory-mapped by default).
+        """
+        return cls(np.load(path, mmap_mode=mmap_mode), names=names)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def n(self):
+        return self.values.shape[0]
+
+    @property
+    def N(self):
+        return self.values.shape[1]
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def __len__(self):
+        return self.N
+
+    def __getitem__(self, key):
+        """
+        Returns the sample `key` (an index or a name like "sample3") as a view.
+        """
+        if isinstance(key, str):
+            key = self.names.index(key)
+        return self.values[:, key]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.values, dtype=dtype)
+
+    def __repr__(self):
+        storage = "memmap " + self.values.filename if isinstance(self.values, np.memmap) else "memory"
+        return f"SampleSet(n={self.n}, N={self.N}, dtype={self.dtype}, {storage})"
+
+    def _row_blocks(self):
+        return [slice(start, stop) for start, stop in _chunk_bounds(self.n, self.N)]
+
+    def _column_blocks(self):
+        return [slice(start, stop) for start, stop in _chunk_bounds(self.N, self.n)]
+
+    def mean(self):
+        """
+        Returns the array of the `N` sample means (accumulated in float64).
+        """
+        total = np.zeros(self.N)
+        for rows in self._row_blocks():
+            total += self.values[rows].sum(axis=0, dtype=np.float64)
+        return total / self.n
+
+    def var(self, ddof=0):
+        """
+        Returns the array of the `N` sample variances, computed in two passes.
+        """
+        means = self.mean()
+        ss = np.zeros(self.N)
+        for rows in self._row_blocks():
+            ss += np.sum((self.values[rows] - means)**2, axis=0)
+        return ss / (self.n - ddof) if self.n > ddof else np.full(self.N, np.nan)
+
+    def std(self, ddof=0):
+        return np.sqrt(self.var(ddof=ddof))
+
+    def min(self):
+        return np.min(self.values, axis=0)
+
+    def max(self):
+        return np.max(self.values, axis=0)
+
+    def quantile(self, q):
+        """
+        Returns the quantile(s) `q` of each sample, with shape (N,) or (len(q), N).
+        """
+        return np.concatenate([np.quantile(self.values[:, cols], q, axis=0)
+                               for cols in self._column_blocks()], axis=-1)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def apply(self, statfunc):
+        """
+        Returns the array of `statfunc(sample)` for each of the `N` samples.
+        Uses `statfunc(block, axis=1)` on blocks of samples if supported.
+        """
+        if self.N == 0:
+            return np.array([])
+        return np.concatenate([_apply_statfunc(statfunc, self.values[:, cols].T)
+                               for cols in self._column_blocks()])
+
+    def to_dataframe(self):
+        """
+        Returns a pd.DataFrame with one column per sample that shares memory with `values`.
+        """
+        import pandas as pd
+        return pd.DataFrame(self.values, columns=self.names, copy=False)
+
+    def spill(self, path):
+        """
+        Move the values to the memory-mapped `.npy` file `path` and return `self`.
+        """
+        spilled = SampleSet.empty(self.n, self.N, dtype=self.dtype, path=path, names=self.names)
+        for rows in self._row_blocks():
+            spilled.values[rows] = self.values[rows]
+        spilled.values.flush()
+        self.values = spilled.values
+        return self
+
+    def save(self, path):
+        """
+        Save the values to the `.npy` file `path` (open it using `SampleSet.load`).
+        """
+        ensure_containing_dir_exists(path)
+        np.save(path, self.values)
+
+
+@profiled
+def gen_samples(rv, n=30, N=10, seed=None, workers=None, chunksize=None,
+                as_sampleset=False, dtype=None, path=None):
+    """
+    Generate `N` samples of size `n` from the random variable `rv`.
+    Returns a pd.DataFrame with `N` columns containing the samples.
+    Pass a `seed` to get reproducible samples, and the number of `workers`
+    processes to use for the generation (`workers=-1` to use all CPU cores).
+    Use `as_sampleset=True` to get a `SampleSet` instead, stored as `dtype`
+    (default: the dtype of the values returned by `rv.rvs`, e.g. int64 for
+    discrete random variables), and written directly to the memory-mapped
+    `.npy` file `path` if given.
+    """
+    if as_sampleset or path is not None or seed is not None or workers is not None:
+        samples = None
+        bounds = _chunk_bounds(N, n, chunksize)
+        chunks = _gen_chunks(rv, n, N, chunksize=chunksize, seed=seed, workers=workers)
+        for (start, stop), chunk in zip(bounds, chunks):
+            if samples is None:
+                chunk_dtype = dtype or np.asarray(chunk).dtype
+                samples = SampleSet.empty(n, N, dtype=chunk_dtype, path=path)
+            samples.values[:, start:stop] = chunk.T
+        if samples is None:
+            samples = SampleSet.empty(n, N, dtype=dtype or np.float64, path=path)
+        if path is not None:
+            samples.values.flush()
+        return samples if as_sampleset else samples.to_dataframe()
+
+    samples = {}
+    for i in range(0, N):
+        column_name = "sample" + str(i)
+        with _phase("rvs", (n,)):
+            samples[column_name] = rv.rvs(n)
+    import pandas as pd
+    samples_df = pd.DataFrame(samples)
+    return samples_df
+
+
+class SamplingDistAccumulator:
+    """
+    Streaming summary of a sampling distribution that uses constant memory.
+    Call `update(stats)` with batches of statistics to keep track of their
+    running mean and variance (Welford's algorithm), the counts in `bins`
+    fixed-width bins over the interval `xlims`, and a uniform random sample
+    of `reservoir_size` of the statistics (reservoir sampling).
+    """
+
+    def __init__(self, xlims, bins=30, reservoir_size=1000, seed=None):
+        self.edges = np.linspace(xlims[0], xlims[1], bins+1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.underflow = 0    # number of statistics below xlims[0]
+        self.overflow = 0     # number of statistics above xlims[1]
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0        # sum of squared deviations from the mean
+        self.reservoir = np.zeros(reservoir_size)
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def xlims(self):
+        return self.edges[0], self.edges[-1]
+
+    @property
+    def binwidth(self):
+        return self.edges[1] - self.edges[0]
+
+    def update(self, stats):
+        """
+        Add the values in the array-like `stats` to the summary.
+        """
+        stats = np.asarray(stats, dtype=float).ravel()
+        m = len(stats)
+        if m == 0:
+            return self
+
+        # 1. combine the running mean and variance with those of the batch
+        batch_mean = stats.mean()
+        batch_m2 = np.sum((stats - batch_mean)**2)
+        total = self.count + m
+        delta = batch_mean - self._mean
+        self._mean += delta * m / total
+        self._m2 += batch_m2 + delta**2 * self.count * m / total
+
+        # 2. histogram counts
+        self.counts += np.histogram(stats, bins=self.edges)[0]
+        self.underflow += np.count_nonzero(stats < self.edges[0])
+        self.overflow += np.count_nonzero(stats > self.edges[-1])
+
+        # 3. reservoir sample: the i-th value replaces a random slot with prob. k/i
+        k = len(self.reservoir)
+        nfill = max(0, min(k - self.count, m))
+        self.reservoir[self.count:self.count+nfill] = stats[:nfill]
+        if nfill < m:
+            positions = np.arange(self.count+nfill, total)    # 0-based index of each value
+            slots = (self._rng.random(m-nfill) * (positions+1)).astype(np.int64)
+            keep = slots < k
+            # when a slot is chosen several times in the batch, the last value wins
+            rslots, rvalues = slots[keep][::-1], stats[nfill:][keep][::-1]
+            uslots, first = np.unique(rslots, return_index=True)
+            self.reservoir[uslots] = rvalues[first]
+        self.count = total
+        return self
+
+    def sample(self):
+        """
+        Returns the reservoir sample of the statistics seen so far.
+        """
+        return self.reservoir[:min(self.count, len(self.reservoir))]
+
+    def mean(self):
+        return self._mean if self.count > 0 else np.nan
+
+    def var(self, ddof=0):
+        return self._m2 / (self.count - ddof) if self.count > ddof else np.nan
+
+    def std(self, ddof=0):
+        return np.sqrt(self.var(ddof=ddof))
+
+
+@profiled
+def gen_sampling_dist(rv, statfunc=np.mean, n=30, N=1000,
+                      vectorized=False, chunksize=None, seed=None, workers=None,
+                      accumulator=None):
+    """
+    Generate `N` samples of size `n` from the random variable `rv`
+    and calculate the statistic `statfunc` from each sample.
+    Use `vectorized=True` to draw the samples in batches of `chunksize` samples
+    (a `chunksize`-by-`n` array per `rv.rvs` call) and compute the statistics
+    along `axis=1`. The vectorized mode returns a NumPy array.
+    Passing a `seed` or the number of `workers` processes also selects the
+    vectorized mode. The same `seed` gives identical results for any `workers`.
+    Pass a `SamplingDistAccumulator` as `accumulator` to stream the statistics
+    into it in constant memory instead of returning them (returns `accumulator`).
+    """
+    if accumulator is not None:
+        for chunk in _gen_chunks(rv, n, N, chunksize=chunksize, seed=seed,
+                                 workers=workers, statfunc=statfunc):
+            accumulator.update(chunk)
+        return accumulator
+    if vectorized or seed is not None or workers is not None:
+        chunks = list(_gen_chunks(rv, n, N, chunksize=chunksize, seed=seed,
+                                  workers=workers, statfunc=statfunc))
+        return np.concatenate(chunks) if chunks else np.array([])
+
+    stats = []
+    for i in range(0, N):
+        with _phase("rvs", (n,)):
+            sample = rv.rvs(n)
+        stat = statfunc(sample)
+        stats.append(stat)
+    return stats
@@ -1,9 +1,27 @@
 """
 Tests for the function exercises in `python_tutorial.ipynb`.
+
+The functions `test_mean` and `test_std` are quick checks for the students:
+they run a few small lists in the current process.
+The scaling checks are opt-in, e.g. `check_scaling(mean, "mean")` checks that
+`mean` gives the right results on lists of up to 10**5 values and runs in
+(close to) linear time. The function `stress_test` is a grading harness that
+runs a function on random lists of increasing sizes (up to 10**7 values) in a
+forked subprocess with a timeout, measures the running time at each size, fits
+the empirical scaling exponent (1 for a linear-time solution, 2 for quadratic),
+and reports the accuracy relative to a reference implementation. Use `grade`
+to check many submissions. The subprocesses are only used on Linux (forking a
+Jupyter kernel isn't safe on macOS, and Windows can't fork), elsewhere the
+function runs in the current process without a timeout.
 """
 import math
+import multiprocessing
 import random
 import statistics
+import sys
+import time
+
+import numpy as np
 
 
 def random_list(n=10, min=0.0, max=100.0):
@@ -44,3 +62,166 @@ def test_std(function):
     list100 = random_list(n=100)
     assert math.isclose(function(list100), statistics.stdev(list100))
     print("All tests passed. Good job!")
+
+
+
+# Stress tests
+################################################################################
+
+DEFAULT_SIZES = [10**k for k in range(1, 8)]   # 10, 100, ..., 10**7
+MIN_TIME = 0.001          # shorter calls are repeated to measure their time
+MAX_EXPONENT = 1.5        # scaling exponents above this are flagged as slow
+
+REFERENCES = {
+    "mean": lambda values: math.fsum(values) / len(values),
+    "std": lambda values: float(np.std(values, ddof=1)),
+}
+
+
+def make_input(n, seed=42, min=0.0, max=100.0):
+    """
+    Returns a list of `n` random floats between `min` and `max`, generated using NumPy.
+    """
+    rng = np.random.default_rng(seed)
+    return rng.uniform(min, max, n).tolist()
+
+
+def _timed_call(function, values, conn=None):
+    """
+    Call `function(values)`, repeating short calls until they take MIN_TIME,
+    and return (or send through `conn`) the result and the time per call.
+    """
+    try:
+        start = time.perf_counter()
+        result = function(values)
+        elapsed = time.perf_counter() - start
+        number = 1
+        if elapsed < MIN_TIME:
+            number = min(1000, int(MIN_TIME / max(elapsed, 1e-7)) + 1)
+            start = time.perf_counter()
+            for _ in range(number):
+                function(values)
+            elapsed = time.perf_counter() - start
+        output = ("ok", result, elapsed / number)
+    except Exception as e:
+        output = ("error", repr(e), None)
+    if conn is None:
+        return output
+    conn.send(output)
+    conn.close()
+
+
+def _run_with_timeout(function, values, timeout):
+    """
+    Returns the output of `_timed_call` computed in a forked subprocess, or
+    ("timeout", None, None) if it takes longer than `timeout` seconds.
+    Runs in the current process (without a timeout) if not on Linux.
+    """
+    if not sys.platform.startswith("linux"):
+        return _timed_call(function, values)
+    ctx = multiprocessing.get_context("fork")
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_timed_call, args=(function, values, child_conn), daemon=True)
+    process.start()
+    child_conn.close()
+    try:
+        if parent_conn.poll(timeout):
+            return parent_conn.recv()
+        return ("timeout", None, None)
+    except EOFError:
+        return ("error", "the subprocess crashed (exit code " + str(process.exitcode) + ")", None)
+    finally:
+        process.kill()
+        process.join()
+        parent_conn.close()
+
+
+def fit_exponent(sizes, times, min_time=MIN_TIME/10):
+    """
+    Returns the slope of the least-squares line through the points
+    (log(size), log(time)), using only the times above `min_time`, or nan if
+    there are fewer than two such points.
+    """
+    points = [(n, t) for n, t in zip(sizes, times) if t is not None and t > min_time]
+    if len(points) < 2:
+        return float("nan")
+    logn, logt = np.log([n for n, _ in points]), np.log([t for _, t in points])
+    return float(np.polyfit(logn, logt, 1)[0])
+
+
+def stress_test(function, reference, sizes=DEFAULT_SIZES, timeout=10.0, rel_tol=1e-9,
+                max_exponent=MAX_EXPONENT, seed=42):
+    """
+    Run `function` on random lists with the given `sizes` (stopping after the
+    first timeout or error) and compare the results with `reference`.
+    Returns a dict with the `sizes` tested, the `times` per call, the relative
+    `errors`, the fitted scaling `exponent`, the `status` of each size, and
+    `passed` which is True if all the results are within `rel_tol` of the
+    reference, there were no timeouts, and the exponent is below `max_exponent`.
+    """
+    report = {"sizes": [], "times": [], "errors": [], "status": []}
+    for n in sizes:
+        values = make_input(n, seed=seed)
+        status, result, elapsed = _run_with_timeout(function, values, timeout)
+        report["sizes"].append(n)
+        report["times"].append(elapsed)
+        report["status"].append(status if status != "error" else "error: " + result)
+        if status != "ok":
+            report["errors"].append(None)
+            break
+        expected = reference(values)
+        try:
+            error = abs(result - expected) / max(abs(expected), 1e-300)
+        except TypeError:
+            error = float("inf")   # the function didn't return a number
+        report["errors"].append(error)
+    report["exponent"] = fit_exponent(report["sizes"], report["times"])
+    report["passed"] = (all(status == "ok" for status in report["status"])
+                        and all(error <= rel_tol for error in report["errors"])
+                        and not report["exponent"] > max_exponent)
+    return report
+
+
+def print_report(report):
+    """
+    Print the table of sizes, times, and errors of a `stress_test` report.
+    """
+    print(f"{'size':>10} {'time (s)':>12} {'rel. error':>12}  status")
+    for n, t, error, status in zip(report["sizes"], report["times"], report["errors"], report["status"]):
+        t_str = f"{t:12.6f}" if t is not None else " "*12
+        error_str = f"{error:12.2e}" if error is not None else " "*12
+        print(f"{n:>10} {t_str} {error_str}  {status}")
+    print(f"scaling exponent: {report['exponent']:.2f}", "  PASSED" if report["passed"] else "  FAILED")
+
+
+def check_scaling(function, reference, sizes=(10**3, 10**4, 10**5), timeout=2.0):
+    """
+    Check that `function` agrees with `reference` (a function, or "mean" or
+    "std" for the REFERENCES) on lists up to 10**5 values and runs in (close
+    to) linear time. Not part of `test_mean` and `test_std`, call it explicitly.
+    """
+    if isinstance(reference, str):
+        reference = REFERENCES[reference]
+    report = stress_test(function, reference, sizes=sizes, timeout=timeout, rel_tol=1e-6)
+    for n, status, error in zip(report["sizes"], report["status"], report["errors"]):
+        assert status == "ok", f"Call on a list of {n} values failed: {status}"
+        assert error <= 1e-6, f"Wrong result for a list of {n} values"
+    assert not report["exponent"] > MAX_EXPONENT, \
+        f"The function is too slow: its running time grows like n^{report['exponent']:.1f}"
+
+
+def grade(functions, reference, sizes=DEFAULT_SIZES, timeout=10.0, **kwargs):
+    """
+    Run `stress_test` for each function in the dict `functions` {name: function}
+    and return a list of rows with the name, largest size, time at that size,
+    scaling exponent, maximum relative error, and whether the function passed
+    (slow solutions have passed=False).
+    """
+    rows = []
+    for name, function in functions.items():
+        report = stress_test(function, reference, sizes=sizes, timeout=timeout, **kwargs)
+        errors = [error for error in report["errors"] if error is not None]
+        rows.append({"name": name, "max_size": report["sizes"][-1], "time": report["times"][-1],
+                     "exponent": report["exponent"], "max_error": max(errors) if errors else None,
+                     "status": report["status"][-1], "passed": report["passed"]})
+    return rows
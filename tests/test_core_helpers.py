@@ -0,0 +1,73 @@
+"""
+Tests for the helper functions in `notebooks/core_helpers.py`.
+Run with `python -m pytest tests`.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+from scipy.stats import norm, rv_continuous
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks"))
+import core_helpers as ch
+
+
+@pytest.fixture(autouse=True)
+def empty_rv_cache():
+    ch.rv_cache_clear()
+    yield
+    ch.rv_cache_clear()
+
+
+def test_rv_eval_hits_and_misses():
+    xs = np.linspace(-3, 3, 101)
+    first = ch.rv_eval(norm(0, 1), "pdf", xs)
+    second = ch.rv_eval(norm(0, 1), "pdf", xs.copy())    # equal rv and values
+    assert np.array_equal(first, norm(0, 1).pdf(xs))
+    assert second is first
+    assert not first.flags.writeable
+    ch.rv_eval(norm(0, 2), "pdf", xs)
+    ch.rv_eval(norm(0, 1), "cdf", xs)
+    info = ch.rv_cache_info()
+    assert (info.hits, info.misses, info.entries) == (1, 3, 3)
+    assert info.nbytes == 3 * xs.nbytes
+
+
+def test_rv_cache_clear():
+    ch.rv_eval(norm(), "pdf", np.linspace(0, 1, 11))
+    ch.rv_cache_clear()
+    assert ch.rv_cache_info() == (0, 0, 0, 0)
+
+
+def test_rv_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(ch, "RV_CACHE_MAX_ENTRIES", 2)
+    for loc in [0, 1, 0, 2]:
+        ch.rv_eval(norm(loc), "cdf", 0.5)
+    ch.rv_eval(norm(0), "cdf", 0.5)    # still cached
+    ch.rv_eval(norm(1), "cdf", 0.5)    # evicted by norm(2)
+    info = ch.rv_cache_info()
+    assert (info.hits, info.misses, info.entries) == (2, 4, 2)
+
+
+def test_rv_cache_disabled(monkeypatch):
+    monkeypatch.setattr(ch, "RV_CACHE_ENABLED", False)
+    ch.rv_eval(norm(), "pdf", 0.0)
+    ch.rv_eval(norm(), "pdf", 0.0)
+    assert ch.rv_cache_info() == (0, 0, 0, 0)
+
+
+def test_rv_cache_custom_distributions():
+    class linear_gen(rv_continuous):
+        def _pdf(self, x):
+            return 2 * x
+
+    class square_gen(rv_continuous):
+        def _pdf(self, x):
+            return 3 * x**2
+
+    linear, square = linear_gen(a=0, b=1), square_gen(a=0, b=1)
+    assert ch.rv_eval(linear(), "cdf", 0.5) == pytest.approx(0.25)
+    assert ch.rv_eval(square(), "cdf", 0.5) == pytest.approx(0.125)
+    assert ch.rv_eval(linear(), "cdf", 0.5) == pytest.approx(0.25)
+    assert ch.rv_cache_info().hits == 1
@@ -0,0 +1,80 @@
+"""
+Tests for the helper functions in `notebooks/data_helpers.py`.
+Run with `python -m pytest tests`.
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks"))
+import data_helpers as dh
+
+
+CSV = "name,group,score\nA,x,1.5\nB,y,2.5\nC,x,\nD,z,4.0\n"
+
+
+@pytest.fixture
+def reads(tmp_path, monkeypatch):
+    """
+    Use temporary datasets and cache folders, and count the parsed files.
+    """
+    datasets = tmp_path / "datasets"
+    datasets.mkdir()
+    (datasets / "scores.csv").write_text(CSV)
+    monkeypatch.setattr(dh, "DATASETS_DIR", str(datasets))
+    monkeypatch.setattr(dh, "DATA_CACHE_DIR", str(tmp_path / "cache"))
+    calls = []
+    read_source = dh.read_source
+    def counting_read_source(path, **read_kwargs):
+        calls.append(path)
+        return read_source(path, **read_kwargs)
+    monkeypatch.setattr(dh, "read_source", counting_read_source)
+    return calls
+
+
+def test_load_from_cache(reads):
+    first = dh.load("scores.csv", categories=["group"])
+    second = dh.load("scores.csv", categories=["group"])
+    assert len(reads) == 1
+    pd.testing.assert_frame_equal(first, second)
+    expected = pd.read_csv(os.path.join(dh.DATASETS_DIR, "scores.csv"))
+    pd.testing.assert_frame_equal(second, expected.astype({"group": "category"}))
+
+
+def test_load_rebuilds_when_source_changes(reads):
+    path = os.path.join(dh.DATASETS_DIR, "scores.csv")
+    assert dh.load("scores.csv")["score"].iloc[0] == 1.5
+    with open(path, "w") as csvfile:
+        csvfile.write(CSV.replace("1.5", "9.5"))
+    assert dh.load("scores.csv")["score"].iloc[0] == 9.5
+    assert len(reads) == 2
+    os.utime(path, ns=(0, 0))                    # same contents, new mtime
+    assert dh.load("scores.csv")["score"].iloc[0] == 9.5
+    assert len(reads) == 2
+
+
+def test_load_options_are_separate_entries(reads):
+    indexed = dh.load("scores.csv", index_col="name")
+    plain = dh.load("scores.csv")
+    assert len(reads) == 2
+    assert list(indexed.index) == ["A", "B", "C", "D"]
+    assert "name" in plain.columns
+
+
+def test_load_columns_and_chunks(reads):
+    df = dh.load("scores.csv", columns=["score"])
+    assert list(df.columns) == ["score"]
+    chunks = list(dh.load_chunks("scores.csv", chunksize=3, columns=["name"]))
+    assert [len(chunk) for chunk in chunks] == [3, 1]
+    assert list(chunks[1].index) == [3] and chunks[1]["name"].iloc[0] == "D"
+    assert len(reads) == 1
+
+
+def test_memory_maps_are_copy_on_write(reads):
+    df = dh.load("scores.csv")
+    df.loc[0, "score"] = 100.0
+    assert dh.load("scores.csv")["score"].iloc[0] == 1.5
+    pd.testing.assert_frame_equal(dh.load("scores.csv", mmap=False), dh.load("scores.csv"))
+    assert len(reads) == 1
@@ -0,0 +1,46 @@
+"""
+Tests for the cell dependency analysis in `execute_notebooks.py`.
+Run with `python -m pytest tests`.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import execute_notebooks as en
+
+
+def dependencies(*sources):
+    return en.cell_dependencies([en.analyze_cell(source) for source in sources])
+
+
+def test_independent_cells():
+    deps = dependencies("import numpy as np", "x = np.arange(3)", "y = np.ones(2)", "print(x)")
+    assert deps == [[], [0], [0], [1]]
+
+
+def test_function_calls_depend_on_globals():
+    deps = dependencies("a = 2", "def f(x):\n    return a*x", "a = 3", "f(3)")
+    assert deps[3] == [1, 2]
+
+
+def test_module_attribute_assignment_is_a_barrier():
+    deps = dependencies("import plot_helpers as ph", "ph.EXPORT_DPI = 150", "x = 1", "ph.plot_pdf(x)")
+    assert deps[1] == [0]
+    assert 1 in deps[2] and 1 in deps[3]
+
+
+def test_mutating_module_calls_are_barriers():
+    deps = dependencies("import plot_helpers as ph", "ph.set_render_backend('matplotlib')", "x = 1")
+    assert deps[2] == [1]
+    deps = dependencies("import matplotlib.pyplot as plt", "fig, ax = plt.subplots()",
+                        "ax.set_title('x')", "y = 1")
+    assert deps[3] == []     # changing the state of a figure doesn't affect other cells
+
+
+def test_pip_and_run_magics_are_barriers():
+    for magic in ["%pip install plotnine", "%run other.py"]:
+        deps = dependencies("x = 1", magic, "y = 2")
+        assert deps[1] == [0]
+        assert deps[2] == [1]
+    deps = dependencies("x = 1", "%matplotlib inline", "y = 2")
+    assert deps[2] == []
@@ -0,0 +1,99 @@
+"""
+Tests for the helper functions in `notebooks/inference_helpers.py`.
+Run with `python -m pytest tests`.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+import scipy.stats
+from scipy.stats import expon, norm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks"))
+import inference_helpers as ih
+
+
+DATA = expon().rvs(50, random_state=3)
+
+
+@pytest.mark.parametrize("method", ["percentile", "BCa"])
+def test_bootstrap_matches_scipy(method):
+    result = ih.bootstrap(DATA, "mean", n_resamples=20000, method=method, seed=1)
+    expected = scipy.stats.bootstrap((DATA,), np.mean, n_resamples=20000,
+                                     method=method, random_state=2)
+    assert result.estimate == pytest.approx(np.mean(DATA))
+    assert result.low == pytest.approx(expected.confidence_interval.low, abs=0.02)
+    assert result.high == pytest.approx(expected.confidence_interval.high, abs=0.02)
+    assert result.stderr == pytest.approx(expected.standard_error, rel=0.05)
+    assert result.distribution.shape == (20000,)
+
+
+def test_bootstrap_batches():
+    data = norm().rvs(size=(4, 30), random_state=5)
+    result = ih.bootstrap(data, "median", n_resamples=2000, seed=7)
+    assert result.low.shape == result.high.shape == (4,)
+    assert result.distribution is None
+    assert np.all(result.low <= result.estimate) and np.all(result.estimate <= result.high)
+    again = ih.bootstrap(data, "median", n_resamples=2000, seed=7)
+    assert np.array_equal(result.low, again.low) and np.array_equal(result.high, again.high)
+
+
+XS = norm(0, 1).rvs(20, random_state=1)
+YS = norm(0.5, 1).rvs(25, random_state=2)
+
+
+def _meandiff(xs, ys, axis=-1):
+    return np.mean(xs, axis=axis) - np.mean(ys, axis=axis)
+
+
+@pytest.mark.parametrize("alternative", ["two-sided", "less", "greater"])
+def test_permutation_test_matches_scipy(alternative):
+    result = ih.permutation_test(XS, YS, alternative=alternative, n_permutations=20000, seed=1)
+    expected = scipy.stats.permutation_test((XS, YS), _meandiff, alternative=alternative,
+                                            n_resamples=20000, vectorized=True, random_state=2)
+    assert result.statistic == pytest.approx(expected.statistic)
+    assert result.n_permutations == len(result.null_distribution) == 20000
+    assert result.pvalue == pytest.approx(expected.pvalue, abs=4*result.stderr)
+
+
+def test_permutation_test_stops_early():
+    ys = norm(2, 1).rvs(25, random_state=2)
+    kwargs = dict(n_permutations=100000, batchsize=500, seed=3, alpha=0.05)
+    result = ih.permutation_test(XS, ys, **kwargs)
+    assert result.n_permutations < 100000
+    assert result.pvalue < 0.05
+    parallel = ih.permutation_test(XS, ys, workers=2, **kwargs)
+    assert parallel.n_permutations == result.n_permutations
+    assert np.array_equal(parallel.null_distribution, result.null_distribution)
+
+
+def test_permutation_test_workers():
+    result = ih.permutation_test(XS, YS, n_permutations=3000, batchsize=500, seed=3)
+    parallel = ih.permutation_test(XS, YS, n_permutations=3000, batchsize=500, seed=3, workers=2)
+    assert parallel.pvalue == result.pvalue
+    assert np.array_equal(parallel.null_distribution, result.null_distribution)
+
+
+@pytest.mark.parametrize("equal_var", [True, False])
+@pytest.mark.parametrize("alternative", ["two-sided", "less", "greater"])
+def test_ttest_ind_batch_matches_scipy(equal_var, alternative):
+    xs = norm(0, 1).rvs(size=(50, 12), random_state=4)
+    ys = norm(0.3, 2).rvs(size=(50, 20), random_state=5)
+    result = ih.ttest_ind_batch(xs, ys, equal_var=equal_var, alternative=alternative)
+    expected = scipy.stats.ttest_ind(xs, ys, axis=-1, equal_var=equal_var, alternative=alternative)
+    assert result.statistic.shape == (50,)
+    assert np.allclose(result.statistic, expected.statistic)
+    assert np.allclose(result.pvalue, expected.pvalue)
+
+
+def test_ttest_ind_batch_confidence_interval():
+    xs = norm(0, 1).rvs(size=(3, 12), random_state=4)
+    ys = norm(0.3, 2).rvs(size=(3, 20), random_state=5)
+    result = ih.ttest_ind_batch(xs, ys, equal_var=False, confidence_level=0.9)
+    for i in range(3):
+        expected = scipy.stats.ttest_ind(xs[i], ys[i], equal_var=False)
+        ci = expected.confidence_interval(confidence_level=0.9)
+        assert result.low[i] == pytest.approx(ci.low)
+        assert result.high[i] == pytest.approx(ci.high)
+        assert result.df[i] == pytest.approx(expected.df)
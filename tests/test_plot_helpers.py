@@ -0,0 +1,109 @@
+"""
+Tests for the helper functions in `notebooks/plot_helpers.py`.
+Run with `python -m pytest tests`.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+from scipy.stats import cauchy, expon, gamma, norm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks"))
+import plot_helpers as ph
+
+
+MOMENTS = [lambda x: np.ones_like(x), lambda x: x, lambda x: x**2]
+
+
+@pytest.mark.parametrize("rv, expected", [
+    (norm(), [1, 0, 1]),             # frozen without arguments
+    (norm(3, 2), [1, 3, 13]),
+    (expon(), [1, 1, 2]),
+    (gamma(3), [1, 3, 12]),
+])
+def test_expect_moments(rv, expected):
+    result = ph.expect(rv, MOMENTS)
+    assert result.value.shape == (3,)
+    assert np.allclose(result.value, expected, atol=1e-12)
+    assert np.all(result.error < 1e-10)
+
+
+def test_expect_cauchy_without_arguments():
+    result = ph.expect(cauchy(), lambda x: x)
+    assert result.value.shape == ()
+    assert result.error > 0.1       # the mean doesn't exist
+
+
+def test_moments_table_without_scale():
+    table = ph.moments_table(norm, {"loc": [0.0, 1.0]})
+    assert np.allclose(table["mean"], [0, 1])
+    assert np.allclose(table["var"], [1, 1])
+    assert np.allclose(table["kurtosis"], [0, 0], atol=1e-9)
+
+
+def test_figure_cache_returns_figures(tmp_path, monkeypatch):
+    monkeypatch.setattr(ph, "FIGURE_CACHE_ENABLED", True)
+    monkeypatch.setattr(ph, "FIGURE_CACHE_DIR", str(tmp_path / "cache"))
+    data = norm().rvs(200, random_state=1)
+    filename = str(tmp_path / "out" / "qq")
+    first = ph.qq_plot(data, norm(), filename=filename)
+    (tmp_path / "out" / "qq.png").unlink()
+    second = ph.qq_plot(data, norm(), filename=filename)
+    assert isinstance(first, ph.plt.Axes)
+    assert isinstance(second, ph.plt.Axes)
+    assert second.figure is not first.figure
+    assert len(second.images) == 1          # the stored image
+    assert (tmp_path / "out" / "qq.png").exists()
+    ph.plt.close("all")
+
+
+def test_figure_cache_stores_arrays(tmp_path, monkeypatch):
+    monkeypatch.setattr(ph, "FIGURE_CACHE_ENABLED", True)
+    monkeypatch.setattr(ph, "FIGURE_CACHE_DIR", str(tmp_path / "cache"))
+    kwargs = dict(xlims=[0, 2], N=100, seed=42, filename=str(tmp_path / "dists"), formats=["pdf"])
+    first = ph.plot_sampling_dists_panel(expon(), **kwargs)
+    second = ph.plot_sampling_dists_panel(expon(), **kwargs)
+    assert len(first) == len(second) == 3
+    for xbars1, xbars2 in zip(first, second):
+        assert np.array_equal(xbars1, xbars2)
+    ph.plt.close("all")
+
+
+def test_wait_for_exports_reports_all_errors(tmp_path, monkeypatch):
+    write_files = ph._write_files
+    calls = []
+    def failing_first_write(contents):
+        calls.append(contents)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        return write_files(contents)
+    monkeypatch.setattr(ph, "_write_files", failing_first_write)
+    fig, ax = ph.plt.subplots()
+    filename = str(tmp_path / "fig")
+    ph.export_figure(fig, filename, formats=["png"], background=True)
+    ph.export_figure(fig, filename, formats=["png"], background=True)
+    with pytest.raises(RuntimeError, match="disk full"):
+        ph.wait_for_exports()
+    assert len(calls) == 2
+    assert (tmp_path / "fig.png").exists()    # the second export was still written
+    assert ph.wait_for_exports() == []
+    ph.plt.close("all")
+
+
+@pytest.mark.parametrize("max_points", [2, 3, 10, 101, 1000])
+def test_thin_indices_bound(max_points):
+    xs = np.sort(norm().rvs(5000, random_state=1))
+    idx = ph._thin_indices(xs, max_points)
+    assert 2 <= len(idx) <= max_points
+    assert idx[0] == 0 and idx[-1] == len(xs) - 1
+
+
+def test_qq_plot_returns_points():
+    data = norm().rvs(5000, random_state=1)
+    ax, xs, ys = ph.qq_plot(data, norm(), max_points=100, return_points=True)
+    all_xs, all_ys = ph.calc_qq_points(data, norm())
+    assert len(xs) == len(ys) <= 100
+    assert np.isin(ys, all_ys).all() and ys[0] == all_ys[0] and ys[-1] == all_ys[-1]
+    assert np.allclose(ax.collections[0].get_offsets(), np.column_stack([xs, ys]))
+    ph.plt.close("all")
@@ -0,0 +1,28 @@
+"""
+Tests for the helper functions in `notebooks/prob_helpers.py`.
+Run with `python -m pytest tests`.
+"""
+import os
+import sys
+
+import numpy as np
+from scipy.stats import norm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks"))
+import prob_helpers
+
+
+class PdfOnly:
+    def pdf(self, x):
+        return norm.pdf(x)
+
+
+def test_calc_probs_with_cdf_pdf_or_density():
+    expected = norm.cdf(1) - norm.cdf(-1)
+    for rv in [norm(), PdfOnly(), norm.pdf, lambda x: np.exp(-x**2/2) / np.sqrt(2*np.pi)]:
+        assert np.allclose(prob_helpers.calc_probs(rv, -1, 1), expected)
+
+
+def test_calc_tail_probs_with_density():
+    tails = prob_helpers.calc_tail_probs(lambda x: 2*x if 0 <= x <= 1 else 0.0, [0.25], [0.75])
+    assert np.allclose(tails, [0.0625 + 0.4375])
@@ -0,0 +1,106 @@
+"""
+Tests for the helper functions in `notebooks/sampling_helpers.py`.
+Run with `python -m pytest tests`.
+"""
+import os
+import pickle
+import sys
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+from scipy.stats import kstest, norm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks"))
+import sampling_helpers as sh
+
+
+QS = np.linspace(0.01, 0.99, 99)
+
+
+def test_tabulated_sampler_from_rv():
+    sampler = sh.TabulatedSampler.from_rv(norm())
+    xs = np.linspace(-4, 4, 101)
+    assert sampler.error_bound < 1e-6
+    assert np.allclose(sampler.cdf(xs), norm.cdf(xs), atol=sampler.error_bound)
+    assert np.allclose(sampler.ppf(QS), norm.ppf(QS), atol=1e-6)
+    assert sampler.mean() == pytest.approx(0, abs=1e-9)
+    assert sampler.var() == pytest.approx(1, abs=1e-6)
+    values = sampler.rvs(10000, random_state=1)
+    assert np.array_equal(values, sampler.rvs(10000, random_state=1))
+    assert kstest(values, norm.cdf).pvalue > 0.01
+
+
+def test_tabulated_sampler_pdf_function():
+    sampler = sh.TabulatedSampler(lambda x: x*(1-x), [0, 1], num=2**10+1)   # unnormalized
+    assert sampler.mass == pytest.approx(1/6)
+    assert np.allclose(sampler.cdf(QS), 3*QS**2 - 2*QS**3, atol=10*sampler.error_bound)
+    result, ax = sampler.validate(n=500, seed=1)
+    assert result.pvalue > 0.01
+    plt.close(ax.figure)
+    assert pickle.loads(pickle.dumps(sampler))._pdf is None
+
+
+def test_tabulated_sampler_without_mass():
+    with pytest.raises(ValueError, match="no probability mass"):
+        sh.TabulatedSampler(lambda x: 0*x, [0, 1])
+
+
+def test_sampleset_statistics():
+    values = norm().rvs(size=(30, 50), random_state=2)
+    samples = sh.SampleSet(values)
+    assert samples.shape == (30, 50) and len(samples) == 50
+    assert np.allclose(samples.mean(), values.mean(axis=0))
+    assert np.allclose(samples.var(ddof=1), values.var(axis=0, ddof=1))
+    assert np.allclose(samples.quantile([0.1, 0.9]), np.quantile(values, [0.1, 0.9], axis=0))
+    assert np.allclose(samples.apply(np.median), np.median(values, axis=0))
+    assert np.array_equal(samples["sample3"], values[:, 3])
+
+
+def test_sampleset_float32_means():
+    values = np.full((1000, 3), 0.1, dtype=np.float32)
+    samples = sh.SampleSet(values)
+    assert samples.nbytes == values.nbytes
+    assert np.allclose(samples.mean(), 0.1, rtol=1e-7)    # accumulated in float64
+
+
+def test_sampleset_to_dataframe_shares_memory():
+    samples = sh.SampleSet(np.zeros((10, 4)))
+    df = samples.to_dataframe()
+    assert list(df.columns) == samples.names
+    assert np.shares_memory(df.to_numpy(), samples.values)
+
+
+def test_sampleset_spill_and_load(tmp_path):
+    values = norm().rvs(size=(20, 5), random_state=3)
+    path = str(tmp_path / "samples.npy")
+    samples = sh.SampleSet(values.copy()).spill(path)
+    assert isinstance(samples.values, np.memmap)
+    loaded = sh.SampleSet.load(path)
+    assert np.array_equal(np.asarray(loaded), values)
+    assert np.allclose(loaded.mean(), values.mean(axis=0))
+
+
+def test_gen_samples_as_sampleset():
+    samples = sh.gen_samples(norm(), n=10, N=7, seed=1, as_sampleset=True)
+    df = sh.gen_samples(norm(), n=10, N=7, seed=1)
+    assert isinstance(samples, sh.SampleSet) and samples.shape == (10, 7)
+    assert np.array_equal(df.to_numpy(), samples.values)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_gen_sampling_dist_same_seed_any_workers(workers):
+    kwargs = dict(n=20, N=5000, chunksize=700, seed=42)
+    expected = sh.gen_sampling_dist(norm(), np.median, **kwargs)
+    stats = sh.gen_sampling_dist(norm(), np.median, workers=workers, **kwargs)
+    assert stats.shape == (5000,)
+    assert np.array_equal(stats, expected)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_gen_samples_same_seed_any_workers(workers):
+    kwargs = dict(n=15, N=300, chunksize=70, seed=7, as_sampleset=True)
+    expected = sh.gen_samples(norm(), **kwargs)
+    samples = sh.gen_samples(norm(), workers=workers, **kwargs)
+    assert np.array_equal(samples.values, expected.values)
+    assert not np.array_equal(samples.values, sh.gen_samples(norm(), **dict(kwargs, seed=8)).values)
@@ -0,0 +1,49 @@
+"""
+Tests for the scaling checks in `notebooks/test_helpers.py`.
+Run with `python -m pytest tests`.
+"""
+import os
+import statistics
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks"))
+import test_helpers as th
+
+
+SIZES = (300, 600, 1200, 2400)
+
+
+def quadratic_mean(values):
+    total = 0.0
+    for i in range(len(values)):
+        for j in range(len(values)):
+            if i == j:
+                total += values[j]
+    return total / len(values)
+
+
+def test_quick_checks_pass():
+    th.test_mean(statistics.mean)
+    th.test_std(statistics.stdev)
+
+
+def test_check_scaling_accepts_linear_function():
+    th.check_scaling(lambda values: sum(values) / len(values), "mean", sizes=SIZES)
+
+
+def test_check_scaling_rejects_quadratic_function():
+    with pytest.raises(AssertionError, match="too slow"):
+        th.check_scaling(quadratic_mean, "mean", sizes=SIZES)
+
+
+def test_check_scaling_rejects_wrong_results():
+    with pytest.raises(AssertionError, match="Wrong result"):
+        th.check_scaling(lambda values: sum(values) / (len(values) + 1), "mean", sizes=SIZES)
+
+
+def test_stress_test_stops_at_timeout():
+    report = th.stress_test(quadratic_mean, th.REFERENCES["mean"], sizes=(100, 20000), timeout=0.5)
+    assert report["status"] == ["ok", "timeout"]
+    assert not report["passed"]